@@ -0,0 +1,378 @@
+"""
+Stand-in for the Xray core used by the benchmark suite.
+
+Reads the same `-c <config>` (file or `stdin:`) BabyVPN generates and opens every socks/http
+inbound as a plain forwarding proxy that connects straight to the target.
+Outbounds are ignored, so anything measured through it is BabyVPN's own overhead.
+With a `metrics` section it also counts relayed bytes and serves them on /debug/vars,
+shaped like the real core's traffic counters. A UDP dokodemo-door inbound (the DNS test
+listener) answers every A query with 127.0.0.1. SOCKS inbounds also relay UDP ASSOCIATE.
+Routing rules with an inboundTag pick which outbound tag an inbound's bytes are counted under.
+With an `api` section, `xray api adi|ado|rmi|rmo|adrules|rmrules` change the running stub
+(over a plain JSON control endpoint, not the real core's gRPC).
+"""
+import os
+import argparse
+import http.client
+import http.server
+import json
+import select
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import urllib.parse
+
+RELAY_BUFFER = 65536
+
+class Counters:
+    """Uplink/downlink byte counters per inbound and outbound tag."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {"inbound": {}, "outbound": {}}
+
+    def add(self, kind, tag, direction, n):
+        if not tag:
+            return
+        with self.lock:
+            entry = self.stats[kind].setdefault(tag, {"uplink": 0, "downlink": 0})
+            entry[direction] += n
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+COUNTERS = Counters()
+
+def relay(a, b, inbound_tag=None, outbound_tag=None):
+    """Pipes bytes between two sockets until either side closes. a is the client side."""
+    socks = [a, b]
+    try:
+        while True:
+            readable, _, errored = select.select(socks, [], socks, 60)
+            if errored or not readable:
+                return
+            for s in readable:
+                data = s.recv(RELAY_BUFFER)
+                if not data:
+                    return
+                (b if s is a else a).sendall(data)
+                direction = "uplink" if s is a else "downlink"
+                COUNTERS.add("inbound", inbound_tag, direction, len(data))
+                COUNTERS.add("outbound", outbound_tag, direction, len(data))
+    except OSError:
+        pass
+    finally:
+        for s in socks:
+            try: s.close()
+            except OSError: pass
+
+def read_headers(conn):
+    """Reads an HTTP request head; returns (head_bytes, leftover_body)."""
+    data = b""
+    while b"\r\n\r\n" not in data:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    head, _, rest = data.partition(b"\r\n\r\n")
+    return head, rest
+
+class HTTPProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        conn = self.request
+        head, rest = read_headers(conn)
+        if not head:
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+
+        try:
+            if method == "CONNECT":
+                host, _, port = target.rpartition(":")
+                upstream = socket.create_connection((host, int(port)), timeout=10)
+                conn.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+                if rest:
+                    upstream.sendall(rest)
+            else:
+                url = urllib.parse.urlsplit(target)
+                upstream = socket.create_connection((url.hostname, url.port or 80), timeout=10)
+                path = url.path or "/"
+                if url.query:
+                    path += "?" + url.query
+                headers = [l for l in lines[1:] if not l.lower().startswith(("proxy-connection:", "connection:"))]
+                request = [f"{method} {path} {version}"] + headers + ["Connection: close", "", ""]
+                rest = "\r\n".join(request).encode("latin-1") + rest
+                upstream.sendall(rest)
+        except OSError:
+            conn.sendall(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            return
+        upstream.settimeout(None)
+        COUNTERS.add("inbound", self.server.tag, "uplink", len(rest))
+        COUNTERS.add("outbound", self.server.outbound_tag, "uplink", len(rest))
+        relay(conn, upstream, self.server.tag, self.server.outbound_tag)
+
+class SocksProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        conn = self.request
+        # Greeting: VER, NMETHODS, METHODS -> choose "no auth"
+        ver, nmethods = conn.recv(2)
+        conn.recv(nmethods)
+        conn.sendall(b"\x05\x00")
+
+        ver, cmd, _, atyp = conn.recv(4)
+        host = self._read_address(conn, atyp)
+        port = struct.unpack("!H", conn.recv(2))[0]
+
+        if cmd == 3:
+            self._udp_associate(conn)
+            return
+        if cmd != 1:  # Only CONNECT and UDP ASSOCIATE are supported
+            conn.sendall(b"\x05\x07\x00\x01" + b"\x00" * 6)
+            return
+        try:
+            upstream = socket.create_connection((host, port), timeout=10)
+        except OSError:
+            conn.sendall(b"\x05\x05\x00\x01" + b"\x00" * 6)
+            return
+        conn.sendall(b"\x05\x00\x00\x01" + socket.inet_aton("0.0.0.0") + struct.pack("!H", 0))
+        upstream.settimeout(None)
+        relay(conn, upstream, self.server.tag, self.server.outbound_tag)
+
+    def _udp_associate(self, conn):
+        """Relays datagrams between the client and any target until the control connection closes."""
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.bind(("127.0.0.1", 0))
+        conn.sendall(b"\x05\x00\x00\x01" + socket.inet_aton("127.0.0.1") + struct.pack("!H", udp.getsockname()[1]))
+        client = None
+        try:
+            while True:
+                readable, _, _ = select.select([conn, udp], [], [], 60)
+                if not readable or conn in readable and not conn.recv(1):
+                    return
+                if udp not in readable:
+                    continue
+                data, addr = udp.recvfrom(65536)
+                if client is None or addr == client:
+                    client = addr
+                    atyp = data[3]
+                    if atyp == 1:
+                        host, offset = socket.inet_ntoa(data[4:8]), 8
+                    elif atyp == 3:
+                        host, offset = data[5:5 + data[4]].decode(), 5 + data[4]
+                    else:
+                        host, offset = socket.inet_ntop(socket.AF_INET6, data[4:20]), 20
+                    port = struct.unpack("!H", data[offset:offset + 2])[0]
+                    payload = data[offset + 2:]
+                    udp.sendto(payload, (host, port))
+                    COUNTERS.add("inbound", self.server.tag, "uplink", len(payload))
+                    COUNTERS.add("outbound", self.server.outbound_tag, "uplink", len(payload))
+                else:
+                    header = b"\x00\x00\x00\x01" + socket.inet_aton(addr[0]) + struct.pack("!H", addr[1])
+                    udp.sendto(header + data, client)
+                    COUNTERS.add("inbound", self.server.tag, "downlink", len(data))
+                    COUNTERS.add("outbound", self.server.outbound_tag, "downlink", len(data))
+        except OSError:
+            pass
+        finally:
+            udp.close()
+
+    @staticmethod
+    def _read_address(conn, atyp):
+        if atyp == 1:
+            return socket.inet_ntoa(conn.recv(4))
+        if atyp == 3:
+            length = conn.recv(1)[0]
+            return conn.recv(length).decode()
+        return socket.inet_ntop(socket.AF_INET6, conn.recv(16))
+
+# inbound tag -> outbound tag, from routing rules; anything else goes to the first outbound
+ROUTES = {}
+DEFAULT_OUTBOUND = [None]
+
+class ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    tag = None
+
+    @property
+    def outbound_tag(self):
+        return ROUTES.get(self.tag, DEFAULT_OUTBOUND[0])
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/debug/vars":
+            self.send_error(404)
+            return
+        body = json.dumps({"stats": COUNTERS.snapshot()}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    protocol_version = "HTTP/1.1"
+
+class DNSStubHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        if len(data) < 12:
+            return
+        question = data[12:]
+        # Same id and question, QR + RD + RA, one answer pointing back at the question name
+        header = data[:2] + struct.pack("!HHHHH", 0x8180, 1, 1, 0, 0)
+        answer = struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton("127.0.0.1")
+        sock.sendto(header + question + answer, self.client_address)
+
+class ThreadingUDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+HANDLERS = {"http": HTTPProxyHandler, "socks": SocksProxyHandler}
+
+def load_config(path):
+    if path == "stdin:":
+        return json.load(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def open_inbound(inbound):
+    """Starts the server for one inbound, or returns None for unsupported ones."""
+    if inbound.get("protocol") == "dokodemo-door" and inbound.get("settings", {}).get("network") == "udp":
+        server = ThreadingUDPServer((inbound.get("listen", "127.0.0.1"), inbound["port"]), DNSStubHandler)
+    elif inbound.get("protocol") in HANDLERS:
+        server = ThreadingServer((inbound.get("listen", "127.0.0.1"), inbound["port"]), HANDLERS[inbound["protocol"]])
+    else:
+        return None
+    server.tag = inbound.get("tag")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_rules(rules):
+    for rule in rules:
+        for tag in rule.get("inboundTag", []):
+            ROUTES[tag] = rule.get("outboundTag")
+
+def serve(config):
+    """Starts one forwarding server per supported inbound; returns the servers."""
+    servers = []
+    # Unrouted inbounds count against the first outbound, the server outbound in BabyVPN configs
+    DEFAULT_OUTBOUND[0] = (config.get("outbounds") or [{}])[0].get("tag")
+    add_rules(config.get("routing", {}).get("rules", []))
+    for inbound in config.get("inbounds", []):
+        server = open_inbound(inbound)
+        if server:
+            servers.append(server)
+
+    for section, handler in (("metrics", MetricsHandler), ("api", APIHandler)):
+        listen = (config.get(section) or {}).get("listen")
+        if listen:
+            host, _, port = listen.rpartition(":")
+            server = MetricsServer((host or "127.0.0.1", int(port)), handler)
+            server.inbounds = servers
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+    return servers
+
+class APIHandler(http.server.BaseHTTPRequestHandler):
+    """Applies one `xray api` command: {"command", "configs": [parsed files], "args": [...]}."""
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        servers = self.server.inbounds
+        configs, args = request.get("configs", []), request.get("args", [])
+        status = 200
+        try:
+            command = request["command"]
+            if command == "adi":
+                for config in configs:
+                    for inbound in config.get("inbounds", []):
+                        server = open_inbound(inbound)
+                        if server:
+                            servers.append(server)
+            elif command == "rmi":
+                tags = args + [i.get("tag") for c in configs for i in c.get("inbounds", [])]
+                for server in [s for s in servers if getattr(s, "tag", None) in tags]:
+                    servers.remove(server)
+                    server.shutdown()
+                    server.server_close()
+            elif command == "adrules":
+                for config in configs:
+                    add_rules(config.get("routing", {}).get("rules", []))
+            elif command == "rmrules":
+                for tag in [t for t, out in ROUTES.items() if out in args]:
+                    del ROUTES[tag]
+            elif command not in ("ado", "rmo"):  # Outbounds only name where bytes are counted
+                raise ValueError(f"unknown command {command}")
+            body = b"ok"
+        except (OSError, ValueError, KeyError) as e:
+            status, body = 500, str(e).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def api(argv):
+    """`xray api <command> --server=host:port [flags] [files or tags]`, sent to the stub's control endpoint."""
+    command, server, configs, args = argv[0], "127.0.0.1:8080", [], []
+    for arg in argv[1:]:
+        if arg.startswith("--server="):
+            server = arg.split("=", 1)[1]
+        elif arg.startswith("-"):
+            continue
+        elif arg.endswith(".json") and os.path.exists(arg):
+            configs.append(load_config(arg))
+        else:
+            args.append(arg)
+    body = json.dumps({"command": command, "configs": configs, "args": args}).encode()
+    host, _, port = server.rpartition(":")
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        conn.request("POST", "/api", body, {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        output = resp.read().decode()
+    except OSError as e:
+        print(f"failed to call service: {e}", file=sys.stderr)
+        return 1
+    print(output, file=sys.stdout if resp.status == 200 else sys.stderr)
+    return 0 if resp.status == 200 else 1
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["api"]:
+        return api(argv[1:])
+    parser = argparse.ArgumentParser(prog="xray")
+    parser.add_argument("-c", "--config")
+    parser.add_argument("-version", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.version:
+        print("Xray 0.0.0 (BabyVPN benchmark stub)")
+        return 0
+
+    servers = serve(load_config(args.config))
+    print(f"[Warning] core: fake Xray started with {len(servers)} inbounds", flush=True)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Shared fixtures for the benchmark suite: local 204 server, stub core and sample links."""
+import base64
+import http.server
+import json
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+# --- Local generate_204 endpoint ---
+
+class NoContentHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/generate_204"):
+            self.send_response(204)
+        else:
+            self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class NoContentServer:
+    """A tiny threaded HTTP server answering /generate_204 on localhost."""
+    def __init__(self, port=0):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), NoContentHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/generate_204"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# --- Stub Xray core ---
+
+def install_fake_xray(directory):
+    """Writes an executable `xray` wrapper around fake_xray.py and returns its path."""
+    path = os.path.join(directory, "xray")
+    # Interpreter shebang rather than a shell exec, so the process exe is stable from the start
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\nimport sys\nsys.path.insert(0, {BENCH_DIR!r})\n"
+                "import fake_xray\nsys.exit(fake_xray.main())\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+class Workspace:
+    """Temporary working directory with the stub core installed; restores cwd on exit."""
+    def __enter__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="babyvpn-bench-")
+        self.path = self._tmp.name
+        self.xray_path = install_fake_xray(self.path)
+        self._old_cwd = os.getcwd()
+        os.chdir(self.path)
+        return self
+
+    def __exit__(self, *exc):
+        os.chdir(self._old_cwd)
+        self._tmp.cleanup()
+
+# --- Sample links ---
+
+def sample_links(n):
+    """Returns n share links cycling through the protocols and transports BabyVPN parses."""
+    links = []
+    transports = ["tcp", "ws", "grpc", "xhttp", "httpupgrade", "kcp", "h2"]
+    for i in range(n):
+        net = transports[i % len(transports)]
+        host = f"s{i}.example.com"
+        kind = i % 3
+        if kind == 0:
+            data = {
+                "v": "2", "ps": f"vmess-{i}", "add": host, "port": "443",
+                "id": "b81bb6e4-e340-4344-a9c5-2a8fb706b062", "aid": "0",
+                "net": net, "tls": "tls", "host": host, "path": "/ws", "sni": host,
+            }
+            links.append("vmess://" + base64.b64encode(json.dumps(data).encode()).decode())
+        else:
+            scheme = "vless" if kind == 1 else "trojan"
+            user = "b81bb6e4-e340-4344-a9c5-2a8fb706b062" if kind == 1 else "secret"
+            query = urllib.parse.urlencode({
+                "type": net, "security": "tls", "sni": host, "host": host,
+                "path": "/?ed=2048", "fp": "chrome", "serviceName": "grpc", "mode": "auto",
+            })
+            links.append(f"{scheme}://{user}@{host}:443?{query}#{scheme}-{i}")
+    return links
+
+def timed(fn, *args, **kwargs):
+    """Runs fn once and returns (result, seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
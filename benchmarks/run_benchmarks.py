@@ -0,0 +1,292 @@
+"""
+BabyVPN benchmark suite.
+
+Measures BabyVPN's own overhead against a stub Xray core and a local /generate_204
+server, so it runs on a plain Linux box without network access or a real core:
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 10,100 --compare benchmarks/results/old.json
+
+Results are written as JSON for regression comparison.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from harness import NoContentServer, Workspace, sample_links, timed
+
+from utils import parse_vmess, parse_vless, parse_trojan, generate_xray_config, generate_multi_config, clear_config_caches, PERFORMANCE_PROFILES, DEFAULT_PROFILE
+import pinger
+import metrics
+from server_index import ServerIndex
+from routing import compile_bypass
+
+# Outbounds per core config in the multi-server assembly benchmark
+ASSEMBLY_SIZES = (1, 100, 1000)
+FRAME_BUDGET_MS = 16  # One 60 Hz frame per keystroke
+# Typed one character at a time, then refined with facets (as a user would)
+SEARCH_SESSIONS = ["vless-12", "example s1", "trojan proto:trojan net:ws", "vmess sec:tls ms:<500", "is:fail net:grpc"]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PARSERS = {"vmess": parse_vmess, "vless": parse_vless, "trojan": parse_trojan}
+
+# --- Individual benchmarks ---
+
+def bench_parse(links, rounds=5):
+    results = {}
+    for scheme, parser in PARSERS.items():
+        subset = [l for l in links if l.startswith(scheme + "://")]
+        best = min(timed(lambda: [parser(l) for l in subset])[1] for _ in range(rounds))
+        results[f"parse.{scheme}"] = {"count": len(subset), "seconds": best, "ops_per_sec": len(subset) / best}
+    return results
+
+def bench_config_generation(outbounds, rounds=5):
+    """
+    Cold: fresh outbound dicts and empty template caches every round, like the first connect.
+    Warm: the same dicts again, as when reconnecting or pinging a server twice.
+    """
+    results = {}
+    for profile in PERFORMANCE_PROFILES:
+        key = "config.generate" if profile == DEFAULT_PROFILE else f"config.generate.{profile}"
+        generate = lambda samples: [generate_xray_config(o, profile=profile) for o in samples]
+        cold = []
+        for _ in range(rounds):
+            samples = [copy.deepcopy(o) for o in outbounds]
+            clear_config_caches()
+            cold.append(timed(generate, samples)[1])
+        warm = min(timed(generate, samples)[1] for _ in range(rounds))
+        results[key] = {"count": len(samples), "seconds": min(cold), "ops_per_sec": len(samples) / min(cold),
+                        "warm_seconds": warm, "warm_ops_per_sec": len(samples) / warm}
+    return results
+
+def bench_config_assembly(outbounds, sizes=ASSEMBLY_SIZES, rounds=5):
+    """One core config carrying N outbounds: first build (every template serialized) vs cached."""
+    bypass = compile_bypass()
+    results = {}
+    for n in sizes:
+        # Fresh copies and empty caches, so the first assembly pays for every template
+        stored = [copy.deepcopy(outbounds[i % len(outbounds)]) for i in range(n)]
+        clear_config_caches()
+        sessions = [
+            {"tag": f"s{i}", "outbound": o, "socks_port": 30000 + 2 * i, "http_port": 30001 + 2 * i, "mux": i % 2 == 0}
+            for i, o in enumerate(stored)
+        ]
+        config, cold = timed(generate_multi_config, sessions, stats_port=10813, bypass=bypass)
+        best = min(timed(generate_multi_config, sessions, stats_port=10813, bypass=bypass)[1] for _ in range(rounds))
+        results[f"config.assemble.n{n}"] = {"outbounds": n, "seconds": best, "cold_s": cold, "bytes": len(config)}
+    return results
+
+def bench_single_ping(outbound, ws, url, repeats=3):
+    walls = []
+    latencies = []
+    for i in range(repeats):
+        # Fresh ports per round so the previous core's teardown isn't measured
+        latency, wall = timed(pinger.ping_outbound, outbound, i, url, xray_path=ws.xray_path)
+        walls.append(wall)
+        latencies.append(latency)
+    return {"ping.single": {
+        "wall_s_median": statistics.median(walls),
+        "probe_ms": latencies,
+        "failures": latencies.count("Fail"),
+    }}
+
+def bench_ping_all(outbounds, ws, url, n):
+    """Streams a full sweep through pinger.PingBatch, exactly as BabyVPNApp._ping_all_logic does."""
+    targets = [outbounds[i % len(outbounds)] for i in range(n)]
+    start = time.perf_counter()
+    first = None
+    results = []
+    for _, latency in pinger.PingBatch(targets, test_url=url, xray_path=ws.xray_path):
+        if first is None:
+            first = time.perf_counter() - start
+        results.append(latency)
+    wall = time.perf_counter() - start
+    return {f"ping_all.n{n}": {
+        "wall_s": wall,
+        "first_result_s": first,
+        "per_server_s": wall / n,
+        "failures": results.count("Fail"),
+    }}
+
+def bench_ui_refresh(links, sizes):
+    """Times BabyVPNApp.refresh_list with N cards; needs a display (e.g. Xvfb)."""
+    try:
+        import main
+        app = main.BabyVPNApp()
+        app.withdraw()
+    except Exception as e:
+        return {"ui.refresh": {"skipped": str(e)}}
+
+    results = {}
+    try:
+        for n in sizes:
+            configs = []
+            for i in range(n):
+                link = links[i % len(links)]
+                outbound, alias = PARSERS[link.split("://")[0]](link)
+                configs.append({'alias': alias, 'link': link, 'outbound': outbound, 'last_ping': i})
+            app.configs = configs
+            app.selected_index = 0
+            _, wall = timed(app.refresh_list)
+            app.update()
+            results[f"ui.refresh.n{n}"] = {"seconds": wall, "per_card_ms": wall * 1000 / n}
+    finally:
+        app.destroy()
+    return results
+
+def search_configs(links, n):
+    parsed = [PARSERS[l.split("://")[0]](l) for l in links]
+    configs = []
+    for i in range(n):
+        outbound, alias = parsed[i % len(parsed)]
+        # Spread of fast / slow / failed / untested, deterministic across runs
+        ping = (i * 37) % 3000 if i % 5 else ("Fail" if i % 10 else None)
+        configs.append({'alias': f"{alias} {i}", 'outbound': outbound, 'last_ping': ping})
+    return configs
+
+def bench_search(links, n):
+    """Index build time and per-keystroke search + ordering latency over N servers."""
+    configs = search_configs(links, n)
+    index, build = timed(ServerIndex, configs)
+    keystrokes = []
+    for session in SEARCH_SESSIONS:
+        for end in range(1, len(session) + 1):
+            start = time.perf_counter()
+            matches = index.search(session[:end])
+            index.ordered(matches, by_latency=True)
+            keystrokes.append((time.perf_counter() - start) * 1000)
+
+    keystrokes.sort()
+    return {f"search.n{n}": {
+        "build_s": build,
+        "keystrokes": len(keystrokes),
+        "keystroke_ms_p50": statistics.median(keystrokes),
+        "keystroke_ms_max": keystrokes[-1],
+        "within_frame_budget": keystrokes[-1] <= FRAME_BUDGET_MS,
+    }}
+
+def bench_ui_search(links, n):
+    """
+    Per-keystroke latency of the full list redraw (search, order, card diff, Tk layout)
+    over N servers, typed as in bench_search; needs a display (e.g. Xvfb).
+    """
+    try:
+        import main
+        app = main.BabyVPNApp()
+        app.withdraw()
+    except Exception as e:
+        return {f"ui.search.n{n}": {"skipped": str(e)}}
+
+    try:
+        app.configs = search_configs(links, n)
+        app._index_stale = True
+        app.sort_switch.select()
+        app.refresh_list()
+        app.update()
+        built = app.card_pool.built
+        keystrokes = []
+        for session in SEARCH_SESSIONS:
+            for end in range(len(session) + 1):
+                app.search_entry.delete(0, "end")
+                app.search_entry.insert(0, session[:end])
+                start = time.perf_counter()
+                app.render_list()
+                app.update_idletasks()
+                keystrokes.append((time.perf_counter() - start) * 1000)
+        cards = app.card_pool.built - built
+    finally:
+        app.destroy()
+
+    keystrokes.sort()
+    return {f"ui.search.n{n}": {
+        "keystrokes": len(keystrokes),
+        "keystroke_ms_p50": statistics.median(keystrokes),
+        "keystroke_ms_max": keystrokes[-1],
+        "cards_built": cards,
+        "within_frame_budget": keystrokes[-1] <= FRAME_BUDGET_MS,
+    }}
+
+# --- Reporting ---
+
+def headline(values):
+    """Picks the single number used for regression comparison (lower is better)."""
+    for key in ("wall_s", "wall_s_median", "seconds"):
+        if key in values:
+            return values[key]
+    return None
+
+def compare(current, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["benchmarks"]
+    print(f"\nComparison against {baseline_path}:")
+    for name, values in current.items():
+        new, old = headline(values), headline(baseline.get(name, {}))
+        if new is None or not old:
+            continue
+        print(f"  {name:<24} {old:>10.4f}s -> {new:>10.4f}s  ({(new / old - 1) * 100:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BabyVPN benchmark suite")
+    parser.add_argument("--sizes", default="10,100,1000", help="Ping All / UI sizes (comma separated)")
+    parser.add_argument("--links", type=int, default=3000, help="Number of sample links to parse")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--skip-ping", action="store_true", help="Skip the core-spawning benchmarks")
+    parser.add_argument("--skip-ui", action="store_true", help="Skip the Tk refresh and search benchmarks")
+    parser.add_argument("--search-size", type=int, default=10000, help="Servers in the search benchmark")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    links = sample_links(args.links)
+    outbounds = [PARSERS[l.split("://")[0]](l)[0] for l in links]
+
+    results = {}
+    results.update(bench_parse(links))
+    results.update(bench_config_generation(outbounds))
+    results.update(bench_config_assembly(outbounds))
+    results.update(bench_search(links, args.search_size))
+
+    if not args.skip_ping:
+        with Workspace() as ws, NoContentServer() as http_204:
+            results.update(bench_single_ping(outbounds[0], ws, http_204.url))
+            for n in sizes:
+                print(f"Ping All with N={n}...", flush=True)
+                results.update(bench_ping_all(outbounds, ws, http_204.url, n))
+
+    if not args.skip_ui:
+        with Workspace():
+            results.update(bench_ui_refresh(links, sizes))
+            results.update(bench_ui_search(links, args.search_size))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": sizes,
+        },
+        "benchmarks": results,
+        # Per-stage histograms collected by the instrumented hot paths during the run
+        "metrics": metrics.REGISTRY.to_dict(),
+    }
+
+    for name, values in results.items():
+        print(f"{name:<24} {json.dumps(values)}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
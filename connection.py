@@ -0,0 +1,145 @@
+import socket
+import threading
+import time
+from utils import set_system_proxy
+from metrics import timed
+
+# --- Connection States ---
+IDLE = "idle"
+STARTING = "starting"
+VERIFYING = "verifying"
+CONNECTED = "connected"
+STOPPING = "stopping"
+
+VERIFY_TIMEOUT = 5       # Seconds to wait for the core to bind its inbound
+VERIFY_INTERVAL = 0.05
+
+class ConnectionCancelled(Exception):
+    pass
+
+class ConnectionManager:
+    """
+    Runs connect/disconnect for the main core on a worker thread:
+    idle -> starting -> verifying -> connected -> stopping -> idle.
+
+    on_event(state, message) is called from the worker thread on every transition
+    (and with state=IDLE plus an error message on failure); the UI must marshal it
+    onto its own thread.
+    """
+    def __init__(self, runner, on_event, http_port=10809, set_proxy=set_system_proxy):
+        self.runner = runner
+        self.on_event = on_event
+        self.http_port = http_port
+        self.set_proxy = set_proxy
+        self.state = IDLE
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._worker = None
+
+    @property
+    def busy(self):
+        return self.state in (STARTING, VERIFYING, STOPPING)
+
+    def _transition(self, state, message=""):
+        self.state = state
+        self.on_event(state, message)
+
+    def _spawn(self, target, *args):
+        self._worker = threading.Thread(target=target, args=args, daemon=True)
+        self._worker.start()
+
+    def connect(self, config_json):
+        """Begins connecting in the background. Returns False if not idle."""
+        with self._lock:
+            if self.state != IDLE:
+                return False
+            self._cancel.clear()
+            self.state = STARTING
+        self._spawn(self._connect_worker, config_json)
+        return True
+
+    def cancel(self):
+        """Aborts an in-flight connect; the worker tears down whatever it started."""
+        if self.state in (STARTING, VERIFYING):
+            self._cancel.set()
+            return True
+        return False
+
+    def disconnect(self, on_done=None):
+        """Tears the connection down in the background. on_done runs on the worker thread."""
+        with self._lock:
+            if self.state != CONNECTED:
+                return False
+            self.state = STOPPING
+        self._spawn(self._disconnect_worker, on_done)
+        return True
+
+    def join(self, timeout=None):
+        """Waits for the current connect/disconnect worker, including its teardown."""
+        worker = self._worker
+        if worker and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def _check_cancel(self):
+        if self._cancel.is_set():
+            raise ConnectionCancelled()
+
+    def _wait_for_inbound(self):
+        """Polls the HTTP inbound until the core accepts connections."""
+        deadline = time.monotonic() + VERIFY_TIMEOUT
+        while time.monotonic() < deadline:
+            self._check_cancel()
+            if not self.runner.is_running():
+                raise RuntimeError("Xray core exited during startup.")
+            try:
+                with socket.create_connection(("127.0.0.1", self.http_port), timeout=VERIFY_INTERVAL):
+                    return
+            except OSError:
+                self._cancel.wait(VERIFY_INTERVAL)
+        raise RuntimeError(f"Xray core did not open port {self.http_port} within {VERIFY_TIMEOUT}s.")
+
+    def _connect_worker(self, config_json):
+        proxy_set = False
+        try:
+            self._transition(STARTING, "Starting core...")
+            with timed("babyvpn_connect_stage_seconds", stage="start_core"):
+                started = self.runner.start(config_json)
+            if not started:
+                raise RuntimeError("Failed to start Xray core.")
+            self._check_cancel()
+
+            self._transition(VERIFYING, "Waiting for core to bind ports...")
+            with timed("babyvpn_connect_stage_seconds", stage="verify"):
+                self._wait_for_inbound()
+
+            with timed("babyvpn_connect_stage_seconds", stage="set_proxy"):
+                self.set_proxy(True)
+            proxy_set = True
+            self._check_cancel()
+
+            self._transition(CONNECTED, "System proxy enabled.")
+        except ConnectionCancelled:
+            self._teardown(proxy_set)
+            self._transition(IDLE, "Connect cancelled.")
+        except Exception as e:
+            self._teardown(proxy_set)
+            self._transition(IDLE, f"Connection failed: {e}")
+
+    def _disconnect_worker(self, on_done):
+        try:
+            self._transition(STOPPING, "Disconnecting...")
+            self._teardown(True)
+            self._transition(IDLE, "")
+        except Exception as e:
+            self._transition(IDLE, f"Disconnect failed: {e}")
+        finally:
+            if on_done:
+                on_done()
+
+    @timed("babyvpn_connect_stage_seconds", stage="teardown")
+    def _teardown(self, proxy_set):
+        if proxy_set:
+            try: self.set_proxy(False)
+            except Exception as e: print(f"Failed to reset proxy: {e}")
+        try: self.runner.stop()
+        except Exception as e: print(f"Failed to stop core: {e}")
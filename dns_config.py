@@ -0,0 +1,111 @@
+import random
+import socket
+import struct
+
+# --- DNS Presets ---
+
+DEFAULT_DNS_PRESET = "plain"
+DOMAIN_STRATEGIES = ["AsIs", "IPIfNonMatch", "IPOnDemand"]
+
+FAKEDNS_POOL = {"ipPool": "198.18.0.0/15", "poolSize": 65535}
+
+# "plain" is the historical config. https:// and quic:// servers are reached through the
+# proxy; the +local variants resolve directly. DoQ is local-only in the core.
+DNS_PRESETS = {
+    "plain": {
+        "servers": ["1.1.1.1", "8.8.8.8", "localhost"],
+        "domainStrategy": "AsIs",
+    },
+    "doh": {
+        "servers": ["https://1.1.1.1/dns-query", "https://8.8.8.8/dns-query", "localhost"],
+        "domainStrategy": "IPIfNonMatch",
+        "queryStrategy": "UseIP",
+    },
+    "doh-local": {
+        "servers": ["https+local://1.1.1.1/dns-query", "https+local://8.8.8.8/dns-query", "localhost"],
+        "domainStrategy": "IPIfNonMatch",
+        "queryStrategy": "UseIP",
+    },
+    "doq": {
+        "servers": ["quic+local://dns.adguard-dns.com", "https+local://1.1.1.1/dns-query", "localhost"],
+        # Bootstrap the DoQ host so resolving the resolver doesn't need DNS
+        "hosts": {"dns.adguard-dns.com": ["94.140.14.14", "94.140.15.15"]},
+        "domainStrategy": "IPIfNonMatch",
+        "queryStrategy": "UseIP",
+    },
+    "fakedns": {
+        # Apps get a fake IP at once; the real lookup happens at the server
+        "servers": ["fakedns", "https://1.1.1.1/dns-query", "localhost"],
+        "fakedns": True,
+        "domainStrategy": "AsIs",
+    },
+}
+
+def get_dns_preset(name=None):
+    """Returns the named DNS preset, falling back to the default."""
+    return DNS_PRESETS.get(name or DEFAULT_DNS_PRESET, DNS_PRESETS[DEFAULT_DNS_PRESET])
+
+def clean_domain_servers(value):
+    """
+    Checks a resolver -> domains mapping from settings. Returns (mapping, problems): a single
+    domain given as a string becomes a one-item list, unusable entries are dropped and described.
+    """
+    if not value:
+        return {}, []
+    if not isinstance(value, dict):
+        return {}, [f"expected resolver -> domains, got {type(value).__name__}"]
+    servers, problems = {}, []
+    for address, domains in value.items():
+        if isinstance(domains, str):
+            domains = [domains]
+        if not isinstance(address, str) or not address or not isinstance(domains, (list, tuple)) \
+                or not all(isinstance(d, str) and d for d in domains):
+            problems.append(f"skipped {address!r}: {domains!r}")
+            continue
+        servers[address] = list(domains)
+    return servers, problems
+
+def build_dns(preset=None, domain_servers=None, cache=True):
+    """
+    Returns (dns_section, domain_strategy, fakedns_pool) for generate_xray_config.
+    domain_servers maps a resolver address to the domains it answers for, e.g.
+    {"223.5.5.5": ["geosite:cn"]}; those are tried before the preset's servers.
+    """
+    preset = get_dns_preset(preset)
+    servers = [
+        {"address": address, "domains": list(domains), "skipFallback": True}
+        for address, domains in (domain_servers or {}).items() if domains
+    ]
+    servers += preset["servers"]
+
+    dns = {"servers": servers}
+    if preset.get("hosts"):
+        dns["hosts"] = dict(preset["hosts"])
+    if preset.get("queryStrategy"):
+        dns["queryStrategy"] = preset["queryStrategy"]
+    if not cache:
+        dns["disableCache"] = True
+    return dns, preset["domainStrategy"], [dict(FAKEDNS_POOL)] if preset.get("fakedns") else None
+
+# --- DNS Probe ---
+
+def build_query(name, query_id=None):
+    """Minimal recursive A query for name."""
+    query_id = random.getrandbits(16) if query_id is None else query_id
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.strip(".").split(".")) + b"\x00"
+    return query_id, header + qname + struct.pack("!HH", 1, 1)
+
+def resolve_via(port, name, timeout=5, host="127.0.0.1"):
+    """Sends one A query to a DNS listener; returns True on a NOERROR answer with records."""
+    query_id, query = build_query(name)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(query, (host, port))
+        while True:
+            data, _ = sock.recvfrom(4096)
+            if len(data) < 12:
+                continue
+            resp_id, flags, _, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+            if resp_id == query_id:
+                return flags & 0x000F == 0 and ancount > 0
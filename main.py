@@ -4,20 +4,44 @@ import os
 import json
 import threading
 import time
-import requests
 import subprocess
-import concurrent.futures
 # import pyperclip 
-from utils import parse_vmess, parse_vless, parse_trojan, generate_xray_config, set_system_proxy
-from xray_runner import XrayRunner
+from utils import parse_vmess, parse_vless, parse_trojan, generate_xray_config, set_system_proxy, PERFORMANCE_PROFILES, DEFAULT_PROFILE, forget_outbound
+from xray_runner import XrayRunner, reap_orphans, CORE_REGISTRY
+from pinger import ping_outbound, PingBatch, record_result, time_dns_presets, udp_test_outbound
+from connection import ConnectionManager, IDLE, STARTING, VERIFYING, CONNECTED, STOPPING
+from mux_tuner import tune_outbound, describe_mux, MUX_CANDIDATES
+from settings import load_settings, save_settings
+from scheduler import ReprobeScheduler
+from traffic import TrafficPoller, format_bytes
+from routing import compile_bypass
+from dns_config import DNS_PRESETS, DOMAIN_STRATEGIES, clean_domain_servers
+from variants import generate_variants, benchmark_variants, describe_variant, variant_link
+from server_index import ServerIndex
+from pac import PacServer, generate_pac
+from sessions import SessionCore, SessionError, next_free_ports, session_ports
+import metrics
 
 # --- Configuration ---
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
+SERVER_DEFAULT_PROFILE = "Server Default"
+
+# Ping All early-exit choices: label -> number of healthy servers to stop after
+STOP_AFTER_CHOICES = {"Ping every server": None, "Stop after 5 healthy": 5, "Stop after 10 healthy": 10, "Stop after 20 healthy": 20}
+LIVE_REFRESH_MS = 250  # Minimum gap between list redraws while results stream in
+MAX_RENDERED_CARDS = 100  # Cards drawn per refresh; search narrows the rest
+CARD_POOL_SIZE = 400  # Hidden cards kept for reuse when a search is widened again
+EMPTY_LIST_TEXT = "No servers added yet.\nCopy a Vmess/Vless link and press Ctrl+V."
+STRATEGY_FROM_PRESET = "Preset strategy"  # Strategy menu entry for dns_domain_strategy = None
+CLOSE_TIMEOUT = 15  # Seconds to wait for an in-flight connect/disconnect on exit
+PAC_EMPTY_MESSAGE = ("PAC mode would send every site DIRECT: add pac_proxy_domains/cidrs/keywords "
+                     "or set pac_default to \"proxy\" in settings.json.")
+
 class ConfigCard(ctk.CTkFrame):
     """A card-like frame representing a single configuration."""
-    def __init__(self, master, config_item, connect_cb, delete_cb, index, is_connected=False):
+    def __init__(self, master, config_item, connect_cb, delete_cb, index, is_connected=False, favourite_cb=None):
         # Premium dark gray color, highlight if connected
         fg_color = "#2a2d2e" if not is_connected else ("#3B8ED0", "#1F6AA5")
         super().__init__(master, fg_color=fg_color, corner_radius=8)
@@ -69,6 +93,19 @@ class ConfigCard(ctk.CTkFrame):
         self.ping_lbl.pack(side="left", padx=5)
         self.ping_lbl.bind("<Button-1>", lambda e: self.connect_cb(self.index))
 
+        # UDP path result (only once a UDP test has run)
+        udp = config_item.get('udp_test')
+        if udp:
+            if udp['received'] == 0:
+                u_text, u_color = "UDP ✗", "#ff4444"
+            elif udp['loss'] > 0:
+                u_text, u_color = f"UDP {udp['rtt_ms']} ms · {udp['loss']:.0%} loss", "#ffaa00"
+            else:
+                u_text, u_color = f"UDP {udp['rtt_ms']} ms", "#00ff00"
+            self.udp_lbl = ctk.CTkLabel(self, text=u_text, font=("Roboto", 11), text_color=u_color, anchor="w")
+            self.udp_lbl.pack(side="left", padx=5)
+            self.udp_lbl.bind("<Button-1>", lambda e: self.connect_cb(self.index))
+
         # 3. Delete Button (Far right)
         self.btn_del = ctk.CTkButton(
             self, text="×", width=30, height=30, 
@@ -78,6 +115,18 @@ class ConfigCard(ctk.CTkFrame):
         )
         self.btn_del.pack(side="right", padx=10)
 
+        # Favourite toggle (favourites are re-tested more often in the background)
+        if favourite_cb:
+            is_fav = config_item.get('favourite', False)
+            self.btn_fav = ctk.CTkButton(
+                self, text="★" if is_fav else "☆", width=30, height=30,
+                fg_color="transparent", hover_color="#444",
+                text_color="#ffaa00" if is_fav else "gray",
+                font=("Arial", 16),
+                command=lambda: favourite_cb(self.index)
+            )
+            self.btn_fav.pack(side="right")
+
         # 4. Badges (Right side, before Delete)
         
         # TLS badge (if applicable)
@@ -112,6 +161,86 @@ class ConfigCard(ctk.CTkFrame):
 
 
 
+def card_state(cfg, selected, connected):
+    """Everything a ConfigCard shows; the card is rebuilt only when this changes."""
+    udp = cfg.get('udp_test')
+    return (
+        cfg['alias'], cfg.get('last_ping'), cfg.get('is_pinging_active', False),
+        (udp['rtt_ms'], udp['loss'], udp['received']) if udp else None,
+        cfg.get('favourite', False), id(cfg['outbound']), selected, connected,
+    )
+
+class CardPool:
+    """
+    Keeps ConfigCards alive between redraws. A card is built only for a server that wasn't shown
+    before or whose card_state() changed (taking the old card's place), and cards are re-packed
+    only when the order changes, so a keystroke or a streamed ping result touches just the
+    cards that differ. build(index, cfg, state) creates a card.
+    """
+    pack_options = {"fill": "x", "pady": 4, "padx": 5}
+
+    def __init__(self, build, limit=CARD_POOL_SIZE):
+        self.build = build
+        self.limit = limit
+        self.cards = {}   # id(cfg) -> card (card.config_item is cfg)
+        self.shown = []
+        self.built = 0    # Cards created so far (for benchmarks)
+
+    def show(self, rows):
+        """rows: (index, cfg, state) in display order. Returns the cards shown."""
+        cards = []
+        for index, cfg, state in rows:
+            card = self.cards.get(id(cfg))
+            if card is None or card.config_item is not cfg or card.state != state:
+                new = self.build(index, cfg, state)
+                new.state = state
+                self.built += 1
+                if card is not None:
+                    position = self._position(card)
+                    if position is not None:
+                        new.pack(before=card, **self.pack_options)
+                        self.shown[position] = new
+                    self._destroy(card)
+                self.cards[id(cfg)] = card = new
+            card.index = index  # Click handlers read this, so reused cards follow deletions
+            cards.append(card)
+
+        if len(cards) != len(self.shown) or any(a is not b for a, b in zip(cards, self.shown)):
+            for card in self.shown:
+                card.pack_forget()
+            for card in cards:
+                card.pack(**self.pack_options)
+            self.shown = cards
+
+        if len(self.cards) > self.limit:
+            for card in list(self.cards.values()):
+                if self._position(card) is None:
+                    self._destroy(card)
+        return list(cards)
+
+    def discard(self, cfg):
+        card = self.cards.get(id(cfg))
+        if card is not None and card.config_item is cfg:
+            self._destroy(card)
+
+    def clear(self):
+        for card in list(self.cards.values()):
+            self._destroy(card)
+
+    def _position(self, card):
+        for i, shown in enumerate(self.shown):
+            if shown is card:
+                return i
+        return None
+
+    def _destroy(self, card):
+        if self.cards.get(id(card.config_item)) is card:
+            del self.cards[id(card.config_item)]
+        position = self._position(card)
+        if position is not None:
+            del self.shown[position]
+        card.destroy()
+
 class BabyVPNApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -128,7 +257,11 @@ class BabyVPNApp(ctk.CTk):
         
         # Data
         self.configs = [] # List of dicts
+        self.index = ServerIndex()
+        self._index_stale = True  # Servers added/removed since the index was built
+        self._search_pending = False
         self.selected_index = -1
+        self.settings = load_settings()
         
         # Xray Handlers
         self.xray_main = XrayRunner(config_filename="config.json", log_filename="xray_log.txt")
@@ -136,14 +269,87 @@ class BabyVPNApp(ctk.CTk):
         
         self.is_connected = False
         self.is_pinging = False
+        self.ping_batch = None
+        self._refresh_pending = False
+
+        # Bypass lists are compiled once; the core and the system proxy share the result
+        self.bypass = compile_bypass(
+            self.settings["bypass_cidrs"], self.settings["bypass_domains"], self.settings["bypass_keywords"]
+        )
+
+        # PAC mode: only hosts on the pac_proxy_* lists go through the core
+        self.pac_rules = compile_bypass(
+            self.settings["pac_proxy_cidrs"], self.settings["pac_proxy_domains"], self.settings["pac_proxy_keywords"]
+        )
+        self.pac_server = PacServer(port=self.settings["pac_port"])
+        self.pac_active = False
+        # Checked once here, so config builds (and their worker threads) never have to log about them
+        self.dns_problems = []
+        if self.settings["dns_domain_strategy"] not in (None, *DOMAIN_STRATEGIES):
+            self.dns_problems.append(f"unknown domain strategy {self.settings['dns_domain_strategy']!r}, using the preset's")
+            self.settings["dns_domain_strategy"] = None
+        self.settings["dns_domain_servers"], problems = clean_domain_servers(self.settings["dns_domain_servers"])
+        self.dns_problems += [f"dns_domain_servers: {problem}" for problem in problems]
+        # Set once this session pointed the system proxy (global or PAC) at the core, so exit
+        # never clears a proxy the user configured themselves
+        self._proxy_owned = False
+
+        # Connect/disconnect run off the Tk thread and report back via events
+        self.connection = ConnectionManager(
+            self.xray_main, self._on_connection_event, set_proxy=self._set_proxy
+        )
+        self.connecting_alias = None
+        self.connected_cfg = None
+        self.traffic = None
 
         # Build UI
         self.create_sidebar()
         self.create_main_area()
 
+        # Multi-session mode: extra local ports, each pinned to its own server, on one shared core
+        self.session_core = SessionCore(
+            # Read on every rebuild, so DNS/bypass changes reach the session core on its next (re)start
+            config_kwargs=lambda: {"bypass": self.bypass, "dns_preset": self.settings["dns_preset"], **self.dns_options()},
+            api_port=self.settings["session_api_port"], stats_port=self.settings["session_stats_port"],
+            on_sample=self._on_session_sample, on_event=self._on_session_core_event
+        )
+        self.sessions_window = None
+        self.session_rate_labels = {}
+
+        if self.bypass["invalid"]:
+            self.log(f"Ignored invalid bypass entries: {', '.join(self.bypass['invalid'])}")
+        for problem in self.dns_problems:
+            self.log(f"DNS settings: {problem}.")
+        if self.pac_switch.get() and not self.pac_routes_anything():
+            self.pac_switch.deselect()
+            self.log(PAC_EMPTY_MESSAGE + " Using global mode.")
+
         # Load existing configs
         self.load_configs()
 
+        # Background re-probe keeps latency data fresh (paused during bulk/speed tests)
+        self.reprobe = ReprobeScheduler(
+            lambda: self.configs, self._on_reprobe_result,
+            should_pause=lambda: self.is_pinging,
+            probes_per_minute=self.settings["reprobe_per_minute"],
+            cpu_ceiling=self.settings["reprobe_cpu_ceiling"]
+        )
+        if self.settings.get("reprobe_enabled"):
+            self.reprobe_switch.select()
+            self.reprobe.start()
+
+        # Optional local metrics endpoint (Prometheus text + JSON)
+        self.metrics_server = None
+        if self.settings.get("metrics_port"):
+            try:
+                self.metrics_server = metrics.start_metrics_server(self.settings["metrics_port"])
+                self.log(f"Metrics endpoint on 127.0.0.1:{self.settings['metrics_port']}/metrics")
+            except OSError as e:
+                self.log(f"Failed to start metrics endpoint: {e}")
+
+        # Stopping leftover cores can take seconds each, so it runs off the Tk thread
+        threading.Thread(target=self._startup_cleanup, daemon=True).start()
+
         # Key Bindings
         self.bind("<Control-v>", self.paste_config)
         
@@ -154,7 +360,7 @@ class BabyVPNApp(ctk.CTk):
         """Creates the left sidebar with controls and status."""
         self.sidebar_frame = ctk.CTkFrame(self, width=200, corner_radius=0, fg_color="#1e1e24")
         self.sidebar_frame.grid(row=0, column=0, sticky="nsew")
-        self.sidebar_frame.grid_rowconfigure(5, weight=1) # Spacer
+        self.sidebar_frame.grid_rowconfigure(8, weight=1) # Spacer
 
         # Logo / Title
         self.logo_label = ctk.CTkLabel(
@@ -180,21 +386,68 @@ class BabyVPNApp(ctk.CTk):
         self.status_label = ctk.CTkLabel(self.status_frame, text="Disconnected", font=ctk.CTkFont(size=14))
         self.status_label.pack(side="left")
 
+        # Core health (supervisor) and live traffic (stats poller), filled in while connected
+        self.stats_frame = ctk.CTkFrame(self.sidebar_frame, fg_color="transparent")
+        self.stats_frame.grid(row=3, column=0, padx=20, pady=(0, 5))
+        self.core_stats_label = ctk.CTkLabel(self.stats_frame, text="", font=ctk.CTkFont(size=11), text_color="gray")
+        self.core_stats_label.pack()
+        self.traffic_label = ctk.CTkLabel(self.stats_frame, text="", font=ctk.CTkFont(size=11), text_color="gray", justify="left")
+        self.traffic_label.pack()
+
         # Connect Button (Big)
         self.btn_connect = ctk.CTkButton(
             self.sidebar_frame, text="Connect", 
             height=40, font=ctk.CTkFont(weight="bold"),
             command=self.toggle_connection, state="disabled"
         )
-        self.btn_connect.grid(row=3, column=0, padx=20, pady=10)
+        self.btn_connect.grid(row=4, column=0, padx=20, pady=10)
+
+        # Mux Toggle (+ per-server auto-tune)
+        self.mux_frame = ctk.CTkFrame(self.sidebar_frame, fg_color="transparent")
+        self.mux_frame.grid(row=5, column=0, padx=20, pady=(5, 10))
 
-        # Mux Toggle
         self.mux_switch = ctk.CTkSwitch(
-            self.sidebar_frame, text="Enable Mux",
+            self.mux_frame, text="Enable Mux",
             font=ctk.CTkFont(size=12),
             onvalue=True, offvalue=False
         )
-        self.mux_switch.grid(row=4, column=0, padx=20, pady=(5, 10))
+        self.mux_switch.pack(side="left")
+
+        self.btn_tune_mux = ctk.CTkButton(
+            self.mux_frame, text="Tune", width=44, height=24,
+            fg_color="#333", hover_color="#555",
+            command=self.run_mux_tune
+        )
+        self.btn_tune_mux.pack(side="left", padx=(5, 0))
+
+        # Performance Profile (per connection; "Server Default" uses the server's own)
+        self.profile_frame = ctk.CTkFrame(self.sidebar_frame, fg_color="transparent")
+        self.profile_frame.grid(row=6, column=0, padx=20, pady=(0, 10))
+
+        self.profile_menu = ctk.CTkOptionMenu(
+            self.profile_frame, values=[SERVER_DEFAULT_PROFILE] + list(PERFORMANCE_PROFILES),
+            width=120, height=26, font=ctk.CTkFont(size=12),
+            fg_color="#333", button_color="#444", button_hover_color="#555"
+        )
+        self.profile_menu.pack(side="left")
+
+        self.btn_pin_profile = ctk.CTkButton(
+            self.profile_frame, text="Pin", width=36, height=26,
+            fg_color="#333", hover_color="#555",
+            command=self.pin_profile
+        )
+        self.btn_pin_profile.pack(side="left", padx=(5, 0))
+
+        # Proxy Mode (global system proxy, or PAC rules)
+        self.pac_switch = ctk.CTkSwitch(
+            self.sidebar_frame, text="PAC Mode",
+            font=ctk.CTkFont(size=12),
+            onvalue=True, offvalue=False,
+            command=self.toggle_pac_mode
+        )
+        self.pac_switch.grid(row=7, column=0, padx=20, pady=(0, 10))
+        if self.settings["proxy_mode"] == "pac":
+            self.pac_switch.select()
 
         # Bottom section: Ping, About
         self.btn_ping = ctk.CTkButton(
@@ -202,14 +455,14 @@ class BabyVPNApp(ctk.CTk):
             fg_color="#444", hover_color="#555",
             command=self.run_ping_check, state="disabled"
         )
-        self.btn_ping.grid(row=6, column=0, padx=20, pady=(10, 5))
+        self.btn_ping.grid(row=9, column=0, padx=20, pady=(10, 5))
 
         self.btn_ping_all = ctk.CTkButton(
             self.sidebar_frame, text="Ping All", 
             fg_color="#444", hover_color="#555",
             command=self.run_ping_all, state="disabled"
         )
-        self.btn_ping_all.grid(row=7, column=0, padx=20, pady=(5, 5))
+        self.btn_ping_all.grid(row=10, column=0, padx=20, pady=(5, 5))
 
         self.btn_about = ctk.CTkButton(
             self.sidebar_frame, text="About Baby VPN", 
@@ -217,7 +470,7 @@ class BabyVPNApp(ctk.CTk):
             border_width=1, border_color="#00b4d8",
             command=self.show_about
         )
-        self.btn_about.grid(row=8, column=0, padx=20, pady=(5, 20))
+        self.btn_about.grid(row=11, column=0, padx=20, pady=(5, 20))
 
     def show_about(self):
         try:
@@ -242,19 +495,104 @@ class BabyVPNApp(ctk.CTk):
         self.main_frame = ctk.CTkFrame(self, fg_color="transparent")
         self.main_frame.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
         self.main_frame.grid_columnconfigure(0, weight=1) # Expand internally
-        self.main_frame.grid_rowconfigure(0, weight=3) # List area
-        self.main_frame.grid_rowconfigure(1, weight=1) # Console area
+        self.main_frame.grid_rowconfigure(0, weight=0) # Toolbar
+        self.main_frame.grid_rowconfigure(1, weight=3) # List area
+        self.main_frame.grid_rowconfigure(2, weight=1) # Console area
+
+        # List Toolbar
+        self.toolbar_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        self.toolbar_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+
+        self.search_entry = ctk.CTkEntry(
+            self.toolbar_frame, width=220, height=26, font=ctk.CTkFont(size=12),
+            placeholder_text="Search: name, host, net:ws, ms:<300..."
+        )
+        self.search_entry.pack(side="left", padx=(5, 15))
+        self.search_entry.bind("<KeyRelease>", self.on_search_changed)
+
+        self.sort_switch = ctk.CTkSwitch(
+            self.toolbar_frame, text="Sort by ping",
+            font=ctk.CTkFont(size=12),
+            onvalue=True, offvalue=False,
+            command=self.refresh_list
+        )
+        self.sort_switch.pack(side="left", padx=(0, 15))
+
+        self.reprobe_switch = ctk.CTkSwitch(
+            self.toolbar_frame, text="Auto re-test",
+            font=ctk.CTkFont(size=12),
+            onvalue=True, offvalue=False,
+            command=self.toggle_reprobe
+        )
+        self.reprobe_switch.pack(side="left", padx=(0, 15))
+
+        self.stop_after_menu = ctk.CTkOptionMenu(
+            self.toolbar_frame, values=list(STOP_AFTER_CHOICES),
+            width=150, height=26, font=ctk.CTkFont(size=12),
+            fg_color="#333", button_color="#444", button_hover_color="#555"
+        )
+        self.stop_after_menu.pack(side="right", padx=5)
+
+        # DNS preset for the connected core (+ a per-preset lookup timing for the selected server)
+        self.btn_dns_test = ctk.CTkButton(
+            self.toolbar_frame, text="DNS Test", width=80, height=26,
+            font=ctk.CTkFont(size=12), fg_color="#333", hover_color="#555",
+            command=self.run_dns_test
+        )
+        self.btn_dns_test.pack(side="right", padx=5)
+
+        self.btn_udp_test = ctk.CTkButton(
+            self.toolbar_frame, text="UDP Test", width=80, height=26,
+            font=ctk.CTkFont(size=12), fg_color="#333", hover_color="#555",
+            command=self.run_udp_test
+        )
+        self.btn_udp_test.pack(side="right", padx=5)
+
+        self.btn_variants = ctk.CTkButton(
+            self.toolbar_frame, text="Transports", width=90, height=26,
+            font=ctk.CTkFont(size=12), fg_color="#333", hover_color="#555",
+            command=self.run_variant_bench
+        )
+        self.btn_variants.pack(side="right", padx=5)
+
+        self.btn_sessions = ctk.CTkButton(
+            self.toolbar_frame, text="Sessions", width=80, height=26,
+            font=ctk.CTkFont(size=12), fg_color="#333", hover_color="#555",
+            command=self.show_sessions
+        )
+        self.btn_sessions.pack(side="right", padx=5)
+
+        self.dns_menu = ctk.CTkOptionMenu(
+            self.toolbar_frame, values=list(DNS_PRESETS),
+            width=110, height=26, font=ctk.CTkFont(size=12),
+            fg_color="#333", button_color="#444", button_hover_color="#555",
+            command=self.set_dns_preset
+        )
+        self.dns_menu.set(self.settings["dns_preset"])
+        self.dns_menu.pack(side="right", padx=5)
+
+        # Per-domain resolvers stay in settings.json (dns_domain_servers); the strategy is picked here
+        self.strategy_menu = ctk.CTkOptionMenu(
+            self.toolbar_frame, values=[STRATEGY_FROM_PRESET, *DOMAIN_STRATEGIES],
+            width=120, height=26, font=ctk.CTkFont(size=12),
+            fg_color="#333", button_color="#444", button_hover_color="#555",
+            command=self.set_domain_strategy
+        )
+        self.strategy_menu.set(self.settings["dns_domain_strategy"] or STRATEGY_FROM_PRESET)
+        self.strategy_menu.pack(side="right", padx=5)
         
         # Scrollable Config List
         self.scroll_frame = ctk.CTkScrollableFrame(self.main_frame, label_text="Server Configurations")
-        self.scroll_frame.grid(row=0, column=0, sticky="nsew", pady=(0,10))
+        self.scroll_frame.grid(row=1, column=0, sticky="nsew", pady=(0,10))
         
-        self.lbl_empty = ctk.CTkLabel(self.scroll_frame, text="No servers added yet.\nCopy a Vmess/Vless link and press Ctrl+V.", text_color="gray")
-        self.lbl_empty.pack(pady=40)
+        # Empty-list / no-match / "showing N of M" note, packed after the cards
+        self.lbl_list_note = ctk.CTkLabel(self.scroll_frame, text=EMPTY_LIST_TEXT, text_color="gray")
+        self.lbl_list_note.pack(pady=40)
+        self.card_pool = CardPool(self._build_card)
 
         # Console Logger
         self.log_box = ctk.CTkTextbox(self.main_frame, height=100, font=("Consolas", 11), fg_color="#121212", text_color="#00ff00")
-        self.log_box.grid(row=1, column=0, sticky="nsew")
+        self.log_box.grid(row=2, column=0, sticky="nsew")
         self.log_box.insert("end", "[System] Baby VPN Initialized.\n")
         self.log_box.configure(state="disabled")
 
@@ -272,12 +610,14 @@ class BabyVPNApp(ctk.CTk):
             try:
                 with open("servers.json", "r", encoding="utf-8") as f:
                     self.configs = json.load(f)
+                self._index_stale = True
                 if self.configs:
                     self.selected_index = 0
                 self.refresh_list()
             except Exception as e:
                 self.log(f"Failed to load servers.json: {e}")
 
+    @metrics.timed("babyvpn_save_configs_seconds")
     def save_configs(self):
         """Saves current configurations to servers.json."""
         try:
@@ -324,6 +664,7 @@ class BabyVPNApp(ctk.CTk):
         
         config_item = {'alias': alias, 'link': link, 'outbound': outbound}
         self.configs.append(config_item)
+        self._index_stale = True
         
         # Auto-select if it's the first one
         if len(self.configs) == 1:
@@ -335,24 +676,33 @@ class BabyVPNApp(ctk.CTk):
 
     def refresh_list(self):
         """Redraws the configuration list inside the scroll frame."""
-        for widget in self.scroll_frame.winfo_children():
-            widget.destroy()
+        self.index.invalidate_latency()  # Ping results may have changed since the last draw
+        self.render_list()
 
+    @metrics.timed("babyvpn_ui_refresh_seconds")
+    def render_list(self):
+        """Shows the (searched, sorted) list, capped at MAX_RENDERED_CARDS; unchanged cards are reused."""
         if not self.configs:
-            self.lbl_empty = ctk.CTkLabel(self.scroll_frame, text="No servers added yet.\nCopy a Vmess/Vless link and press Ctrl+V.", text_color="gray")
-            self.lbl_empty.pack(pady=40)
+            self.card_pool.clear()
+            self._show_list_note(EMPTY_LIST_TEXT)
             self.btn_connect.configure(state="disabled")
             self.btn_ping.configure(state="disabled")
             return
 
-        for idx, cfg in enumerate(self.configs):
-            is_conn = (idx == self.selected_index and self.is_connected)
-            card = ConfigCard(self.scroll_frame, cfg, self.select_config, self.delete_config, idx, is_connected=is_conn)
-            card.pack(fill="x", pady=4, padx=5)
-            
-            # Simple highlight for selected but NOT connected
-            if idx == self.selected_index and not self.is_connected:
-                card.configure(border_width=2, border_color="#00b4d8")
+        order = self.display_order()
+        rows = []
+        for idx in order[:MAX_RENDERED_CARDS]:
+            cfg = self.configs[idx]
+            selected = idx == self.selected_index
+            rows.append((idx, cfg, card_state(cfg, selected, selected and self.is_connected)))
+        self.card_pool.show(rows)
+
+        if not order:
+            self._show_list_note("No servers match the search.")
+        elif len(order) > MAX_RENDERED_CARDS:
+            self._show_list_note(f"Showing {MAX_RENDERED_CARDS} of {len(order)} servers. Refine the search to see more.")
+        else:
+            self._show_list_note(None)
 
         # Enable buttons based on selection
         if self.selected_index >= 0:
@@ -362,15 +712,66 @@ class BabyVPNApp(ctk.CTk):
              self.btn_connect.configure(state="disabled")
              self.btn_ping.configure(state="disabled")
 
-        self.btn_ping_all.configure(state="normal" if (self.configs and not self.is_pinging) else "disabled")
+        if self.ping_batch is None:
+            self.btn_ping_all.configure(state="normal" if (self.configs and not self.is_pinging) else "disabled")
+
+    def _build_card(self, idx, cfg, state):
+        selected, connected = state[-2:]
+        card = ConfigCard(
+            self.scroll_frame, cfg, self.select_config, self.delete_config, idx,
+            is_connected=connected, favourite_cb=self.toggle_favourite
+        )
+        # Simple highlight for selected but NOT connected
+        if selected and not connected:
+            card.configure(border_width=2, border_color="#00b4d8")
+        return card
+
+    def _show_list_note(self, text):
+        """Shows text below the cards (or hides the note); re-packing keeps it after them."""
+        self.lbl_list_note.pack_forget()
+        if text:
+            self.lbl_list_note.configure(text=text)
+            self.lbl_list_note.pack(pady=40 if not self.card_pool.shown else 10)
+
+    def display_order(self):
+        """Indices into self.configs matching the search, in the order the list shows them."""
+        if self._index_stale or self.index.configs is not self.configs:
+            self.index.rebuild(self.configs)
+            self._index_stale = False
+        matches = self.index.search(self.search_entry.get())
+        return self.index.ordered(matches, by_latency=bool(self.sort_switch.get()))
+
+    def on_search_changed(self, event=None):
+        """Redraws once per idle cycle however fast keys arrive; ping data isn't re-read."""
+        if self._search_pending: return
+        self._search_pending = True
+
+        def run():
+            self._search_pending = False
+            self.render_list()
+        self.after_idle(run)
+
+    def schedule_refresh(self):
+        """Coalesces redraw requests from worker threads into one refresh per interval."""
+        if self._refresh_pending: return
+        self._refresh_pending = True
+
+        def run():
+            self._refresh_pending = False
+            try: self.refresh_list()
+            except: pass
+        self.after(LIVE_REFRESH_MS, run)
 
     def delete_config(self, index):
-        if self.is_connected and index == self.selected_index:
+        if (self.is_connected or self.connection.busy) and index == self.selected_index:
             tkmb.showerror("Error", "Cannot delete the active connection. Disconnect first.")
             return
 
         name = self.configs[index]['alias']
+        self.card_pool.discard(self.configs[index])
+        forget_outbound(self.configs[index]['outbound'])
         del self.configs[index]
+        self._index_stale = True
         self.log(f"Deleted Server: {name}")
         
         if index == self.selected_index:
@@ -381,71 +782,406 @@ class BabyVPNApp(ctk.CTk):
         self.save_configs()
         self.refresh_list()
 
+    def toggle_favourite(self, index):
+        cfg = self.configs[index]
+        cfg['favourite'] = not cfg.get('favourite', False)
+        self.save_configs()
+        self.refresh_list()
+
     def select_config(self, index):
-        if self.is_connected and index != self.selected_index:
+        if (self.is_connected or self.connection.busy) and index != self.selected_index:
             tkmb.showwarning("Warning", "Please disconnect before switching servers.")
             return
 
         self.selected_index = index
         self.refresh_list()
 
+    def toggle_reprobe(self):
+        enabled = bool(self.reprobe_switch.get())
+        self.settings["reprobe_enabled"] = enabled
+        save_settings(self.settings)
+        if enabled:
+            self.reprobe.start()
+            self.log(f"Auto re-test on ({self.settings['reprobe_per_minute']} probes/min).")
+        else:
+            self.reprobe.stop()
+            self.log("Auto re-test off.")
+
+    def _on_reprobe_result(self, cfg, latency):
+        """Called from the scheduler thread once the result is stored on cfg."""
+        self.save_configs()
+        self.schedule_refresh()
+
     def run_ping_check(self):
         """Runs the Non-Blocking Ping test on the selected config."""
         if self.selected_index < 0 or self.is_pinging: return
         threading.Thread(target=self._single_ping_logic, daemon=True).start()
 
     def run_ping_all(self):
-        """Runs the Ping test for all loaded configs concurrently."""
+        """Runs the Ping test for all loaded configs concurrently; a second click stops it."""
+        if self.ping_batch is not None:
+            self.log("Stopping Ping All...")
+            self.btn_ping_all.configure(state="disabled", text="Stopping...")
+            self.ping_batch.cancel()
+            return
         if not self.configs or self.is_pinging: return
         threading.Thread(target=self._ping_all_logic, daemon=True).start()
 
+    def dns_options(self):
+        """Per-domain resolvers, strategy and cache settings shared by connect and the DNS test."""
+        return {
+            "dns_domain_servers": self.settings["dns_domain_servers"],
+            "domain_strategy": self.settings["dns_domain_strategy"],
+            "dns_cache": self.settings.get("dns_cache", True),
+        }
+
+    def pac_routes_anything(self):
+        """False when the PAC script would send every host DIRECT (no pac_proxy_* rules, default direct)."""
+        return bool(self.pac_rules["ip"] or self.pac_rules["domain"]) or self.settings["pac_default"] == "proxy"
+
+    def toggle_pac_mode(self):
+        if self.pac_switch.get() and not self.pac_routes_anything():
+            self.pac_switch.deselect()
+            self.log(PAC_EMPTY_MESSAGE)
+            return
+        self.settings["proxy_mode"] = "pac" if self.pac_switch.get() else "global"
+        save_settings(self.settings)
+        self.log(f"Proxy mode: {self.settings['proxy_mode']}.")
+
+    def _set_proxy(self, enable):
+        """System proxy hook for ConnectionManager (runs on its worker thread)."""
+        pac_url = self.pac_server.url if self.pac_active else None
+        if enable:
+            self._proxy_owned = True  # Before the call: a half-applied change is ours to undo
+        set_system_proxy(enable, override=self.bypass["override"], pac_url=pac_url)
+        if not enable:
+            self._proxy_owned = False
+
+    def _prepare_pac(self):
+        """Regenerates the PAC script and makes sure it is being served."""
+        script = generate_pac(
+            self.pac_rules, self.bypass, default_proxy=self.settings["pac_default"] == "proxy"
+        )
+        self.pac_server.update(script)
+        self.pac_server.start()
+
+    def set_dns_preset(self, choice):
+        self.settings["dns_preset"] = choice
+        save_settings(self.settings)
+        self.log(f"DNS preset set to {choice}" + (" (applies on next connect)." if self.is_connected else "."))
+
+    def set_domain_strategy(self, choice):
+        self.settings["dns_domain_strategy"] = None if choice == STRATEGY_FROM_PRESET else choice
+        save_settings(self.settings)
+        self.log(f"Domain strategy set to {choice}" + (" (applies on next connect)." if self.is_connected else "."))
+
+    def run_dns_test(self):
+        """Times DNS lookups through the selected server under every preset."""
+        if self.selected_index < 0 or self.is_pinging: return
+        threading.Thread(target=self._dns_test_logic, daemon=True).start()
+
+    def _dns_test_logic(self):
+        self.is_pinging = True
+        self.btn_dns_test.configure(state="disabled", text="...")
+
+        cfg = self.configs[self.selected_index]
+        self.log(f"Timing DNS through {cfg['alias']} ({len(DNS_PRESETS)} presets)...")
+        try:
+            timings = time_dns_presets(cfg['outbound'], profile=cfg.get('profile'), **self.dns_options())
+            cfg['dns_timings'] = timings
+            self.save_configs()
+            for preset, result in timings.items():
+                if result["cold_ms"] is None:
+                    self.log(f"  {preset}: failed")
+                else:
+                    self.log(f"  {preset}: {result['cold_ms']} ms cold, {result['cached_ms']} ms cached"
+                             + (f", {result['failures']} failed" if result['failures'] else ""))
+        except Exception as e:
+            self.log(f"DNS test exception [{cfg['alias']}]: {e}")
+        finally:
+            self.is_pinging = False
+            self.after(0, lambda: self.btn_dns_test.configure(state="normal", text="DNS Test"))
+
+    def run_udp_test(self):
+        """Checks the selected server's UDP path (VoIP, games, QUIC) with an echo burst."""
+        if self.selected_index < 0 or self.is_pinging: return
+        threading.Thread(target=self._udp_test_logic, daemon=True).start()
+
+    def _udp_test_logic(self):
+        self.is_pinging = True
+        self.btn_udp_test.configure(state="disabled", text="...")
+
+        cfg = self.configs[self.selected_index]
+        self.log(f"Testing UDP through {cfg['alias']}...")
+        try:
+            result = udp_test_outbound(cfg['outbound'], profile=cfg.get('profile'))
+            cfg['udp_test'] = result
+            self.save_configs()
+            if result['received'] == 0:
+                self.log(f"UDP Fail [{cfg['alias']}]: no replies to {result['sent']} packets.")
+            else:
+                self.log(f"UDP [{cfg['alias']}]: {result['rtt_ms']} ms, {result['loss']:.0%} loss "
+                         f"({result['received']}/{result['sent']}).")
+        except Exception as e:
+            self.log(f"UDP test exception [{cfg['alias']}]: {e}")
+        finally:
+            self.is_pinging = False
+            self.after(0, lambda: self.btn_udp_test.configure(state="normal", text="UDP Test"))
+            self.after(0, self.refresh_list)
+
+    def run_variant_bench(self):
+        """A/B tests the selected server's transport against the alternatives its CDN may serve."""
+        if self.selected_index < 0 or self.is_pinging: return
+        cfg = self.configs[self.selected_index]
+        if not generate_variants(cfg['outbound']):
+            self.log(f"{cfg['alias']} doesn't use ws/xhttp/httpupgrade; no transport variants to try.")
+            return
+        threading.Thread(target=self._variant_bench_logic, args=(cfg,), daemon=True).start()
+
+    def _variant_bench_logic(self, cfg):
+        self.is_pinging = True
+        self.btn_variants.configure(state="disabled", text="...")
+        self.log(f"Benchmarking {len(generate_variants(cfg['outbound']))} transport variants of {cfg['alias']}...")
+
+        def report(result):
+            self.log(f"  {describe_variant(result['variant'])}: {result['latency_ms']} ms, "
+                     f"{result['throughput_kbps']} KB/s, {result['errors']} errors")
+
+        try:
+            results = benchmark_variants(cfg['outbound'], profile=cfg.get('profile'), progress_cb=report)
+            self.after(0, lambda: self.show_variant_results(cfg, results))
+        except Exception as e:
+            self.log(f"Transport benchmark exception [{cfg['alias']}]: {e}")
+        finally:
+            self.is_pinging = False
+            self.after(0, lambda: self.btn_variants.configure(state="normal", text="Transports"))
+
+    def show_variant_results(self, cfg, results):
+        """Lists variants best first, each with a button to keep it as a new server."""
+        win = ctk.CTkToplevel(self)
+        win.title(f"Transports - {cfg['alias']}")
+        win.geometry("520x400")
+        win.transient(self)
+
+        frame = ctk.CTkScrollableFrame(win, label_text="Best first (throughput, then latency)")
+        frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        for result in results:
+            row = ctk.CTkFrame(frame, fg_color="#2a2d2e", corner_radius=6)
+            row.pack(fill="x", pady=3)
+            failed = result['errors'] > 0 or result['latency_ms'] is None
+            text = f"{describe_variant(result['variant'])}" + (" (current)" if result['current'] else "")
+            stats = "Fail" if failed else f"{result['latency_ms']} ms · {result['throughput_kbps']} KB/s"
+            ctk.CTkLabel(row, text=text, font=("Roboto", 12, "bold"), anchor="w").pack(side="left", padx=10, pady=6)
+            ctk.CTkLabel(row, text=stats, font=("Roboto", 12), text_color="#ff4444" if failed else "#00ff00").pack(side="left", padx=5)
+
+            btn = ctk.CTkButton(row, text="Save", width=60, height=26)
+            btn.configure(command=lambda r=result, b=btn: self.save_variant(cfg, r, b))
+            if failed or result['current']:
+                btn.configure(state="disabled")
+            btn.pack(side="right", padx=10)
+
+    def save_variant(self, cfg, result, button=None):
+        """Adds a variant as its own server entry next to the original."""
+        label = describe_variant(result['variant'])
+        item = {
+            'alias': f"{cfg['alias']} [{label}]",
+            'link': variant_link(cfg.get('link'), result['variant']),
+            'outbound': result['outbound'],
+        }
+        if cfg.get('profile'):
+            item['profile'] = cfg['profile']
+        self.configs.append(item)
+        self._index_stale = True
+        self.save_configs()
+        self.refresh_list()
+        self.log(f"Added Server: {item['alias']}")
+        if button:
+            button.configure(state="disabled", text="Saved")
+
+    def _startup_cleanup(self):
+        """Stops cores left running by a crashed/killed previous session (they hold ports 20808+
+        and the session ports), then restores saved sessions. Runs on a background thread."""
+        try:
+            reaped = reap_orphans(self.xray_main.xray_path)
+            message = f"Stopped {len(reaped)} leftover Xray core(s) from a previous session." if reaped else None
+        except Exception as e:
+            message = f"Orphan check failed: {e}"
+        if message:
+            self.after(0, lambda: self.log(message))
+        if self.settings["sessions"]:
+            self._restore_sessions()
+
+    # --- Sessions (per-application ports) ---
+
+    def _restore_sessions(self):
+        try:
+            self.session_core.start(self.settings["sessions"])
+            self.log(f"Restored {len(self.settings['sessions'])} session(s): " + ", ".join(
+                f"{s['tag']} ({'/'.join(map(str, session_ports(s)))})" for s in self.settings["sessions"]))
+        except SessionError as e:
+            self.log(f"Failed to restore sessions: {e}")
+        except Exception as e:  # Backstop: this runs on a bare thread, nothing else would report it
+            self.log(f"Failed to restore sessions: {e!r}")
+
+    def _save_sessions(self):
+        self.settings["sessions"] = list(self.session_core.sessions.values())
+        save_settings(self.settings)
+
+    def show_sessions(self):
+        """Lists the session ports with live traffic; adds the selected server as a new session."""
+        if self.sessions_window is not None and self.sessions_window.winfo_exists():
+            self.sessions_window.lift()
+            return
+        win = self.sessions_window = ctk.CTkToplevel(self)
+        win.title("Sessions")
+        win.geometry("620x400")
+        win.transient(self)
+
+        form = ctk.CTkFrame(win, fg_color="transparent")
+        form.pack(fill="x", padx=10, pady=(10, 0))
+        used = {p for s in self.session_core.sessions.values() for p in session_ports(s)}
+        socks_port, http_port = next_free_ports(used)
+        entries = {}
+        for key, placeholder, value, width in (("tag", "Name (e.g. browser)", "", 150),
+                                               ("socks_port", "SOCKS", socks_port, 70),
+                                               ("http_port", "HTTP", http_port, 70)):
+            entry = ctk.CTkEntry(form, placeholder_text=placeholder, width=width, height=26)
+            if value:
+                entry.insert(0, str(value))
+            entry.pack(side="left", padx=(0, 5))
+            entries[key] = entry
+        ctk.CTkButton(form, text="Add Selected Server", height=26,
+                      command=lambda: self.add_session(entries)).pack(side="left", padx=5)
+
+        self.sessions_list = ctk.CTkScrollableFrame(win, label_text="Each port uses its own server")
+        self.sessions_list.pack(fill="both", expand=True, padx=10, pady=10)
+        self.render_sessions()
+
+    def render_sessions(self):
+        if self.sessions_window is None or not self.sessions_window.winfo_exists():
+            return
+        for widget in self.sessions_list.winfo_children():
+            widget.destroy()
+        self.session_rate_labels = {}
+        if not self.session_core.sessions:
+            ctk.CTkLabel(self.sessions_list, text="No sessions. Pick a server and add it with a name and ports.",
+                         text_color="gray").pack(pady=20)
+        for tag, session in self.session_core.sessions.items():
+            row = ctk.CTkFrame(self.sessions_list, fg_color="#2a2d2e", corner_radius=6)
+            row.pack(fill="x", pady=3)
+            ports = " · ".join(f"{kind} {session[key]}" for kind, key in (("SOCKS", "socks_port"), ("HTTP", "http_port"))
+                               if session.get(key))
+            ctk.CTkLabel(row, text=f"{tag}: {session.get('alias', '')}", font=("Roboto", 12, "bold"),
+                         anchor="w").pack(side="left", padx=10, pady=6)
+            ctk.CTkLabel(row, text=ports, font=("Roboto", 12), text_color="gray").pack(side="left", padx=5)
+            ctk.CTkButton(row, text="Remove", width=60, height=26, fg_color="#444", hover_color="#cc0000",
+                          command=lambda t=tag: self.remove_session(t)).pack(side="right", padx=10)
+            rate = ctk.CTkLabel(row, text="", font=("Roboto", 11), text_color="#00b4d8")
+            rate.pack(side="right", padx=5)
+            self.session_rate_labels[tag] = rate
+
+    def add_session(self, entries):
+        if self.selected_index < 0:
+            self.log("Select a server to add as a session.")
+            return
+        cfg = self.configs[self.selected_index]
+        try:
+            ports = {key: int(entries[key].get()) if entries[key].get().strip() else None
+                     for key in ("socks_port", "http_port")}
+        except ValueError:
+            self.log("Session ports must be numbers.")
+            return
+        session = {"tag": entries["tag"].get().strip(), "alias": cfg['alias'], "outbound": cfg['outbound'], **ports}
+        threading.Thread(target=self._session_change, args=(self.session_core.add, session), daemon=True).start()
+
+    def remove_session(self, tag):
+        threading.Thread(target=self._session_change, args=(self.session_core.remove, tag), daemon=True).start()
+
+    def _session_change(self, change, arg):
+        """Runs SessionCore.add/remove off the Tk thread (they call the core's API)."""
+        try:
+            change(arg)
+            self._save_sessions()
+            if change == self.session_core.add:
+                self.log(f"Session {arg['tag']} on {'/'.join(map(str, session_ports(arg)))} -> {arg['alias']}")
+            else:
+                self.log(f"Session {arg} removed.")
+        except SessionError as e:
+            self.log(f"Session change failed: {e}")
+        except Exception as e:  # Backstop, as in _restore_sessions
+            self.log(f"Session change failed: {e!r}")
+        self.after(0, self.render_sessions)
+
+    def _on_session_sample(self, rates):
+        """Called on the poller thread; hops onto the Tk thread."""
+        self.after(0, lambda: self._apply_session_sample(rates))
+
+    def _apply_session_sample(self, rates):
+        for tag, label in self.session_rate_labels.items():
+            r = rates.get(tag)
+            if r and label.winfo_exists():
+                label.configure(text=f"↑ {format_bytes(r['up_rate'])}/s · ↓ {format_bytes(r['down_rate'])}/s · "
+                                     f"{format_bytes(r['up_total'] + r['down_total'])}")
+
+    def _on_session_core_event(self, kind, info):
+        """Called on the session core's supervisor thread; hops onto the Tk thread."""
+        if kind == "crashed":
+            message = f"Session core exited unexpectedly (code {info['code']}); restarting in {info['retry_in']}s..."
+        elif kind == "restarted":
+            message = "Session core restarted."
+        elif kind == "restart_failed":
+            message = (f"Session core failed to restart ({info['error'] or 'see xray_sessions_log.txt'}); "
+                       f"retrying in {info['retry_in']}s...")
+        else:
+            return
+        self.after(0, lambda: self.log(message))
+
+    def run_mux_tune(self):
+        """Benchmarks the selected server at each Mux setting and remembers the best one."""
+        if self.selected_index < 0 or self.is_pinging: return
+        threading.Thread(target=self._mux_tune_logic, daemon=True).start()
+
+    def _mux_tune_logic(self):
+        self.is_pinging = True
+        self.btn_tune_mux.configure(state="disabled", text="...")
+        self.btn_ping.configure(state="disabled")
+        self.btn_ping_all.configure(state="disabled")
+
+        cfg = self.configs[self.selected_index]
+        self.log(f"Tuning Mux for {cfg['alias']} ({len(MUX_CANDIDATES)} settings)...")
+
+        def report(result):
+            self.log(f"  {describe_mux(result['mux'])}: {result['latency_ms']} ms, "
+                     f"{result['throughput_kbps']} KB/s, {result['errors']} errors")
+
+        try:
+            tuning = tune_outbound(cfg['outbound'], profile=cfg.get('profile'), progress_cb=report)
+            if tuning:
+                cfg['mux_tuning'] = tuning
+                self.save_configs()
+                self.log(f"Best for {cfg['alias']}: {describe_mux(tuning['best'])} (applied on connect).")
+            else:
+                self.log(f"Mux tuning failed for {cfg['alias']}: no setting completed cleanly.")
+        except Exception as e:
+            self.log(f"Mux tuning exception [{cfg['alias']}]: {e}")
+        finally:
+            self.is_pinging = False
+            self.after(0, lambda: self.btn_tune_mux.configure(state="normal", text="Tune"))
+            self.after(0, self.refresh_list)
+
     def _execute_ping(self, cfg, offset=0):
         """Core method that pings a single configuration item using unique ports."""
         self.log(f"Starting Ping Test: {cfg['alias']}")
         
-        # Base ports + offset to avoid conflicts when running concurrently
-        socks_pt = 20808 + (offset * 2)
-        http_pt = 20809 + (offset * 2)
-        cfg_file = f"ping_config_{socks_pt}.json"
-        log_file = f"ping_log_{socks_pt}.txt"
-        
-        runner = XrayRunner(config_filename=cfg_file, log_filename=log_file)
-        
         try:
-            config_json = generate_xray_config(
-                cfg['outbound'], 
-                socks_port=socks_pt, 
-                http_port=http_pt, 
-                enable_mux=False  # Ping tests should always avoid Mux to prevent false negatives
-            )
-            with open(cfg_file, "w") as f:
-                f.write(config_json)
-
-            if runner.start():
-                time.sleep(2) 
-                proxies = {'http': f'http://127.0.0.1:{http_pt}', 'https': f'http://127.0.0.1:{http_pt}'}
-                start_time = time.time()
-                try:
-                    resp = requests.get("http://www.google.com/generate_204", proxies=proxies, timeout=10)
-                    latency = int((time.time() - start_time) * 1000)
-                    if resp.status_code in [200, 204]:
-                         self.log(f"Ping Success [{cfg['alias']}]: {latency}ms")
-                         cfg['last_ping'] = latency
-                    else:
-                         cfg['last_ping'] = "Fail"
-                except Exception as e:
-                    cfg['last_ping'] = "Fail"
-            else:
-                cfg['last_ping'] = "Fail"
+            record_result(cfg, ping_outbound(cfg['outbound'], offset=offset, profile=cfg.get('profile')))
+            if cfg['last_ping'] != "Fail":
+                self.log(f"Ping Success [{cfg['alias']}]: {cfg['last_ping']}ms")
         except Exception as e:
              self.log(f"Ping Exception [{cfg['alias']}]: {e}")
-             cfg['last_ping'] = "Fail"
+             record_result(cfg, "Fail")
         finally:
-            runner.stop()
-            if os.path.exists(cfg_file):
-                try: os.remove(cfg_file)
-                except: pass
-            
             cfg['is_pinging_active'] = False
             self.save_configs()
             
@@ -474,32 +1210,80 @@ class BabyVPNApp(ctk.CTk):
     def _ping_all_logic(self):
         self.is_pinging = True
         self.btn_ping.configure(state="disabled")
-        self.btn_ping_all.configure(state="disabled", text="Pinging All...")
-        
-        # Mark all as active to trigger UI
-        for cfg in self.configs:
-            cfg['is_pinging_active'] = True
-        self.after(0, self.refresh_list)
-        
+
+        configs = list(self.configs)
+        stop_after = STOP_AFTER_CHOICES.get(self.stop_after_menu.get())
+
+        def on_start(index):
+            configs[index]['is_pinging_active'] = True
+            self.schedule_refresh()
+
+        batch = PingBatch(
+            [cfg['outbound'] for cfg in configs],
+            stop_after=stop_after,
+            on_start=on_start,
+            profiles=[cfg.get('profile') for cfg in configs]
+        )
+        self.ping_batch = batch
+        self.after(0, lambda: self.btn_ping_all.configure(state="normal", text="Stop"))
+        self.log(f"Ping All: {len(configs)} servers" + (f", stopping after {stop_after} healthy." if stop_after else "."))
+
         try:
-            # Run concurrently with up to 10 workers to prevent system overload
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(self.configs), 10)) as executor:
-                futures = []
-                for i, cfg in enumerate(self.configs):
-                    futures.append(executor.submit(self._execute_ping, cfg, i))
-                
-                # Wait for all to finish
-                concurrent.futures.wait(futures)
+            # Results stream in as each core finishes; the list re-sorts live
+            for index, latency in batch:
+                cfg = configs[index]
+                record_result(cfg, latency)
+                cfg['is_pinging_active'] = False
+                if latency != "Fail":
+                    self.log(f"Ping Success [{cfg['alias']}]: {latency}ms")
+                self.schedule_refresh()
+
+            if batch.cancelled:
+                self.log(f"Ping All stopped ({batch.healthy} healthy servers found).")
+            else:
+                self.log(f"Ping All finished ({batch.healthy} healthy servers).")
+        except Exception as e:
+            self.log(f"Ping All Exception: {e}")
         finally:
+            for cfg in configs:
+                cfg['is_pinging_active'] = False
+            self.save_configs()
+            self.ping_batch = None
             self.is_pinging = False
             self.after(0, lambda: self.btn_ping_all.configure(state="normal", text="Ping All"))
             self.after(0, self.refresh_list)
 
+    def connection_profile(self, cfg):
+        """Profile picked in the sidebar, or the server's pinned one for "Server Default"."""
+        choice = self.profile_menu.get()
+        if choice == SERVER_DEFAULT_PROFILE:
+            return cfg.get('profile', DEFAULT_PROFILE)
+        return choice
+
+    def pin_profile(self):
+        """Stores the sidebar's profile as the selected server's default."""
+        if self.selected_index < 0: return
+
+        cfg = self.configs[self.selected_index]
+        choice = self.profile_menu.get()
+        if choice == SERVER_DEFAULT_PROFILE:
+            cfg.pop('profile', None)
+            self.log(f"Profile for {cfg['alias']} reset to {DEFAULT_PROFILE}.")
+        else:
+            cfg['profile'] = choice
+            self.log(f"Profile for {cfg['alias']} set to {choice}.")
+        self.save_configs()
 
     def toggle_connection(self):
-        if self.is_connected:
+        state = self.connection.state
+        if state == CONNECTED:
             self.disconnect()
-        else:
+        elif state in (STARTING, VERIFYING):
+            # Second click while connecting aborts the attempt
+            if self.connection.cancel():
+                self.log("Cancelling connect...")
+                self.btn_connect.configure(state="disabled", text="Cancelling...")
+        elif state == IDLE:
             self.connect()
 
     def connect(self):
@@ -507,66 +1291,179 @@ class BabyVPNApp(ctk.CTk):
         
         cfg = self.configs[self.selected_index]
         self.log(f"Connecting to {cfg['alias']}...")
-        
-        self.btn_connect.configure(state="disabled", text="Connecting...")
 
         try:
             # Generate config for MAIN instance
-            config_json = generate_xray_config(cfg['outbound'], enable_mux=self.mux_switch.get())
-            with open("config.json", "w") as f:
-                f.write(config_json)
-
-            if self.xray_main.start():
-                self.log("Core Started successfully.")
-                time.sleep(1) # Let core bind ports
-                set_system_proxy(True)
-                self.log("System Windows Proxy enabled.")
-                
-                self.is_connected = True
-                
-                # Update UI
-                self.btn_connect.configure(
-                    state="normal", text="Disconnect", 
-                    fg_color="#ff4444", hover_color="#cc0000"
-                )
-                self.mux_switch.configure(state="disabled")
-                self.status_dot.configure(text_color="#00ff00")
-                self.status_label.configure(text="Connected")
-                self.log(f"VPN Active: {cfg['alias']}")
-                
-                self.refresh_list() # Redraw to show green active card
+            profile = self.connection_profile(cfg)
+            self.log(f"Performance profile: {profile}")
+
+            # A tuned server brings its own Mux choice; otherwise follow the switch
+            tuning = cfg.get('mux_tuning')
+            if tuning:
+                enable_mux, mux_settings = tuning['best'] is not None, tuning['best']
+                self.log(f"Using tuned {describe_mux(mux_settings)}.")
             else:
-                self.log("Error: Failed to start Xray core.")
-                self.btn_connect.configure(state="normal", text="Connect")
-                self.mux_switch.configure(state="normal")
+                enable_mux, mux_settings = self.mux_switch.get(), None
+
+            config_json = generate_xray_config(
+                cfg['outbound'], enable_mux=enable_mux, profile=profile, mux_settings=mux_settings,
+                stats_port=self.settings.get("stats_port"), bypass=self.bypass,
+                dns_preset=self.settings["dns_preset"], **self.dns_options()
+            )
+            self.pac_active = bool(self.pac_switch.get())
+            if self.pac_active:
+                self._prepare_pac()
+                self.log(f"PAC mode: {self.pac_server.url}")
         except Exception as e:
             self.log(f"Connection Exception: {e}")
-            self.btn_connect.configure(state="normal", text="Connect")
+            return
+
+        self.connecting_alias = cfg['alias']
+        self.connected_cfg = cfg
+        if self.connection.connect(config_json):
+            self.btn_connect.configure(text="Cancel", fg_color="#444", hover_color="#555")
+            self.mux_switch.configure(state="disabled")
+            self.profile_menu.configure(state="disabled")
+            self.pac_switch.configure(state="disabled")
+            self.status_dot.configure(text_color="#ffaa00")
+            self.status_label.configure(text="Connecting...")
+
+    def disconnect(self, on_done=None):
+        if self.connection.disconnect(on_done=on_done):
+            self.btn_connect.configure(state="disabled", text="Disconnecting...")
+
+    def _on_connection_event(self, state, message):
+        """Called on the worker thread by ConnectionManager; hops onto the Tk thread."""
+        self.after(0, lambda: self._apply_connection_state(state, message))
+
+    def _apply_connection_state(self, state, message):
+        if message:
+            self.log(message)
+
+        if state in (STARTING, VERIFYING):
+            self.status_label.configure(text="Starting..." if state == STARTING else "Verifying...")
+        elif state == STOPPING:
+            self.status_dot.configure(text_color="#ffaa00")
+            self.status_label.configure(text="Disconnecting...")
+        elif state == CONNECTED:
+            self.is_connected = True
+            self.btn_connect.configure(
+                state="normal", text="Disconnect", 
+                fg_color="#ff4444", hover_color="#cc0000"
+            )
+            self.status_dot.configure(text_color="#00ff00")
+            self.status_label.configure(text="Connected")
+            self.log(f"VPN Active: {self.connecting_alias}")
+            self.xray_main.supervise(self._on_core_event)
+            if self.settings.get("stats_port"):
+                self.traffic = TrafficPoller(self._on_traffic_sample, port=self.settings["stats_port"])
+                self.traffic.start()
+            self.refresh_list() # Redraw to show green active card
+        elif state == IDLE:
+            was_connected = self.is_connected
+            self.is_connected = False
+            self.btn_connect.configure(
+                state="normal", text="Connect", fg_color=["#3B8ED0", "#1F6AA5"], hover_color=["#36719F", "#144870"]
+            )
             self.mux_switch.configure(state="normal")
+            self.profile_menu.configure(state="normal")
+            self.pac_switch.configure(state="normal")
+            self.status_dot.configure(text_color="gray")
+            self.status_label.configure(text="Disconnected")
+            self.core_stats_label.configure(text="")
+            self.traffic_label.configure(text="")
+            if self.traffic:
+                self.traffic.stop()
+                self.traffic = None
+            if was_connected:
+                self.log("VPN Disconnected.")
+                self.save_configs()  # Persist the server's traffic totals
+            self.connected_cfg = None
+            self.refresh_list()
 
-    def disconnect(self):
-        self.log("Disconnecting...")
-        set_system_proxy(False)
-        self.xray_main.stop()
-        self.is_connected = False
-        
-        # Update UI
-        self.btn_connect.configure(
-            text="Connect", fg_color=["#3B8ED0", "#1F6AA5"], hover_color=["#36719F", "#144870"]
-        )
-        self.mux_switch.configure(state="normal")
-        self.status_dot.configure(text_color="gray")
-        self.status_label.configure(text="Disconnected")
-        self.log("VPN Disconnected.")
-        
-        self.refresh_list()
+    def _on_core_event(self, kind, info):
+        """Called on the supervisor thread; hops onto the Tk thread."""
+        self.after(0, lambda: self._apply_core_event(kind, info))
+
+    def _apply_core_event(self, kind, info):
+        if not self.is_connected:
+            return
+        if kind == "sample":
+            self.core_stats_label.configure(
+                text=f"RAM {info['rss'] // (1024 * 1024)} MB · CPU {info['cpu_percent']:.0f}% · "
+                     f"{info['handles']} handles"
+                     + (f" · {info['restarts']} restarts" if info['restarts'] else "")
+            )
+        elif kind == "crashed":
+            self.log(f"Xray core exited unexpectedly (code {info['code']}); restarting in {info['retry_in']}s...")
+            self.status_dot.configure(text_color="#ffaa00")
+            self.status_label.configure(text="Restarting...")
+        elif kind == "restarted":
+            self.log(f"Xray core restarted (restart #{info['restarts']}).")
+            self.status_dot.configure(text_color="#00ff00")
+            self.status_label.configure(text="Connected")
+        elif kind == "restart_failed":
+            self.log(f"Xray core failed to restart ({info['error'] or 'see xray_log.txt'}); "
+                     f"retrying in {info['retry_in']}s...")
+        elif kind == "memory_growth":
+            self.log(f"Warning: Xray memory grew from {info['baseline'] // (1024 * 1024)} MB "
+                     f"to {info['rss'] // (1024 * 1024)} MB this session.")
+
+    def _on_traffic_sample(self, sample):
+        """Called on the poller thread; hops onto the Tk thread."""
+        self.after(0, lambda: self._apply_traffic_sample(sample))
+
+    def _apply_traffic_sample(self, sample):
+        cfg = self.connected_cfg
+        if not self.is_connected or cfg is None:
+            return
+        # Lifetime bytes per server, kept on the server record
+        cfg['bytes_up'] = cfg.get('bytes_up', 0) + sample['up_delta']
+        cfg['bytes_down'] = cfg.get('bytes_down', 0) + sample['down_delta']
+        self.traffic_label.configure(
+            text=f"↑ {format_bytes(sample['up_rate'])}/s · ↓ {format_bytes(sample['down_rate'])}/s\n"
+                 f"Session {format_bytes(sample['up_total'] + sample['down_total'])} · "
+                 f"Server {format_bytes(cfg['bytes_up'] + cfg['bytes_down'])}"
+        )
 
     def on_closing(self):
         self.log("Shutting down...")
-        if self.is_connected:
-            set_system_proxy(False)
+        self.withdraw()
+        state = self.connection.state
+        if state == CONNECTED:
+            # Finish closing once the background teardown has reset the proxy
+            self.disconnect(on_done=lambda: self.after(0, self._finish_closing))
+            return
+        if state != IDLE:
+            # Connecting (the proxy may already be set) or already stopping: the worker is
+            # a daemon thread, so let its teardown run before the process exits
+            self.connection.cancel()
+            def wait_for_worker():
+                self.connection.join(CLOSE_TIMEOUT)
+                self.after(0, self._finish_closing)
+            threading.Thread(target=wait_for_worker, daemon=True).start()
+            return
+        self._finish_closing()
+
+    def _finish_closing(self):
+        # Backstop: never leave the system proxy pointing at a core that is about to exit,
+        # but only touch it if this session set it (or a connect may still be setting it)
+        if self._proxy_owned or self.connection.busy:
+            try: self._set_proxy(False)
+            except Exception as e: print(f"Failed to reset proxy: {e}")
+        self.reprobe.stop()
+        if self.traffic:
+            self.traffic.stop()
         self.xray_main.stop()
         self.xray_ping.stop()
+        self.pac_server.stop()
+        self.session_core.stop()
+        CORE_REGISTRY.flush()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        if self.settings.get("metrics_dump"):
+            try: metrics.REGISTRY.dump_json(self.settings["metrics_dump"])
+            except Exception as e: print(f"Failed to dump metrics: {e}")
         self.destroy()
 
 if __name__ == "__main__":
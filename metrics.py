@@ -0,0 +1,193 @@
+import bisect
+import contextlib
+import http.server
+import json
+import threading
+import time
+
+# --- Hot-path Instrumentation ---
+
+# Seconds; tuned for the span between a config write (~ms) and a ping timeout (~10 s)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative histogram with Prometheus-style buckets. Thread-safe."""
+    def __init__(self, name, labels=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return {
+            "labels": self.labels,
+            "count": count,
+            "sum": total,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+        }
+
+class MetricsRegistry:
+    """Holds every histogram and gauge by (name, labels); renders Prometheus text or JSON."""
+    def __init__(self):
+        self.help = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def histogram(self, name, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram(name, labels))
+                if help_text:
+                    self.help.setdefault(name, help_text)
+        return hist
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def timed(self, name, **labels):
+        """Context manager / decorator that records elapsed seconds into a histogram."""
+        return _Timer(self, name, labels)
+
+    def to_dict(self):
+        with self._lock:
+            items = sorted(self._histograms.items())
+            gauges = sorted(self._gauges.items())
+        result = {}
+        for (name, _), hist in items:
+            result.setdefault(name, []).append(hist.snapshot())
+        for (name, labels), value in gauges:
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def to_prometheus(self):
+        lines = []
+        for name, series in self.to_dict().items():
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            if "value" in series[0]:
+                lines.append(f"# TYPE {name} gauge")
+                for snap in series:
+                    labels = ",".join(f'{k}="{v}"' for k, v in snap["labels"].items())
+                    lines.append(f"{name}{{{labels}}} {snap['value']}" if labels else f"{name} {snap['value']}")
+                continue
+            lines.append(f"# TYPE {name} histogram")
+            for snap in series:
+                base = [f'{k}="{v}"' for k, v in snap["labels"].items()]
+                for le, count in snap["buckets"].items():
+                    bucket_labels = ",".join(base + ['le="%s"' % le])
+                    lines.append(f"{name}_bucket{{{bucket_labels}}} {count}")
+                suffix = f"{{{','.join(base)}}}" if base else ""
+                lines.append(f"{name}_sum{suffix} {snap['sum']}")
+                lines.append(f"{name}_count{suffix} {snap['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+class _Timer(contextlib.ContextDecorator):
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # As a decorator, each call gets its own timer; a shared start time would be
+        # overwritten by overlapping calls (e.g. Ping All's parallel core starts)
+        return _Timer(self.registry, self.name, self.labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self._start, **self.labels)
+        return False
+
+REGISTRY = MetricsRegistry()
+
+def timed(name, **labels):
+    return REGISTRY.timed(name, **labels)
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set_gauge(name, value, **labels)
+
+def describe(name, help_text):
+    REGISTRY.help.setdefault(name, help_text)
+
+describe("babyvpn_xray_start_seconds", "Time spent spawning an Xray core.")
+describe("babyvpn_xray_stop_seconds", "Time spent tearing down an Xray core.")
+describe("babyvpn_config_generate_seconds", "Time spent building an Xray config.")
+describe("babyvpn_config_assemble_seconds", "Time spent assembling a multi-server Xray config.")
+describe("babyvpn_ping_stage_seconds", "Time spent in each stage of a ping test.")
+describe("babyvpn_ping_latency_seconds", "Probe latency of ping tests, by result.")
+describe("babyvpn_dns_lookup_seconds", "Median cold DNS lookup through a ping core, by preset.")
+describe("babyvpn_connect_stage_seconds", "Time spent in each stage of connect/disconnect.")
+describe("babyvpn_xray_rss_bytes", "Resident memory of a supervised Xray core.")
+describe("babyvpn_xray_cpu_percent", "CPU usage of a supervised Xray core.")
+describe("babyvpn_xray_handles", "Open handles (Windows) or file descriptors of a supervised Xray core.")
+describe("babyvpn_xray_restarts", "Crash restarts of a supervised Xray core this session.")
+describe("babyvpn_traffic_bytes_per_second", "Live throughput of the connected proxy outbound.")
+describe("babyvpn_save_configs_seconds", "Time spent writing servers.json.")
+describe("babyvpn_ui_refresh_seconds", "Time spent redrawing the server list.")
+
+# --- Local Endpoint ---
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.registry.to_prometheus().encode()
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(self.registry.to_dict()).encode()
+            ctype = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serves /metrics (Prometheus text) and /metrics.json on a daemon thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics endpoint listening on http://{host}:{server.server_address[1]}/metrics")
+    return server
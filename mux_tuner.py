@@ -0,0 +1,109 @@
+import concurrent.futures
+import statistics
+import time
+import requests
+from utils import generate_xray_config
+from xray_runner import XrayRunner
+from pinger import PING_URL, CORE_STARTUP_DELAY
+
+# --- Mux Auto-Tuning ---
+
+# Dedicated port range so a tune can run next to the main core and ping cores
+TUNE_BASE_PORT = 20700
+
+THROUGHPUT_URL = "https://speed.cloudflare.com/__down?bytes=1000000"
+PARALLEL_REQUESTS = 8
+REQUEST_TIMEOUT = 15
+
+# None = Mux off. xudpConcurrency -1 keeps UDP out of the mux (xudp off).
+MUX_CANDIDATES = [None] + [
+    {"concurrency": c, "xudpConcurrency": x}
+    for c in (4, 8, 16)
+    for x in (16, -1)
+]
+
+def describe_mux(mux):
+    """Short human label for a candidate, e.g. "Mux 8 + xudp"."""
+    if not mux:
+        return "Mux off"
+    return f"Mux {mux['concurrency']}" + (" + xudp" if mux.get("xudpConcurrency", 0) >= 0 else "")
+
+def _fetch(url, proxies, timeout):
+    start = time.perf_counter()
+    resp = requests.get(url, proxies=proxies, timeout=timeout)
+    resp.raise_for_status()
+    return time.perf_counter() - start, len(resp.content)
+
+def run_workload(http_port, latency_url=PING_URL, throughput_url=THROUGHPUT_URL,
+                 parallel=PARALLEL_REQUESTS, timeout=REQUEST_TIMEOUT):
+    """Fires `parallel` latency probes and downloads at once through the local HTTP inbound."""
+    proxies = {'http': f'http://127.0.0.1:{http_port}', 'https': f'http://127.0.0.1:{http_port}'}
+    latencies = []
+    total_bytes = 0
+    errors = 0
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel * 2) as executor:
+        probes = [executor.submit(_fetch, latency_url, proxies, timeout) for _ in range(parallel)]
+        downloads = [executor.submit(_fetch, throughput_url, proxies, timeout) for _ in range(parallel)] if throughput_url else []
+        for f in probes:
+            try: latencies.append(f.result()[0])
+            except Exception: errors += 1
+        for f in downloads:
+            try: total_bytes += f.result()[1]
+            except Exception: errors += 1
+    wall = time.perf_counter() - start
+
+    return {
+        "latency_ms": int(statistics.median(latencies) * 1000) if latencies else None,
+        "throughput_kbps": int(total_bytes / wall / 1024) if total_bytes else 0,
+        "errors": errors,
+    }
+
+def pick_best(results):
+    """Highest throughput among error-free runs, lowest latency as the tie-breaker."""
+    clean = [r for r in results if r["errors"] == 0 and r["latency_ms"] is not None]
+    if not clean:
+        return None
+    return max(clean, key=lambda r: (r["throughput_kbps"], -r["latency_ms"]))
+
+def tune_outbound(outbound, candidates=MUX_CANDIDATES, latency_url=PING_URL, throughput_url=THROUGHPUT_URL,
+                  parallel=PARALLEL_REQUESTS, profile=None, xray_path=None,
+                  startup_delay=CORE_STARTUP_DELAY, progress_cb=None):
+    """
+    Runs the workload through the outbound once per mux candidate.
+    Returns {"best": <mux settings or None>, "results": [...], "tested_at": ts},
+    or None when no candidate completed cleanly.
+    """
+    results = []
+    for i, mux in enumerate(candidates):
+        # Fresh ports per candidate so the previous core never holds them
+        socks_pt = TUNE_BASE_PORT + (i * 2)
+        http_pt = socks_pt + 1
+        runner = XrayRunner(config_filename="tune_config.json", log_filename=None, xray_path=xray_path)
+        config_json = generate_xray_config(
+            outbound,
+            socks_port=socks_pt,
+            http_port=http_pt,
+            enable_mux=mux is not None,
+            profile=profile,
+            mux_settings=mux
+        )
+        try:
+            if runner.start(config_json):
+                time.sleep(startup_delay)
+                stats = run_workload(http_pt, latency_url, throughput_url, parallel)
+            else:
+                stats = {"latency_ms": None, "throughput_kbps": 0, "errors": parallel}
+        finally:
+            runner.stop()
+
+        result = {"mux": mux, **stats}
+        results.append(result)
+        if progress_cb:
+            progress_cb(result)
+
+    best = pick_best(results)
+    if best is None:
+        return None
+    return {"best": best["mux"], "results": results, "tested_at": int(time.time())}
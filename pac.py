@@ -0,0 +1,164 @@
+import hashlib
+import http.server
+import ipaddress
+import json
+import threading
+
+# --- PAC Mode ---
+
+PAC_PORT = 10810
+PAC_PATH = "/proxy.pac"
+
+# Rule tables are JS objects so every lookup is a hash probe:
+#   domains   walk the host's suffixes (a.b.example.com -> b.example.com -> example.com)
+#   networks  one probe per distinct prefix length, on the masked IPv4 literal
+#   keywords  the only linear scan; lists are short after dedupe
+PAC_TEMPLATE = """// Generated by BabyVPN. Rules: {rule_count}
+var PROXY = {proxy};
+var DEFAULT = {default};
+var DIRECT_DOMAINS = {direct_domains};
+var PROXY_DOMAINS = {proxy_domains};
+var DIRECT_KEYWORDS = {direct_keywords};
+var PROXY_KEYWORDS = {proxy_keywords};
+var DIRECT_NETS = {direct_nets};
+var PROXY_NETS = {proxy_nets};
+var hasOwn = Object.prototype.hasOwnProperty;
+var IPV4 = /^\\d{{1,3}}\\.\\d{{1,3}}\\.\\d{{1,3}}\\.\\d{{1,3}}$/;
+
+function suffixMatch(table, host) {{
+    var d = host;
+    while (true) {{
+        if (hasOwn.call(table, d)) return true;
+        var i = d.indexOf(".");
+        if (i < 0) return false;
+        d = d.substring(i + 1);
+    }}
+}}
+
+function keywordMatch(list, host) {{
+    for (var i = 0; i < list.length; i++) {{
+        if (host.indexOf(list[i]) >= 0) return true;
+    }}
+    return false;
+}}
+
+function netMatch(table, ip) {{
+    for (var len in table) {{
+        var mask = len == 0 ? 0 : (~0 << (32 - len)) >>> 0;
+        if (hasOwn.call(table[len], (ip & mask) >>> 0)) return true;
+    }}
+    return false;
+}}
+
+function FindProxyForURL(url, host) {{
+    host = host.toLowerCase();
+    if (isPlainHostName(host)) return "DIRECT";
+    if (IPV4.test(host)) {{
+        var p = host.split(".");
+        var ip = ((p[0] << 24) | (p[1] << 16) | (p[2] << 8) | p[3]) >>> 0;
+        if (netMatch(DIRECT_NETS, ip)) return "DIRECT";
+        if (netMatch(PROXY_NETS, ip)) return PROXY;
+        return DEFAULT;
+    }}
+    if (suffixMatch(DIRECT_DOMAINS, host) || keywordMatch(DIRECT_KEYWORDS, host)) return "DIRECT";
+    if (suffixMatch(PROXY_DOMAINS, host) || keywordMatch(PROXY_KEYWORDS, host)) return PROXY;
+    return DEFAULT;
+}}
+"""
+
+def _tables(compiled):
+    """Splits a routing.compile_bypass() result into PAC lookup tables (IPv4 nets only)."""
+    domains, keywords, nets = {}, [], {}
+    for entry in (compiled or {}).get("domain", ()):
+        kind, _, value = entry.partition(":")
+        if kind == "domain":
+            domains[value] = 1
+        elif kind == "keyword":
+            keywords.append(value)
+    for entry in (compiled or {}).get("ip", ()):
+        try:
+            net = ipaddress.ip_network(entry)
+        except ValueError:
+            continue  # geoip: lists can't be evaluated in a PAC script
+        if net.version == 4:
+            nets.setdefault(str(net.prefixlen), {})[str(int(net.network_address))] = 1
+    return domains, keywords, nets
+
+def _js(value):
+    return json.dumps(value, separators=(",", ":"))
+
+def generate_pac(proxy_rules, direct_rules=None, http_port=10809, default_proxy=False):
+    """
+    Builds a PAC script. Hosts matching direct_rules go DIRECT, then proxy_rules go through
+    the local HTTP inbound, and everything else follows default_proxy.
+    Both rule sets are routing.compile_bypass() results.
+    """
+    proxy = f"PROXY 127.0.0.1:{http_port}"
+    direct_domains, direct_keywords, direct_nets = _tables(direct_rules)
+    proxy_domains, proxy_keywords, proxy_nets = _tables(proxy_rules)
+    rule_count = (len(direct_domains) + len(direct_keywords) + sum(map(len, direct_nets.values()))
+                  + len(proxy_domains) + len(proxy_keywords) + sum(map(len, proxy_nets.values())))
+    return PAC_TEMPLATE.format(
+        rule_count=rule_count,
+        proxy=_js(proxy),
+        default=_js(proxy if default_proxy else "DIRECT"),
+        direct_domains=_js(direct_domains),
+        proxy_domains=_js(proxy_domains),
+        direct_keywords=_js(direct_keywords),
+        proxy_keywords=_js(proxy_keywords),
+        direct_nets=_js(direct_nets),
+        proxy_nets=_js(proxy_nets),
+    )
+
+class _PacHandler(http.server.BaseHTTPRequestHandler):
+    pac_server = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != PAC_PATH:
+            self.send_error(404)
+            return
+        body = self.pac_server.script.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ns-proxy-autoconfig")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class PacServer:
+    """Serves the current PAC script on 127.0.0.1; update() swaps it without a restart."""
+    def __init__(self, port=PAC_PORT, host="127.0.0.1"):
+        self.host = host
+        self.port = port
+        self.script = ""
+        self._server = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    @property
+    def url(self):
+        """PAC URL with a content hash, so re-setting it makes clients fetch a changed script."""
+        digest = hashlib.sha1(self.script.encode("utf-8")).hexdigest()[:10]
+        return f"http://{self.host}:{self.port}{PAC_PATH}?v={digest}"
+
+    def update(self, script):
+        self.script = script
+
+    def start(self):
+        if self._server: return
+        handler = type("PacHandler", (_PacHandler,), {"pac_server": self})
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"PAC file served at http://{self.host}:{self.port}{PAC_PATH}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,273 @@
+import concurrent.futures
+import statistics
+import threading
+import time
+import requests
+from utils import generate_xray_config
+from dns_config import DNS_PRESETS, resolve_via
+from udp_probe import probe_udp, UDP_TARGET, UDP_BURST
+from xray_runner import XrayRunner
+from metrics import timed, observe
+
+# --- Ping Test Settings ---
+PING_URL = "http://www.google.com/generate_204"
+PING_BASE_PORT = 20808
+PING_TIMEOUT = 10
+CORE_STARTUP_DELAY = 2  # Seconds to let the ping core bind its ports
+MAX_PING_WORKERS = 10   # Concurrent ping cores, to prevent system overload
+
+def ping_ports(offset=0, base_port=PING_BASE_PORT):
+    """Returns the (socks, http) port pair used by the ping core at this offset."""
+    socks_pt = base_port + (offset * 2)
+    return socks_pt, socks_pt + 1
+
+def record_result(cfg, latency):
+    """Stores a ping result on a server entry, stamped for staleness tracking."""
+    cfg['last_ping'] = latency
+    cfg['last_ping_at'] = int(time.time())
+
+def ping_sort_key(cfg):
+    """Fastest first, then failures, then servers that were never tested."""
+    last_ping = cfg.get('last_ping')
+    if isinstance(last_ping, int):
+        return (0, last_ping)
+    if last_ping == "Fail":
+        return (1, 0)
+    return (2, 0)
+
+def probe_http(http_port, test_url=PING_URL, timeout=PING_TIMEOUT):
+    """Fetches test_url through the local HTTP inbound; returns latency in ms or "Fail"."""
+    proxies = {'http': f'http://127.0.0.1:{http_port}', 'https': f'http://127.0.0.1:{http_port}'}
+    start_time = time.time()
+    try:
+        resp = requests.get(test_url, proxies=proxies, timeout=timeout)
+        latency = int((time.time() - start_time) * 1000)
+        if resp.status_code in [200, 204]:
+            return latency
+    except Exception:
+        pass
+    return "Fail"
+
+def ping_outbound(outbound, offset=0, test_url=PING_URL, timeout=PING_TIMEOUT,
+                  startup_delay=CORE_STARTUP_DELAY, xray_path=None, profile=None,
+                  cancel_event=None, active_runners=None, base_port=PING_BASE_PORT):
+    """
+    Starts a throwaway Xray core for a single outbound and measures an HTTP probe through it.
+    Returns the latency in ms, "Fail", or None if cancel_event was set before a result came in.
+    active_runners (a set) lets a caller stop in-flight cores from another thread.
+    """
+    # Base ports + offset to avoid conflicts when running concurrently
+    socks_pt, http_pt = ping_ports(offset, base_port)
+
+    # Config goes in over stdin and the core's output is discarded: no files per ping
+    runner = XrayRunner(config_filename=f"ping_config_{socks_pt}.json", log_filename=None, xray_path=xray_path)
+
+    if active_runners is not None:
+        active_runners.add(runner)
+
+    try:
+        with timed("babyvpn_ping_stage_seconds", stage="build_config"):
+            config_json = generate_xray_config(
+                outbound,
+                socks_port=socks_pt,
+                http_port=http_pt,
+                enable_mux=False,  # Ping tests should always avoid Mux to prevent false negatives
+                profile=profile
+            )
+
+        with timed("babyvpn_ping_stage_seconds", stage="spawn"):
+            started = runner.start(config_json)
+        if not started:
+            return "Fail"
+
+        with timed("babyvpn_ping_stage_seconds", stage="startup_wait"):
+            if cancel_event is None:
+                time.sleep(startup_delay)
+            elif cancel_event.wait(startup_delay):
+                return None
+
+        start_time = time.perf_counter()
+        latency = probe_http(http_pt, test_url, timeout)
+        elapsed = time.perf_counter() - start_time
+        if cancel_event is not None and cancel_event.is_set():
+            return None  # The core was torn down under us; the failure isn't real
+        observe("babyvpn_ping_stage_seconds", elapsed, stage="probe")
+        observe("babyvpn_ping_latency_seconds", elapsed, result="fail" if latency == "Fail" else "ok")
+        return latency
+    finally:
+        with timed("babyvpn_ping_stage_seconds", stage="teardown"):
+            runner.stop()
+        if active_runners is not None:
+            active_runners.discard(runner)
+
+class PingBatch:
+    """
+    Pings many outbounds concurrently and streams results as they complete.
+
+        batch = PingBatch(outbounds, stop_after=5)
+        for index, latency in batch:   # completion order, not input order
+            ...
+        batch.cancel()                 # from any thread; in-flight cores are stopped at once
+
+    stop_after=K cancels the rest of the sweep once K servers answered successfully.
+    on_start(index) is called from the worker thread when a server's test begins.
+    profiles optionally gives a performance profile per outbound.
+    """
+    def __init__(self, outbounds, max_workers=MAX_PING_WORKERS, stop_after=None, on_start=None,
+                 profiles=None, **ping_kwargs):
+        self.outbounds = list(outbounds)
+        self.profiles = list(profiles) if profiles else [None] * len(self.outbounds)
+        self.max_workers = max(1, min(len(self.outbounds), max_workers))
+        self.stop_after = stop_after
+        self.on_start = on_start
+        self.ping_kwargs = ping_kwargs
+        self.healthy = 0
+        self._cancel = threading.Event()
+        self._active = set()
+        self._futures = []
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Stops the sweep: drops queued servers and tears down every running ping core."""
+        self._cancel.set()
+        for f in self._futures:
+            f.cancel()
+        # Teardown waits for each core to exit, so keep it off the caller's (UI) thread
+        def stop_all():
+            for runner in list(self._active):
+                try: runner.stop()
+                except Exception: pass
+        threading.Thread(target=stop_all, daemon=True).start()
+
+    def _run(self, index):
+        if self._cancel.is_set():
+            return None
+        if self.on_start:
+            self.on_start(index)
+        return ping_outbound(
+            self.outbounds[index], offset=index, profile=self.profiles[index],
+            cancel_event=self._cancel, active_runners=self._active,
+            **self.ping_kwargs
+        )
+
+    def __iter__(self):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_index = {executor.submit(self._run, i): i for i in range(len(self.outbounds))}
+            self._futures = list(future_index)
+            for future in concurrent.futures.as_completed(future_index):
+                if future.cancelled():
+                    continue
+                try:
+                    latency = future.result()
+                except Exception:
+                    latency = "Fail"
+                if latency is None:
+                    continue
+                yield future_index[future], latency
+
+                if latency != "Fail":
+                    self.healthy += 1
+                    if self.stop_after and self.healthy >= self.stop_after and not self.cancelled:
+                        self.cancel()
+
+# --- DNS Timing ---
+
+# Each preset's core gets socks, http and DNS ports: base + i*3 .. base + i*3 + 2
+DNS_TEST_BASE_PORT = 20740
+DNS_TEST_NAMES = ["www.google.com", "www.wikipedia.org", "www.cloudflare.com", "github.com"]
+DNS_TIMEOUT = 5
+
+def time_lookups(dns_port, names=DNS_TEST_NAMES, timeout=DNS_TIMEOUT):
+    """
+    Resolves each name once (cold), then the first name again (served from the core's cache).
+    Returns {"cold_ms": median, "cached_ms": ms, "failures": n}; times are None if nothing resolved.
+    """
+    cold, failures = [], 0
+    for name in names:
+        start = time.perf_counter()
+        try:
+            ok = resolve_via(dns_port, name, timeout)
+        except OSError:
+            ok = False
+        if ok:
+            cold.append(time.perf_counter() - start)
+        else:
+            failures += 1
+
+    cached = None
+    if cold:
+        start = time.perf_counter()
+        try:
+            if resolve_via(dns_port, names[0], timeout):
+                cached = int((time.perf_counter() - start) * 1000)
+        except OSError:
+            pass
+    return {
+        "cold_ms": int(statistics.median(cold) * 1000) if cold else None,
+        "cached_ms": cached,
+        "failures": failures,
+    }
+
+def time_dns_presets(outbound, presets=None, names=DNS_TEST_NAMES, startup_delay=CORE_STARTUP_DELAY,
+                     xray_path=None, profile=None, base_port=DNS_TEST_BASE_PORT, **config_kwargs):
+    """
+    Measures DNS resolution through the outbound under each preset, one core per preset in parallel.
+    Returns {preset: time_lookups() result}. Extra kwargs (dns_domain_servers, ...) go to the config.
+    """
+    presets = list(presets or DNS_PRESETS)
+
+    def run(i, preset):
+        socks_pt = base_port + i * 3
+        runner = XrayRunner(config_filename=f"dns_config_{socks_pt}.json", log_filename=None, xray_path=xray_path)
+        config_json = generate_xray_config(
+            outbound, socks_port=socks_pt, http_port=socks_pt + 1, profile=profile,
+            dns_preset=preset, dns_port=socks_pt + 2, **config_kwargs
+        )
+        try:
+            if not runner.start(config_json):
+                return {"cold_ms": None, "cached_ms": None, "failures": len(names)}
+            time.sleep(startup_delay)
+            result = time_lookups(socks_pt + 2, names)
+        finally:
+            runner.stop()
+        if result["cold_ms"] is not None:
+            observe("babyvpn_dns_lookup_seconds", result["cold_ms"] / 1000, preset=preset)
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(presets) or 1) as executor:
+        futures = {preset: executor.submit(run, i, preset) for i, preset in enumerate(presets)}
+        return {preset: f.result() for preset, f in futures.items()}
+
+# --- UDP Path Test ---
+
+UDP_TEST_BASE_PORT = 20760
+
+def udp_test_outbound(outbound, offset=0, target=UDP_TARGET, count=UDP_BURST,
+                      startup_delay=CORE_STARTUP_DELAY, xray_path=None, profile=None,
+                      base_port=UDP_TEST_BASE_PORT):
+    """
+    Starts a throwaway core and sends a UDP burst to target through its SOCKS inbound.
+    Returns {"rtt_ms", "loss", "sent", "received", "tested_at"}; loss is 1.0 when the
+    core or the UDP association failed.
+    """
+    if count < 1:  # Checked before a core is spawned for nothing
+        raise ValueError(f"UDP burst needs at least one datagram, got count={count}")
+    socks_pt, http_pt = ping_ports(offset, base_port)
+    runner = XrayRunner(config_filename=f"udp_config_{socks_pt}.json", log_filename=None, xray_path=xray_path)
+    config_json = generate_xray_config(outbound, socks_port=socks_pt, http_port=http_pt, profile=profile)
+    result = None
+    try:
+        if runner.start(config_json):
+            time.sleep(startup_delay)
+            with timed("babyvpn_ping_stage_seconds", stage="udp_probe"):
+                result = probe_udp(socks_pt, target, count)
+    finally:
+        runner.stop()
+
+    if result is None:
+        result = {"rtt_ms": None, "loss": 1.0, "sent": count, "received": 0}
+    result["tested_at"] = int(time.time())
+    return result
@@ -0,0 +1,106 @@
+import functools
+import ipaddress
+
+# --- Direct-Routing Bypass Rules ---
+
+# Loopback, LAN and link-local never go through the proxy
+DEFAULT_BYPASS_CIDRS = [
+    "127.0.0.0/8", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "169.254.0.0/16",
+    "::1/128", "fc00::/7", "fe80::/10",
+]
+DEFAULT_BYPASS_DOMAINS = ["localhost"]
+
+# Largest number of wildcard patterns one IPv4 CIDR may expand to in ProxyOverride
+MAX_OVERRIDE_EXPANSION = 256
+
+def collapse_cidrs(cidrs):
+    """Parses CIDRs/addresses and merges overlapping or adjacent ones. Returns (networks, invalid)."""
+    v4, v6, invalid = [], [], []
+    for entry in cidrs:
+        try:
+            net = ipaddress.ip_network(entry.strip(), strict=False)
+        except ValueError:
+            invalid.append(entry)
+            continue
+        (v4 if net.version == 4 else v6).append(net)
+    return list(ipaddress.collapse_addresses(v4)) + list(ipaddress.collapse_addresses(v6)), invalid
+
+def normalize_domain(entry):
+    return entry.strip().lower().lstrip("*").strip(".")
+
+def dedupe_domains(domains, keywords=()):
+    """
+    Drops duplicates, subdomains of another listed suffix, and domains a keyword already covers.
+    Returns the surviving suffixes in sorted order.
+    """
+    kept = set()
+    # Shortest first, so parents are in place before their subdomains are checked
+    for domain in sorted({normalize_domain(d) for d in domains if normalize_domain(d)}, key=len):
+        if any(k in domain for k in keywords):
+            continue
+        labels = domain.split(".")
+        if any(".".join(labels[i:]) in kept for i in range(1, len(labels))):
+            continue
+        kept.add(domain)
+    return sorted(kept)
+
+def dedupe_keywords(keywords):
+    """Drops duplicates and keywords that contain another keyword."""
+    unique = sorted({k.strip().lower() for k in keywords if k.strip()}, key=len)
+    kept = []
+    for k in unique:
+        if not any(other in k for other in kept):
+            kept.append(k)
+    return sorted(kept)
+
+def _override_patterns(net):
+    """Wildcard patterns for ProxyOverride, which has no CIDR syntax. Empty if too broad to expand."""
+    if net.version == 6:
+        return [f"[{net.network_address}]"] if net.prefixlen == 128 else []
+    octets = -(-net.prefixlen // 8)  # Round up to whole octets
+    if octets == 0 or 2 ** (octets * 8 - net.prefixlen) > MAX_OVERRIDE_EXPANSION:
+        return []
+    patterns = []
+    for sub in net.subnets(new_prefix=octets * 8):
+        parts = str(sub.network_address).split(".")[:octets]
+        patterns.append(".".join(parts + ["*"] * (4 - octets)) if octets < 4 else ".".join(parts))
+    return patterns
+
+@functools.lru_cache(maxsize=8)
+def _compile(cidrs, domains, keywords):
+    passthrough = [e for e in cidrs + domains if e.startswith(("geoip:", "geosite:"))]
+    networks, invalid = collapse_cidrs([c for c in cidrs if not c.startswith("geoip:")])
+    keywords = dedupe_keywords(keywords)
+    domains = dedupe_domains([d for d in domains if not d.startswith("geosite:")], keywords)
+
+    override = ["<local>"]
+    for net in networks:
+        override.extend(_override_patterns(net))
+    for domain in domains:
+        override.extend([domain, f"*.{domain}"])
+    override.extend(f"*{k}*" for k in keywords)
+
+    return {
+        "ip": [str(n) for n in networks] + [e for e in passthrough if e.startswith("geoip:")],
+        "domain": [f"domain:{d}" for d in domains] + [f"keyword:{k}" for k in keywords]
+                  + [e for e in passthrough if e.startswith("geosite:")],
+        "override": ";".join(override),
+        "invalid": invalid,
+    }
+
+def compile_bypass(cidrs=DEFAULT_BYPASS_CIDRS, domains=DEFAULT_BYPASS_DOMAINS, keywords=()):
+    """
+    Compiles user bypass lists into merged routing entries and a ProxyOverride string.
+    geoip:/geosite: entries are passed to the core untouched. Results are cached, so
+    rebuilding a config with the same lists is free.
+    """
+    return _compile(tuple(cidrs), tuple(domains), tuple(keywords))
+
+def bypass_rules(compiled, outbound_tag="direct"):
+    """At most two Xray routing rules (domains, then IPs) sending the bypass lists direct."""
+    rules = []
+    if compiled["domain"]:
+        rules.append({"type": "field", "outboundTag": outbound_tag, "domain": list(compiled["domain"])})
+    if compiled["ip"]:
+        rules.append({"type": "field", "outboundTag": outbound_tag, "ip": list(compiled["ip"])})
+    return rules
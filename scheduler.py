@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+import psutil
+from pinger import ping_outbound, ping_sort_key, record_result
+
+# --- Background Re-probe Scheduler ---
+
+# Own port range, clear of the main core (10808), tuning (20700) and ping cores (20808+)
+REPROBE_BASE_PORT = 20780
+
+MIN_REPROBE_AGE = 120     # Seconds before a fresh result is worth re-testing
+FAVOURITE_WEIGHT = 3.0    # Favourites age this much faster
+BEST_WEIGHT = 2.0         # ...and so do the current top candidates
+BEST_CANDIDATES = 5
+JITTER = 0.25             # +/- fraction applied to each wait
+
+def reprobe_priority(cfg, now, best):
+    """Weighted staleness; the highest value is probed next. Never-tested servers come first."""
+    age = now - cfg.get('last_ping_at', 0)
+    weight = 1.0
+    if cfg.get('favourite'):
+        weight *= FAVOURITE_WEIGHT
+    if id(cfg) in best:
+        weight *= BEST_WEIGHT
+    return age * weight
+
+class ReprobeScheduler:
+    """
+    Re-tests one server at a time in the background, stalest first.
+
+    get_configs() returns the current server list. Results are stored on the server
+    entry, then on_result(cfg, latency) is called from the scheduler thread.
+    should_pause() is polled before each probe so bulk tests and speed tests get
+    the machine to themselves.
+    """
+    def __init__(self, get_configs, on_result, should_pause=lambda: False,
+                 probes_per_minute=4, cpu_ceiling=60, **ping_kwargs):
+        self.get_configs = get_configs
+        self.on_result = on_result
+        self.should_pause = should_pause
+        self.probes_per_minute = probes_per_minute
+        self.cpu_ceiling = cpu_ceiling
+        self.ping_kwargs = ping_kwargs
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running: return
+        self._stop.clear()
+        psutil.cpu_percent(interval=None)  # Prime the CPU sampler
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the loop; a probe in flight is abandoned and its core torn down."""
+        self._stop.set()
+
+    def next_target(self):
+        """Picks the server most in need of a fresh result, or None if all are fresh."""
+        configs = list(self.get_configs())
+        if not configs:
+            return None
+        now = time.time()
+        best = {id(c) for c in sorted(configs, key=ping_sort_key)[:BEST_CANDIDATES] if isinstance(c.get('last_ping'), int)}
+        fresh_enough = lambda c: now - c.get('last_ping_at', 0) < MIN_REPROBE_AGE
+        candidates = [c for c in configs if not fresh_enough(c) and not c.get('is_pinging_active')]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: reprobe_priority(c, now, best))
+
+    def _interval(self):
+        base = 60.0 / max(self.probes_per_minute, 0.1)
+        return base * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _loop(self):
+        while not self._stop.wait(self._interval()):
+            if self.should_pause():
+                continue
+            if psutil.cpu_percent(interval=None) > self.cpu_ceiling:
+                continue
+
+            cfg = self.next_target()
+            if cfg is None:
+                continue
+
+            try:
+                latency = ping_outbound(
+                    cfg['outbound'], profile=cfg.get('profile'),
+                    base_port=REPROBE_BASE_PORT, cancel_event=self._stop,
+                    **self.ping_kwargs
+                )
+            except Exception as e:
+                print(f"Re-probe failed for {cfg.get('alias')}: {e}")
+                latency = "Fail"
+
+            # Skip results that raced a stop or a bulk test that started meanwhile
+            if latency is None or self.should_pause():
+                continue
+            record_result(cfg, latency)
+            self.on_result(cfg, latency)
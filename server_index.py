@@ -0,0 +1,162 @@
+import bisect
+import re
+
+# --- Server Search Index ---
+
+# Search terms, all ANDed together:
+#   fra tok        alias/host words starting with these
+#   proto:vless    net:ws    sec:tls      exact protocol / transport / security
+#   ms:<300  ms:>1000  ms:100-300         latency band of the last ping
+#   is:fail  is:untested  is:fav
+FACETS = ("proto", "net", "sec")
+TERM_CACHE_SIZE = 256
+# Narrowing a cached prefix checks every member's words; above this size the bisect union is cheaper
+NARROW_MAX = 1024
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+MS_RE = re.compile(r"^(<|>)?(\d+)(?:-(\d+))?$")
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+def server_host(outbound):
+    """Server address of a vmess/vless (vnext) or trojan (servers) outbound."""
+    settings = outbound.get("settings", {})
+    entries = settings.get("vnext") or settings.get("servers") or [{}]
+    return entries[0].get("address", "")
+
+class ServerIndex:
+    """
+    Precomputed lookups over the server list, so a search touches only matching entries.
+
+    Word index: sorted token list (prefix range via bisect) -> set of positions.
+    Facets: protocol / network / security -> set of positions.
+    Latency: (ms, position) pairs kept sorted, built lazily after results change.
+    Per-term results are cached, and a term that extends a small cached one (typing "fra" ->
+    "fran") only narrows the cached set, so each keystroke costs little at any list size.
+    """
+    def __init__(self, configs=()):
+        self.rebuild(configs)
+
+    def rebuild(self, configs):
+        """Re-indexes everything; call when servers are added, removed or reordered."""
+        self.configs = configs
+        self.tokens = {}
+        self.doc_tokens = []
+        self.facets = {name: {} for name in FACETS}
+        for i, cfg in enumerate(configs):
+            outbound = cfg.get('outbound', {})
+            stream = outbound.get('streamSettings', {})
+            words = set(tokenize(cfg.get('alias')) + tokenize(server_host(outbound)))
+            self.doc_tokens.append(words)
+            for word in words:
+                self.tokens.setdefault(word, set()).add(i)
+            self.facets["proto"].setdefault(outbound.get('protocol', 'unknown').lower(), set()).add(i)
+            self.facets["net"].setdefault(stream.get('network', 'tcp').lower(), set()).add(i)
+            self.facets["sec"].setdefault(stream.get('security', 'none').lower(), set()).add(i)
+        self.sorted_tokens = sorted(self.tokens)
+        self._term_cache = {}
+        self.invalidate_latency()
+
+    def invalidate_latency(self):
+        """Ping results changed; the latency structure is rebuilt on next use."""
+        self._latency = None
+
+    def _latency_index(self):
+        if self._latency is None:
+            pings = [cfg.get('last_ping') for cfg in self.configs]
+            tested, failed, untested = [], [], []
+            for i, ping in enumerate(pings):
+                if isinstance(ping, int):
+                    tested.append(i)
+                elif ping == "Fail":
+                    failed.append(i)
+                else:
+                    untested.append(i)  # Never pinged (or odd values): last, as in ping_sort_key
+            # Sorting positions by key (not (ms, i) tuples) allocates nothing the GC has to track,
+            # so a rebuild doesn't set off a full collection mid-keystroke
+            tested.sort(key=pings.__getitem__)
+            self._latency = {
+                "keys": [pings[i] for i in tested],
+                "order": tested,
+                "fail": failed,
+                "untested": untested,
+            }
+        return self._latency
+
+    # --- Terms ---
+
+    def _prefix(self, prefix):
+        """Positions with any word starting with prefix."""
+        cached = self._term_cache.get(prefix[:-1]) if len(prefix) > 1 else None
+        if cached is not None and len(cached) <= NARROW_MAX:
+            return {i for i in cached if any(w.startswith(prefix) for w in self.doc_tokens[i])}
+        result = set()
+        start = bisect.bisect_left(self.sorted_tokens, prefix)
+        for word in self.sorted_tokens[start:]:
+            if not word.startswith(prefix):
+                break
+            result |= self.tokens[word]
+        return result
+
+    def _latency_band(self, spec):
+        match = MS_RE.match(spec)
+        if not match:
+            return set()
+        op, low, high = match.group(1), int(match.group(2)), match.group(3)
+        latency = self._latency_index()
+        keys, order = latency["keys"], latency["order"]
+        if op == "<":
+            return set(order[:bisect.bisect_left(keys, low)])
+        if op == ">":
+            return set(order[bisect.bisect_right(keys, low):])
+        high = int(high) if high else low
+        return set(order[bisect.bisect_left(keys, low):bisect.bisect_right(keys, high)])
+
+    def _status(self, status):
+        if status == "fav":
+            return {i for i, cfg in enumerate(self.configs) if cfg.get('favourite')}
+        latency = self._latency_index()
+        return set(latency.get(status, ()))
+
+    def term(self, term):
+        """Positions matching a single search term."""
+        field, sep, value = term.partition(":")
+        if sep and field == "ms":
+            return self._latency_band(value)
+        if sep and field == "is":
+            return self._status(value)
+        if sep and field in FACETS:
+            return self.facets[field].get(value, set())
+
+        words = tokenize(term)
+        if not words:
+            return None
+        cached = self._term_cache.get(term)
+        if cached is None:
+            cached = set.intersection(*(self._prefix(w) for w in words)) if len(words) > 1 else self._prefix(words[0])
+            if len(self._term_cache) >= TERM_CACHE_SIZE:
+                self._term_cache.clear()
+            self._term_cache[term] = cached
+        return cached
+
+    def search(self, query):
+        """Set of positions matching every term, or None for an empty query (everything)."""
+        sets = [s for s in (self.term(t) for t in query.lower().split()) if s is not None]
+        if not sets:
+            return None
+        sets.sort(key=len)
+        result = set(sets[0])
+        for s in sets[1:]:
+            result &= s
+            if not result:
+                break
+        return result
+
+    def ordered(self, matches=None, by_latency=False):
+        """Positions to show: list order, or fastest first then failures then untested."""
+        if not by_latency:
+            return range(len(self.configs)) if matches is None else sorted(matches)
+        latency = self._latency_index()
+        order = latency["order"] + latency["fail"] + latency["untested"]
+        return order if matches is None else [i for i in order if i in matches]
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from utils import OutboundTemplate, generate_multi_config
+from xray_runner import XrayRunner, RUNTIME_DIR
+from pinger import CORE_STARTUP_DELAY
+from traffic import TrafficPoller
+
+# --- Multi-Session Mode (per-application ports) ---
+
+# One shared core serves every session; these are its API and traffic counter ports
+SESSION_API_PORT = 10814
+SESSION_STATS_PORT = 10815
+# New sessions are offered the first free SOCKS/HTTP pair from here
+SESSION_BASE_PORT = 10820
+
+# Session tags become inbound/outbound/rule tags in the core, so keep them simple
+TAG_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+RESERVED_TAGS = ("direct", "dns-out", "api", "metrics", "proxy")
+
+class SessionError(Exception):
+    pass
+
+def port_free(port, host="127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        if os.name != "nt":
+            # Like the core's own listeners, so ports still in TIME_WAIT count as free
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+            return True
+        except OSError:
+            return False
+
+def session_ports(session):
+    return [p for p in (session.get("socks_port"), session.get("http_port")) if p]
+
+def next_free_ports(used=(), start=SESSION_BASE_PORT):
+    """First (socks_port, http_port) pair at or after start that nothing else holds."""
+    port = start
+    while port < 65534:
+        if port not in used and port + 1 not in used and port_free(port) and port_free(port + 1):
+            return port, port + 1
+        port += 2
+    return None, None
+
+def session_traffic(inbounds, tags):
+    """Per-session rates from a TrafficPoller sample's "inbounds", summing each session's two ports."""
+    result = {}
+    for tag in tags:
+        ports = [inbounds[t] for t in (f"{tag}-socks", f"{tag}-http") if t in inbounds]
+        result[tag] = {key: sum(p[key] for p in ports) for key in ("up_rate", "down_rate", "up_total", "down_total")}
+    return result
+
+class SessionCore:
+    """
+    A shared core serving several local SOCKS/HTTP port pairs, each routed to its own server,
+    so different applications can use different servers at the same time.
+
+    Sessions are dicts in generate_multi_config's format plus an "alias" for display.
+    config_kwargs (shared options such as bypass and DNS) is a dict, or a callable returning
+    one that is read on every config rebuild, so settings changed since startup apply the
+    next time the core starts or restarts.
+    The core starts with the first session; later ones are added and removed through its API,
+    so traffic on the other ports is never interrupted. on_sample({tag: rates}) is called from
+    the poller thread with live per-session traffic; on_event is the runner's supervisor hook.
+    """
+    def __init__(self, config_kwargs=None, api_port=SESSION_API_PORT, stats_port=SESSION_STATS_PORT,
+                 xray_path=None, on_sample=None, on_event=None, startup_delay=CORE_STARTUP_DELAY):
+        self.runner = XrayRunner(config_filename="sessions_config.json", log_filename="xray_sessions_log.txt",
+                                 xray_path=xray_path)
+        self.config_kwargs = config_kwargs or {}
+        self.api_port = api_port
+        self.stats_port = stats_port
+        self.on_sample = on_sample
+        self.on_event = on_event
+        self.startup_delay = startup_delay
+        self.sessions = {}
+        self.traffic = None
+        self._lock = threading.RLock()
+
+    @property
+    def running(self):
+        return self.runner.is_running()
+
+    def _config(self, sessions):
+        kwargs = self.config_kwargs() if callable(self.config_kwargs) else self.config_kwargs
+        try:
+            return generate_multi_config(
+                sessions, stats_port=self.stats_port, api_port=self.api_port, **kwargs
+            )
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            # Saved sessions are user data; a malformed one must not escape as a bare KeyError
+            raise SessionError(f"Invalid session settings: {e!r}") from e
+
+    def _validate(self, session, taken_tags, taken_ports):
+        if not isinstance(session, dict) or not isinstance(session.get("outbound"), (dict, OutboundTemplate)):
+            raise SessionError(f"Invalid session settings: {session!r}")
+        tag = session.get("tag") or ""
+        if not isinstance(tag, str) or not TAG_RE.match(tag) or tag in RESERVED_TAGS:
+            raise SessionError(f"Invalid session name '{tag}' (letters, digits, - and _).")
+        if tag in taken_tags:
+            raise SessionError(f"Session name '{tag}' is already in use.")
+        ports = session_ports(session)
+        if not ports:
+            raise SessionError(f"Session '{tag}' needs a SOCKS or HTTP port.")
+        for port in ports:
+            if not isinstance(port, int) or not 0 < port < 65536:
+                raise SessionError(f"Invalid port {port!r} for session '{tag}'.")
+            if port in taken_ports or not port_free(port):
+                raise SessionError(f"Port {port} is already in use.")
+            taken_ports.add(port)
+        taken_tags.add(tag)
+
+    # --- Lifecycle ---
+
+    def start(self, sessions):
+        """Starts the core with these sessions (used to restore saved ones). Raises SessionError."""
+        with self._lock:
+            if self.running:
+                raise SessionError("The session core is already running.")
+            tags, ports = set(), set()
+            for session in sessions:
+                self._validate(session, tags, ports)
+            config = self._config(sessions)
+            try:
+                started = self.runner.start(config)
+            except OSError as e:  # Including FileNotFoundError for a missing core binary
+                raise SessionError(f"Failed to start the session core: {e}") from e
+            if not started:
+                raise SessionError("Failed to start the session core.")
+            time.sleep(self.startup_delay)
+            if not self.running:
+                self.runner.stop()
+                raise SessionError("The session core exited on startup (see xray_sessions_log.txt).")
+            self.sessions = {s["tag"]: s for s in sessions}
+            self.runner.supervise(self.on_event, name="sessions")
+            self.traffic = TrafficPoller(self._on_traffic, port=self.stats_port, outbound_tag=None)
+            self.traffic.start()
+
+    def stop(self):
+        with self._lock:
+            if self.traffic:
+                self.traffic.stop()
+                self.traffic = None
+            self.runner.stop()
+            self.sessions = {}
+
+    def add(self, session):
+        """Serves one more session; the running core is updated in place. Raises SessionError."""
+        with self._lock:
+            if not self.running:
+                return self.start([session])
+            self._validate(session, set(self.sessions), {p for s in self.sessions.values() for p in session_ports(s)})
+            inbounds, outbounds, rules = self._parts(session)
+
+            # Outbound and rule first, so the ports never accept traffic they can't route
+            done = []
+            try:
+                for command, data, flags in (("ado", {"outbounds": outbounds}, ()),
+                                             ("adrules", {"routing": {"rules": rules}}, ("-append",)),
+                                             ("adi", {"inbounds": inbounds}, ())):
+                    self._call(command, data, *flags)
+                    done.append(command)
+            except SessionError:
+                # Undo what was applied, so a retry starts clean
+                if "adrules" in done:
+                    self._call_quietly("rmrules", session["tag"])
+                if "ado" in done:
+                    self._call_quietly("rmo", {"outbounds": outbounds})
+                raise
+
+            self.sessions[session["tag"]] = session
+            self.runner.update_config(self._config(list(self.sessions.values())))
+
+    def remove(self, tag):
+        """Stops serving a session; the other sessions keep their connections. Raises SessionError."""
+        with self._lock:
+            session = self.sessions.get(tag)
+            if session is None:
+                return
+            if len(self.sessions) == 1:
+                self.stop()  # Nothing else is using the core
+                return
+            inbounds, outbounds, _ = self._parts(session)
+            # Reverse of add(): close the ports first
+            self._call("rmi", {"inbounds": inbounds})
+            self._call_quietly("rmrules", tag)
+            self._call_quietly("rmo", {"outbounds": outbounds})
+            del self.sessions[tag]
+            self.runner.update_config(self._config(list(self.sessions.values())))
+
+    # --- Core API ---
+
+    def _parts(self, session):
+        """The session's own inbounds, outbound and routing rule, as the full config would have them."""
+        tag = session["tag"]
+        config = json.loads(self._config([session]))
+        inbounds = [i for i in config["inbounds"] if i.get("tag") in (f"{tag}-socks", f"{tag}-http")]
+        outbounds = [o for o in config["outbounds"] if o.get("tag") == tag]
+        rules = [r for r in config["routing"]["rules"] if r.get("ruleTag") == tag]
+        return inbounds, outbounds, rules
+
+    def _call(self, command, data, *flags):
+        """Runs one `xray api` command; dict data goes in a temp file, anything else as an argument."""
+        path = None
+        try:
+            if isinstance(data, dict):
+                os.makedirs(RUNTIME_DIR, exist_ok=True)
+                fd, path = tempfile.mkstemp(prefix=f"api_{command}_", suffix=".json", dir=RUNTIME_DIR)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                args = [*flags, path]
+            else:
+                args = [*flags, data]
+            ok, output = self.runner.api(f"127.0.0.1:{self.api_port}", command, *args)
+        finally:
+            if path:
+                try: os.remove(path)
+                except OSError: pass
+        if not ok:
+            raise SessionError(f"xray api {command} failed: {output or 'no output'}")
+
+    def _call_quietly(self, command, data):
+        try:
+            self._call(command, data)
+        except SessionError as e:
+            print(e)
+
+    def _on_traffic(self, sample):
+        if self.on_sample:
+            self.on_sample(session_traffic(sample["inbounds"], list(self.sessions)))
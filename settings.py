@@ -0,0 +1,66 @@
+import os
+import json
+from routing import DEFAULT_BYPASS_CIDRS, DEFAULT_BYPASS_DOMAINS
+from dns_config import DEFAULT_DNS_PRESET
+from pac import PAC_PORT
+from sessions import SESSION_API_PORT, SESSION_STATS_PORT
+
+# --- App Settings (settings.json next to servers.json) ---
+
+SETTINGS_FILE = "settings.json"
+
+DEFAULT_SETTINGS = {
+    # Local Prometheus/JSON metrics endpoint; None keeps it off
+    "metrics_port": None,
+    # Written on exit when set, e.g. "metrics.json"
+    "metrics_dump": None,
+    # Background re-probe of stale servers
+    "reprobe_enabled": False,
+    "reprobe_per_minute": 4,
+    "reprobe_cpu_ceiling": 60,  # Percent system CPU above which probes are skipped
+    # Core traffic counters polled while connected; None turns live stats off
+    "stats_port": 10813,
+    # Sent direct instead of through the server, and skipped by the system proxy.
+    # CIDRs (or geoip:xx), domain suffixes (or geosite:xx) and substring keywords.
+    "bypass_cidrs": list(DEFAULT_BYPASS_CIDRS),
+    "bypass_domains": list(DEFAULT_BYPASS_DOMAINS),
+    "bypass_keywords": [],
+    # DNS used by the connected core (see dns_config.DNS_PRESETS)
+    "dns_preset": DEFAULT_DNS_PRESET,
+    "dns_domain_strategy": None,  # AsIs / IPIfNonMatch / IPOnDemand (toolbar menu); None follows the preset
+    "dns_domain_servers": {},     # Resolver -> domains it answers for, e.g. {"223.5.5.5": ["geosite:cn"]}
+    "dns_cache": True,
+    # "global" routes all system traffic to the core; "pac" serves a PAC script so that
+    # only hosts on the pac_proxy_* lists (or everything, with pac_default "proxy") use it.
+    # PAC mode can't be turned on while it would send every host DIRECT.
+    "proxy_mode": "global",
+    "pac_port": PAC_PORT,
+    "pac_proxy_cidrs": [],
+    "pac_proxy_domains": [],
+    "pac_proxy_keywords": [],
+    "pac_default": "direct",
+    # Per-application ports served by one extra core, restored at startup.
+    # Entries: {"tag", "alias", "outbound", "socks_port", "http_port"} (see sessions.SessionCore)
+    "sessions": [],
+    "session_api_port": SESSION_API_PORT,
+    "session_stats_port": SESSION_STATS_PORT,
+}
+
+def load_settings(path=SETTINGS_FILE):
+    """Loads settings.json merged over the defaults."""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings.update(json.load(f))
+        except Exception as e:
+            print(f"Failed to load {path}: {e}")
+    return settings
+
+def save_settings(settings, path=SETTINGS_FILE):
+    """Saves settings to settings.json."""
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=4)
+    except Exception as e:
+        print(f"Failed to save {path}: {e}")
@@ -0,0 +1,117 @@
+from main import CardPool, card_state
+
+class FakeCard:
+    """Records what CardPool does to a widget."""
+    def __init__(self, cfg, log):
+        self.config_item = cfg
+        self.log = log
+        self.destroyed = False
+
+    def pack(self, before=None, **options):
+        self.log.append(("pack", self.config_item["alias"], before and before.config_item["alias"]))
+
+    def pack_forget(self):
+        self.log.append(("forget", self.config_item["alias"]))
+
+    def destroy(self):
+        self.destroyed = True
+        self.log.append(("destroy", self.config_item["alias"]))
+
+def servers(n):
+    return [{"alias": f"s{i}", "outbound": {"protocol": "vless"}} for i in range(n)]
+
+def make_pool(limit=100):
+    log = []
+    pool = CardPool(lambda index, cfg, state: FakeCard(cfg, log), limit=limit)
+    return pool, log
+
+def rows(configs, order, selected=-1):
+    return [(i, configs[i], card_state(configs[i], i == selected, False)) for i in order]
+
+def aliases(cards):
+    return [card.config_item["alias"] for card in cards]
+
+def test_unchanged_redraw_touches_nothing():
+    configs = servers(5)
+    pool, log = make_pool()
+    first = pool.show(rows(configs, range(5)))
+    log.clear()
+    assert pool.show(rows(configs, range(5))) == first
+    assert log == []
+    assert pool.built == 5
+
+def test_changed_card_is_rebuilt_in_place():
+    configs = servers(3)
+    pool, log = make_pool()
+    old = pool.show(rows(configs, range(3)))
+    log.clear()
+    configs[1]["last_ping"] = 120
+    cards = pool.show(rows(configs, range(3)))
+    assert cards[0] is old[0] and cards[2] is old[2]
+    assert cards[1] is not old[1] and old[1].destroyed
+    assert log == [("pack", "s1", "s1"), ("destroy", "s1")]  # No full re-pack
+    assert pool.built == 4
+
+def test_selection_rebuilds_only_affected_cards():
+    configs = servers(4)
+    pool, _ = make_pool()
+    pool.show(rows(configs, range(4), selected=0))
+    pool.show(rows(configs, range(4), selected=2))
+    assert pool.built == 6
+
+def test_search_narrow_and_widen_reuses_cards():
+    configs = servers(6)
+    pool, log = make_pool()
+    all_cards = pool.show(rows(configs, range(6)))
+    narrowed = pool.show(rows(configs, [1, 4]))
+    assert narrowed == [all_cards[1], all_cards[4]]
+    widened = pool.show(rows(configs, range(6)))
+    assert widened == all_cards
+    assert pool.built == 6
+    assert not any(event[0] == "destroy" for event in log)
+
+def test_reorder_repacks_in_new_order():
+    configs = servers(3)
+    pool, log = make_pool()
+    pool.show(rows(configs, range(3)))
+    log.clear()
+    assert aliases(pool.show(rows(configs, [2, 0, 1]))) == ["s2", "s0", "s1"]
+    assert [e for e in log if e[0] == "pack"] == [("pack", "s2", None), ("pack", "s0", None), ("pack", "s1", None)]
+    assert pool.built == 3
+
+def test_reused_card_follows_new_index():
+    configs = servers(3)
+    pool, _ = make_pool()
+    pool.show(rows(configs, range(3)))
+    pool.discard(configs[0])
+    del configs[0]
+    cards = pool.show(rows(configs, range(2)))
+    assert [card.index for card in cards] == [0, 1]
+    assert aliases(cards) == ["s1", "s2"]
+    assert pool.built == 3
+
+def test_hidden_cards_are_evicted_over_limit():
+    configs = servers(10)
+    pool, _ = make_pool(limit=6)
+    pool.show(rows(configs, range(5)))
+    shown = pool.show(rows(configs, range(5, 10)))
+    assert len(pool.cards) == 5
+    assert {id(card) for card in pool.cards.values()} == {id(card) for card in shown}
+
+def test_clear_destroys_everything():
+    configs = servers(3)
+    pool, _ = make_pool()
+    cards = pool.show(rows(configs, range(3)))
+    pool.clear()
+    assert pool.cards == {} and pool.shown == []
+    assert all(card.destroyed for card in cards)
+
+def test_card_state_covers_displayed_fields():
+    cfg = servers(1)[0]
+    base = card_state(cfg, False, False)
+    for key, value in (("alias", "x"), ("last_ping", "Fail"), ("is_pinging_active", True), ("favourite", True),
+                       ("udp_test", {"rtt_ms": 10, "loss": 0.0, "received": 3}), ("outbound", {"protocol": "vmess"})):
+        changed = dict(cfg, **{key: value})
+        assert card_state(changed, False, False) != base, key
+    assert card_state(cfg, True, False) != base
+    assert card_state(cfg, True, True) != card_state(cfg, True, False)
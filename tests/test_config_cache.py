@@ -0,0 +1,52 @@
+import json
+
+from routing import compile_bypass
+from utils import (clear_config_caches, forget_outbound, generate_multi_config, generate_xray_config,
+                   outbound_template)
+
+def outbound(address="s1.example.com"):
+    return {"protocol": "trojan", "settings": {"servers": [{"address": address, "port": 443, "password": "x"}]},
+            "streamSettings": {"network": "tcp", "security": "tls"}}
+
+def server_address(config):
+    return json.loads(config)["outbounds"][0]["settings"]["servers"][0]["address"]
+
+def test_forgotten_edit_is_not_served_from_cache():
+    stored = outbound()
+    assert server_address(generate_xray_config(stored)) == "s1.example.com"
+    stored["settings"]["servers"][0]["address"] = "s2.example.com"
+    forget_outbound(stored)
+    assert server_address(generate_xray_config(stored)) == "s2.example.com"
+    stored["streamSettings"]["security"] = "none"
+    forget_outbound(stored)
+    config = json.loads(generate_xray_config(stored, enable_mux=True, profile="low-latency"))
+    assert config["outbounds"][0]["streamSettings"]["security"] == "none"
+
+def test_equal_outbounds_share_a_template():
+    assert outbound_template(outbound()) is outbound_template(outbound())
+    assert outbound_template(outbound()) is not outbound_template(outbound("s2.example.com"))
+
+def test_unchanged_outbound_is_dumped_once(monkeypatch):
+    import utils
+    stored = outbound()
+    generate_xray_config(stored)
+    dumped = []
+    monkeypatch.setattr(utils, "_dumps", lambda value: dumped.append(value) or json.dumps(value))
+    outbound_template(stored)
+    assert dumped == []
+
+def test_in_place_bypass_edit_is_not_served_from_cache():
+    bypass = dict(compile_bypass(cidrs=["10.0.0.0/8"], domains=["example.com"]))
+    session = {"tag": "a", "outbound": outbound(), "socks_port": 30000, "http_port": None}
+    rules = lambda: json.loads(generate_multi_config([session], bypass=bypass))["routing"]["rules"]
+    assert any(r.get("domain") == ["domain:example.com"] for r in rules())
+    bypass["domain"] = ["domain:example.org"]
+    assert any(r.get("domain") == ["domain:example.org"] for r in rules())
+
+def test_clear_config_caches():
+    stored = outbound()
+    before = generate_xray_config(stored, stats_port=10813)
+    template = outbound_template(stored)
+    clear_config_caches()
+    assert outbound_template(stored) is not template
+    assert generate_xray_config(stored, stats_port=10813) == before
@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+
+import connection
+from connection import CONNECTED, IDLE, STARTING, STOPPING, VERIFYING, ConnectionManager
+from harness import install_fake_xray
+from sessions import next_free_ports
+from utils import generate_xray_config
+from xray_runner import XrayRunner
+
+OUTBOUND = {"protocol": "freedom", "settings": {}}
+
+@pytest.fixture(scope="module")
+def xray(tmp_path_factory):
+    return install_fake_xray(str(tmp_path_factory.mktemp("core")))
+
+class Harness:
+    """A ConnectionManager on the stub core, recording events and proxy calls."""
+    def __init__(self, xray, on_event=None):
+        self.socks_port, self.http_port = next_free_ports(start=21900)
+        self.runner = XrayRunner(log_filename=None, xray_path=xray)
+        self.events, self.proxy = [], []
+        self.hook = on_event
+        self.manager = ConnectionManager(self.runner, self._on_event, http_port=self.http_port,
+                                         set_proxy=self.proxy.append)
+
+    def _on_event(self, state, message):
+        self.events.append((state, message))
+        if self.hook:
+            self.hook(self, state)
+
+    def config(self, http_port=None):
+        return generate_xray_config(OUTBOUND, self.socks_port, http_port or self.http_port)
+
+    def states(self):
+        return [state for state, _ in self.events]
+
+    def finish(self, timeout=10):
+        self.manager.join(timeout)
+        assert not self.manager._worker.is_alive()
+
+    def close(self):
+        self.manager.join(10)
+        self.runner.stop()
+
+@pytest.fixture
+def make(xray):
+    harnesses = []
+    def build(on_event=None):
+        harnesses.append(Harness(xray, on_event))
+        return harnesses[-1]
+    yield build
+    for harness in harnesses:
+        harness.close()
+
+def test_connect_and_disconnect(make):
+    h = make()
+    assert h.manager.connect(h.config())
+    assert not h.manager.connect(h.config())  # Busy
+    h.finish()
+    assert h.manager.state == CONNECTED
+    assert h.states() == [STARTING, VERIFYING, CONNECTED]
+    assert h.proxy == [True]
+    assert h.runner.is_running()
+
+    done = threading.Event()
+    assert h.manager.disconnect(on_done=done.set)
+    h.finish()
+    assert done.is_set()
+    assert h.states()[3:] == [STOPPING, IDLE]
+    assert h.proxy == [True, False]
+    assert not h.runner.is_running()
+
+def test_cancel_during_starting(make):
+    h = make(on_event=lambda h, state: state == STARTING and h.manager.cancel())
+    assert h.manager.connect(h.config())
+    h.finish()
+    assert h.manager.state == IDLE
+    assert h.states() == [STARTING, IDLE]
+    assert h.events[-1][1] == "Connect cancelled."
+    assert h.proxy == []  # Never set, so never reset
+    assert not h.runner.is_running()
+
+def test_cancel_during_verifying(make):
+    h = make(on_event=lambda h, state: state == VERIFYING and h.manager.cancel())
+    assert h.manager.connect(h.config())
+    h.finish()
+    assert h.states() == [STARTING, VERIFYING, IDLE]
+    assert h.events[-1][1] == "Connect cancelled."
+    assert h.proxy == []
+    assert not h.runner.is_running()
+
+def test_failed_verify_tears_down(make, monkeypatch):
+    monkeypatch.setattr(connection, "VERIFY_TIMEOUT", 1)
+    h = make()
+    wrong_port = next_free_ports(start=h.http_port + 2)[0]
+    assert h.manager.connect(h.config(http_port=wrong_port))  # Core never opens the port we check
+    h.finish()
+    assert h.states() == [STARTING, VERIFYING, IDLE]
+    assert "did not open port" in h.events[-1][1]
+    assert h.proxy == []
+    assert not h.runner.is_running()
+
+def test_failed_set_proxy_tears_down(make):
+    h = make()
+    def fail(enable):
+        h.proxy.append(enable)
+        if enable:
+            raise OSError("registry locked")
+    h.manager.set_proxy = fail
+    assert h.manager.connect(h.config())
+    h.finish()
+    assert h.states()[-1] == IDLE
+    assert "registry locked" in h.events[-1][1]
+    assert h.proxy == [True]  # Not marked as set, so teardown leaves it alone
+    assert not h.runner.is_running()
+
+def test_missing_core_fails_to_idle(tmp_path):
+    runner = XrayRunner(log_filename=None, xray_path=str(tmp_path / "missing"))
+    events = []
+    manager = ConnectionManager(runner, lambda state, message: events.append((state, message)),
+                                set_proxy=lambda enable: None)
+    assert manager.connect("{}")
+    manager.join(5)
+    assert manager.state == IDLE
+    assert "not found" in events[-1][1]
+
+def test_join(make):
+    h = make()
+    h.manager.join()  # Nothing running yet
+    h.manager.join(0.01)
+    # join() from the worker itself (e.g. in an on_event hook) must not deadlock
+    h.hook = lambda h, state: h.manager.join()
+    assert h.manager.connect(h.config())
+    h.manager.join(10)
+    assert h.manager.state == CONNECTED
+    assert not h.manager._worker.is_alive()
+
+def test_cancel_and_disconnect_outside_their_states(make):
+    h = make()
+    assert not h.manager.cancel()
+    assert not h.manager.disconnect()
+    assert h.manager.state == IDLE
+    assert h.events == []
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from dns_config import clean_domain_servers
+from utils import generate_xray_config
+
+OUTBOUND = {"protocol": "freedom", "settings": {}}
+
+def dns_servers(**kwargs):
+    return json.loads(generate_xray_config(OUTBOUND, **kwargs))["dns"]["servers"]
+
+def test_clean_keeps_valid_mapping():
+    value = {"223.5.5.5": ["geosite:cn", "domain:example.cn"], "1.1.1.1": []}
+    assert clean_domain_servers(value) == ({"223.5.5.5": ["geosite:cn", "domain:example.cn"], "1.1.1.1": []}, [])
+
+def test_clean_wraps_a_single_domain():
+    assert clean_domain_servers({"223.5.5.5": "geosite:cn"}) == ({"223.5.5.5": ["geosite:cn"]}, [])
+
+@pytest.mark.parametrize("value", [None, {}, []])
+def test_clean_empty(value):
+    assert clean_domain_servers(value) == ({}, [])
+
+@pytest.mark.parametrize("value", [["223.5.5.5"], "223.5.5.5", 5])
+def test_clean_rejects_non_mapping(value):
+    servers, problems = clean_domain_servers(value)
+    assert servers == {} and len(problems) == 1
+
+def test_clean_skips_bad_entries():
+    servers, problems = clean_domain_servers({"223.5.5.5": ["geosite:cn"], "8.8.8.8": 5, "": ["a.com"],
+                                              "9.9.9.9": ["ok.com", None]})
+    assert servers == {"223.5.5.5": ["geosite:cn"]}
+    assert len(problems) == 3
+
+def test_string_domains_are_not_split():
+    servers = dns_servers(dns_domain_servers={"223.5.5.5": "geosite:cn"})
+    assert servers[0] == {"address": "223.5.5.5", "domains": ["geosite:cn"], "skipFallback": True}
@@ -0,0 +1,23 @@
+import threading
+import time
+
+from metrics import MetricsRegistry, _Timer
+
+def test_timed_decorator_overlapping_calls():
+    registry = MetricsRegistry()
+    timer = _Timer(registry, "overlap_seconds", {})
+
+    @timer
+    def work(seconds):
+        time.sleep(seconds)
+
+    slow = threading.Thread(target=work, args=(0.3,))
+    slow.start()
+    time.sleep(0.05)
+    work(0.1)
+    slow.join()
+
+    (series,) = registry.to_dict()["overlap_seconds"]
+    assert series["count"] == 2
+    # Each call keeps its own start time: 0.3 + 0.1, not 0.3 shortened by the later start
+    assert series["sum"] >= 0.39
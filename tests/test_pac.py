@@ -0,0 +1,104 @@
+import json
+import shutil
+import subprocess
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pac import PAC_PATH, PacServer, generate_pac
+from routing import compile_bypass
+
+HTTP_PORT = 10809
+PROXY = f"PROXY 127.0.0.1:{HTTP_PORT}"
+
+# Stand-ins for the browser helpers a PAC script may call
+PAC_RUNTIME = """
+function isPlainHostName(host) { return host.indexOf(".") < 0; }
+"""
+
+def script(default_proxy=False):
+    proxy_rules = compile_bypass(cidrs=["8.8.8.0/24", "1.1.1.1/32"], domains=["example.com", "geosite:google"],
+                                 keywords=["tracker"])
+    direct_rules = compile_bypass(cidrs=["10.0.0.0/8"], domains=["direct.example.com"], keywords=["local"])
+    return generate_pac(proxy_rules, direct_rules, http_port=HTTP_PORT, default_proxy=default_proxy)
+
+def find_proxy(pac, hosts):
+    """Runs FindProxyForURL for each host in node and returns the answers in order."""
+    node = shutil.which("node")
+    if not node:
+        pytest.skip("node is needed to evaluate the PAC script")
+    program = pac + PAC_RUNTIME + (
+        "var hosts = %s;\n"
+        "console.log(JSON.stringify(hosts.map(function (h) { return FindProxyForURL('http://' + h + '/', h); })));\n"
+    ) % json.dumps(hosts)
+    result = subprocess.run([node, "-e", program], capture_output=True, text=True, timeout=30, check=True)
+    return json.loads(result.stdout)
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.status, response.headers["Content-Type"], response.read().decode("utf-8")
+
+@pytest.fixture
+def server():
+    server = PacServer(port=0)
+    server.update(script())
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+# --- Serving ---
+
+def test_serves_script_over_http(server):
+    assert server.port != 0
+    status, content_type, body = fetch(server.url)
+    assert status == 200
+    assert content_type == "application/x-ns-proxy-autoconfig"
+    assert body == server.script
+
+def test_unknown_path_is_404(server):
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        fetch(f"http://{server.host}:{server.port}/other.pac")
+    assert excinfo.value.code == 404
+
+def test_update_changes_url_and_body(server):
+    old_url = server.url
+    assert server.url == old_url  # Stable while the script is unchanged
+    server.update(script(default_proxy=True))
+    assert server.url != old_url
+    assert server.url.split("?")[0] == old_url.split("?")[0] == f"http://{server.host}:{server.port}{PAC_PATH}"
+    assert fetch(server.url)[2] == server.script
+    server.update(script())
+    assert server.url == old_url
+
+def test_stop_releases_server(server):
+    server.stop()
+    assert not server.running
+
+# --- FindProxyForURL ---
+
+@pytest.mark.parametrize("host,expected", [
+    ("example.com", PROXY),             # domain
+    ("www.example.com", PROXY),         # subdomain
+    ("a.b.EXAMPLE.com", PROXY),         # deeper subdomain, case-insensitive
+    ("notexample.com", "DIRECT"),       # suffix match is per label
+    ("direct.example.com", "DIRECT"),   # direct rules win over proxy rules
+    ("x.direct.example.com", "DIRECT"),
+    ("ads.tracker.net", PROXY),         # keyword
+    ("my.local.net", "DIRECT"),
+    ("8.8.8.8", PROXY),                 # CIDR
+    ("8.8.9.8", "DIRECT"),
+    ("1.1.1.1", PROXY),                 # single-address network
+    ("1.1.1.2", "DIRECT"),
+    ("10.1.2.3", "DIRECT"),
+    ("intranet", "DIRECT"),             # plain host name
+    ("other.org", "DIRECT"),            # default
+])
+def test_find_proxy(host, expected):
+    assert find_proxy(script(), [host]) == [expected]
+
+def test_find_proxy_default_proxy():
+    hosts = ["other.org", "9.9.9.9", "direct.example.com", "10.0.0.1", "intranet"]
+    assert find_proxy(script(default_proxy=True), hosts) == [PROXY, PROXY, "DIRECT", "DIRECT", "DIRECT"]
@@ -0,0 +1,107 @@
+import http.server
+import threading
+import time
+
+import psutil
+import pytest
+
+from harness import NoContentServer, install_fake_xray, sample_links
+from pinger import PingBatch, ping_outbound, udp_test_outbound
+from utils import parse_vless
+
+BASE_PORT = 21800      # Clear of the app's own ping ports
+STARTUP_DELAY = 0.5    # The fake core binds well within this
+HANG_SECONDS = 10
+
+class HangingHandler(http.server.BaseHTTPRequestHandler):
+    """Never answers in time, so a probe is still in flight when the batch is cancelled."""
+    def do_GET(self):
+        time.sleep(HANG_SECONDS)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def xray(tmp_path_factory):
+    return install_fake_xray(str(tmp_path_factory.mktemp("core")))
+
+@pytest.fixture(scope="module")
+def outbound():
+    link = next(l for l in sample_links(10) if l.startswith("vless://"))
+    return parse_vless(link)[0]
+
+@pytest.fixture
+def ok_url():
+    with NoContentServer() as server:
+        yield server.url
+
+@pytest.fixture
+def hanging_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HangingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/generate_204"
+    server.shutdown()
+    server.server_close()
+
+def batch(outbounds, xray, url, **kwargs):
+    return PingBatch(outbounds, test_url=url, xray_path=xray, startup_delay=STARTUP_DELAY,
+                     base_port=BASE_PORT, timeout=HANG_SECONDS * 2, **kwargs)
+
+def test_batch_pings_every_server(xray, outbound, ok_url):
+    results = dict(batch([outbound] * 3, xray, ok_url))
+    assert sorted(results) == [0, 1, 2]
+    assert all(isinstance(latency, int) for latency in results.values())
+
+def test_stop_after_ends_sweep_early(xray, outbound, ok_url):
+    started = []
+    sweep = batch([outbound] * 6, xray, ok_url, max_workers=1, stop_after=2, on_start=started.append)
+    results = list(sweep)
+    assert len(results) == 2
+    assert sweep.healthy == 2 and sweep.cancelled
+    # The single worker may pick up one more server before the cancel lands; it yields nothing
+    assert started[:2] == [0, 1] and len(started) <= 3
+    assert sweep._active == set()
+
+def test_cancel_tears_down_in_flight_cores(xray, outbound, hanging_url):
+    sweep = batch([outbound] * 3, xray, hanging_url)
+    results, done = [], threading.Event()
+    def consume():
+        results.extend(sweep)
+        done.set()
+    threading.Thread(target=consume, daemon=True).start()
+
+    # Wait until every core is up and its probe is hanging
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and not (len(sweep._active) == 3 and
+                                               all(r.is_running() for r in list(sweep._active))):
+        time.sleep(0.05)
+    time.sleep(STARTUP_DELAY + 0.2)
+    processes = [psutil.Process(r.process.pid) for r in list(sweep._active)]
+    assert len(processes) == 3
+
+    start = time.monotonic()
+    sweep.cancel()
+    assert done.wait(HANG_SECONDS - 2), "iteration did not end after cancel"
+    assert time.monotonic() - start < HANG_SECONDS / 2
+    assert results == []  # Cancelled probes yield nothing, not "Fail"
+    assert sweep._active == set()
+    for proc in processes:
+        assert not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE
+
+def test_cancel_during_startup_returns_none(xray, outbound, ok_url):
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    start = time.monotonic()
+    assert ping_outbound(outbound, 0, ok_url, startup_delay=5, xray_path=xray, cancel_event=cancel,
+                         base_port=BASE_PORT) is None
+    assert time.monotonic() - start < 3
+
+def test_cancel_before_start_skips_server(xray, outbound, ok_url):
+    sweep = batch([outbound] * 2, xray, ok_url, on_start=lambda i: pytest.fail("started after cancel"))
+    sweep.cancel()
+    assert list(sweep) == []
+
+def test_udp_test_rejects_empty_burst(outbound, xray):
+    with pytest.raises(ValueError):
+        udp_test_outbound(outbound, count=0, xray_path=xray)
@@ -0,0 +1,73 @@
+import copy
+import json
+import os
+
+import pytest
+
+from utils import generate_xray_config, parse_vmess, parse_vless, parse_trojan, PERFORMANCE_PROFILES
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+# Set to rewrite profiles.json after an intended config change (review the diff!)
+UPDATE_GOLDEN = os.environ.get("BABYVPN_UPDATE_GOLDEN") == "1"
+
+LINKS = [
+    "vmess://eyJ2IjogIjIiLCAicHMiOiAidm1lc3MtMCIsICJhZGQiOiAiczAuZXhhbXBsZS5jb20iLCAicG9ydCI6ICI0NDMiLCAiaWQiOiAiYjgxYmI2ZTQtZTM0MC00MzQ0LWE5YzUtMmE4ZmI3MDZiMDYyIiwgImFpZCI6ICIwIiwgIm5ldCI6ICJ0Y3AiLCAidGxzIjogInRscyIsICJob3N0IjogInMwLmV4YW1wbGUuY29tIiwgInBhdGgiOiAiL3dzIiwgInNuaSI6ICJzMC5leGFtcGxlLmNvbSJ9",
+    "vless://b81bb6e4-e340-4344-a9c5-2a8fb706b062@s1.example.com:443?type=ws&security=tls&sni=s1.example.com&host=s1.example.com&path=%2F%3Fed%3D2048&fp=chrome&serviceName=grpc&mode=auto#vless-1",
+    "trojan://secret@s2.example.com:443?type=grpc&security=tls&sni=s2.example.com&host=s2.example.com&path=%2F%3Fed%3D2048&fp=chrome&serviceName=grpc&mode=auto#trojan-2",
+]
+PARSERS = {"vmess": parse_vmess, "vless": parse_vless, "trojan": parse_trojan}
+
+def outbounds():
+    return [PARSERS[link.split(":")[0]](link)[0] for link in LINKS]
+
+def load_golden(name):
+    with open(os.path.join(GOLDEN_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def profile_configs(profile):
+    configs = {}
+    for i, outbound in enumerate(outbounds()):
+        configs[f"{i}"] = generate_xray_config(outbound, profile=profile)
+        configs[f"{i}-mux"] = generate_xray_config(outbound, 1080, 1081, True, profile=profile)
+    return configs
+
+def test_update_golden():
+    if not UPDATE_GOLDEN:
+        pytest.skip("set BABYVPN_UPDATE_GOLDEN=1 to regenerate")
+    with open(os.path.join(GOLDEN_DIR, "profiles.json"), "w", encoding="utf-8") as f:
+        json.dump({p: profile_configs(p) for p in PERFORMANCE_PROFILES}, f, indent=1, sort_keys=True)
+
+@pytest.mark.parametrize("profile", list(PERFORMANCE_PROFILES))
+def test_profile_matches_golden(profile):
+    assert profile_configs(profile) == load_golden("profiles.json")[profile]
+
+@pytest.mark.parametrize("profile", list(PERFORMANCE_PROFILES))
+def test_profile_knobs_applied(profile):
+    tuning = PERFORMANCE_PROFILES[profile]
+    for outbound in outbounds():
+        config = json.loads(generate_xray_config(outbound, enable_mux=True, profile=profile))
+        assert config["log"]["loglevel"] == tuning["loglevel"]
+        assert ("access" not in config["log"]) == tuning["access_log"]
+        for inbound in config["inbounds"]:
+            assert inbound["sniffing"] == tuning["sniffing"]
+        proxy = config["outbounds"][0]
+        assert proxy["mux"] == {"enabled": True, **tuning["mux"]}
+        sockopt = proxy["streamSettings"].get("sockopt")
+        assert sockopt == (dict(tuning["sockopt"]) if tuning["sockopt"] else None)
+        if tuning["policy"]:
+            assert config["policy"]["levels"]["0"] == tuning["policy"]
+        else:
+            assert "policy" not in config
+
+@pytest.mark.parametrize("profile", [None, "balanced"])
+def test_balanced_matches_pre_profile_output(profile):
+    """balanced (the default) must keep producing exactly what the generator did before profiles."""
+    assert profile_configs(profile) == load_golden("pre_profiles.json")
+
+@pytest.mark.parametrize("profile", list(PERFORMANCE_PROFILES))
+def test_generate_leaves_outbound_untouched(profile):
+    for outbound in outbounds():
+        before = copy.deepcopy(outbound)
+        generate_xray_config(outbound, enable_mux=True, profile=profile, stats_port=10813,
+                             mux_settings={"concurrency": 2})
+        assert outbound == before
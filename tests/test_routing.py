@@ -0,0 +1,116 @@
+import ipaddress
+import json
+
+import pytest
+
+from routing import (MAX_OVERRIDE_EXPANSION, _override_patterns, bypass_rules, collapse_cidrs, compile_bypass,
+                     dedupe_domains, dedupe_keywords)
+from utils import LOOPBACK_RULE, generate_xray_config
+
+OUTBOUND = {"protocol": "freedom", "settings": {}}
+LOOPBACK = json.loads(LOOPBACK_RULE)
+
+def net(text):
+    return ipaddress.ip_network(text)
+
+# --- collapse_cidrs ---
+
+def test_collapse_merges_overlapping_and_adjacent():
+    networks, invalid = collapse_cidrs(["10.0.0.0/8", "10.1.0.0/16", "192.168.0.0/24", "192.168.1.0/24"])
+    assert networks == [net("10.0.0.0/8"), net("192.168.0.0/23")]
+    assert invalid == []
+
+def test_collapse_accepts_hosts_and_host_bits():
+    networks, _ = collapse_cidrs([" 1.2.3.4 ", "1.2.3.5/32", "8.8.8.8/24"])
+    assert networks == [net("1.2.3.4/31"), net("8.8.8.0/24")]
+
+def test_collapse_keeps_ipv6_separate_and_after_ipv4():
+    networks, _ = collapse_cidrs(["fe80::/10", "::1", "127.0.0.0/8", "fe80::1/128"])
+    assert networks == [net("127.0.0.0/8"), net("::1/128"), net("fe80::/10")]
+
+def test_collapse_reports_invalid_entries():
+    networks, invalid = collapse_cidrs(["not-an-ip", "10.0.0.0/33", "10.0.0.0/8"])
+    assert networks == [net("10.0.0.0/8")]
+    assert invalid == ["not-an-ip", "10.0.0.0/33"]
+
+# --- dedupe_domains / dedupe_keywords ---
+
+def test_dedupe_domains_drops_duplicates_and_subdomains():
+    domains = ["Example.com", "example.com.", "*.example.com", "a.b.example.com", "b.example.org", "example.org"]
+    assert dedupe_domains(domains) == ["example.com", "example.org"]
+
+def test_dedupe_domains_matches_whole_labels():
+    assert dedupe_domains(["ample.com", "example.com"]) == ["ample.com", "example.com"]
+
+def test_dedupe_domains_drops_keyword_matches_and_blanks():
+    assert dedupe_domains(["ads.example.com", "example.org", " ", "*."], keywords=["ads"]) == ["example.org"]
+
+def test_dedupe_keywords():
+    assert dedupe_keywords(["ads", "ADS", "tracker-ads", "track", " ", "tracker"]) == ["ads", "track"]
+
+# --- _override_patterns ---
+
+@pytest.mark.parametrize("cidr,patterns", [
+    ("10.0.0.0/8", ["10.*.*.*"]),
+    ("192.168.0.0/16", ["192.168.*.*"]),
+    ("192.168.1.0/24", ["192.168.1.*"]),
+    ("1.2.3.4/32", ["1.2.3.4"]),
+    ("192.168.0.0/23", ["192.168.0.*", "192.168.1.*"]),
+    ("172.16.0.0/12", [f"172.{i}.*.*" for i in range(16, 32)]),
+    ("0.0.0.0/0", []),          # Nothing to anchor a wildcard on
+    ("10.0.0.0/7", ["10.*.*.*", "11.*.*.*"]),
+    ("10.0.0.0/15", ["10.0.*.*", "10.1.*.*"]),
+    ("::1/128", ["[::1]"]),
+    ("fc00::/7", []),
+])
+def test_override_patterns(cidr, patterns):
+    assert _override_patterns(net(cidr)) == patterns
+
+def test_override_expansion_stays_within_limit():
+    # Rounding up to whole octets never takes more than 7 extra bits
+    for prefix in range(1, 33):
+        patterns = _override_patterns(net(f"0.0.0.0/{prefix}"))
+        assert 1 <= len(patterns) <= MAX_OVERRIDE_EXPANSION
+    assert len(_override_patterns(net("0.0.0.0/1"))) == 128
+
+# --- compile_bypass ---
+
+def test_compile_bypass():
+    compiled = compile_bypass(["10.0.0.0/8", "10.2.0.0/16", "geoip:cn", "bogus"],
+                              ["example.com", "www.example.com", "geosite:cn"], ["ads"])
+    assert compiled["ip"] == ["10.0.0.0/8", "geoip:cn"]
+    assert compiled["domain"] == ["domain:example.com", "keyword:ads", "geosite:cn"]
+    assert compiled["override"] == "<local>;10.*.*.*;example.com;*.example.com;*ads*"
+    assert compiled["invalid"] == ["bogus"]
+    assert [r.get("domain") or r.get("ip") for r in bypass_rules(compiled)] == [compiled["domain"], compiled["ip"]]
+
+# --- Loopback rule ---
+
+def rules(bypass):
+    return json.loads(generate_xray_config(OUTBOUND, bypass=bypass))["routing"]["rules"]
+
+@pytest.mark.parametrize("bypass", [
+    None,
+    compile_bypass([], [], []),
+    compile_bypass(["not-an-ip"], ["*."], [" "]),   # Only invalid or blank entries
+    compile_bypass(),
+    compile_bypass(["10.0.0.0/8"], ["example.com"]),
+])
+def test_loopback_rule_always_first(bypass):
+    result = rules(bypass)
+    assert result[0] == LOOPBACK
+    assert result[1:] == bypass_rules(bypass) if bypass else result == [LOOPBACK]
+
+def sniffing(profile, bypass):
+    config = json.loads(generate_xray_config(OUTBOUND, profile=profile, bypass=bypass))
+    return [inbound["sniffing"] for inbound in config["inbounds"]]
+
+def test_low_cpu_sniffs_only_for_domain_bypass():
+    assert sniffing("low-cpu", None) == [{"enabled": False}] * 2
+    assert sniffing("low-cpu", compile_bypass(cidrs=["10.0.0.0/8"], domains=[])) == [{"enabled": False}] * 2
+    domains = sniffing("low-cpu", compile_bypass(cidrs=[], domains=["example.com"]))
+    assert domains == [{"enabled": True, "destOverride": ["http", "tls"], "routeOnly": True}] * 2
+
+def test_domain_bypass_keeps_profile_sniffing():
+    bypass = compile_bypass(cidrs=[], domains=["example.com"])
+    assert sniffing("balanced", bypass) == sniffing("balanced", None)
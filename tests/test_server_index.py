@@ -0,0 +1,101 @@
+import pytest
+
+from server_index import NARROW_MAX, ServerIndex, server_host, tokenize
+
+def server(alias, protocol="vless", network="tcp", security="none", host="example.com", ping=None, favourite=False):
+    settings = {"servers": [{"address": host}]} if protocol == "trojan" else {"vnext": [{"address": host}]}
+    cfg = {"alias": alias, "last_ping": ping,
+           "outbound": {"protocol": protocol, "settings": settings,
+                        "streamSettings": {"network": network, "security": security}}}
+    if favourite:
+        cfg["favourite"] = True
+    return cfg
+
+CONFIGS = [
+    server("Frankfurt 1", "vless", "ws", "tls", "fra1.example.net", ping=250),
+    server("Frankfurt 2", "vmess", "tcp", "none", "fra2.example.net", ping="Fail"),
+    server("Tokyo", "trojan", "grpc", "tls", "tyo.example.org", ping=90, favourite=True),
+    server("Paris", "vless", "ws", "reality", "par.example.net"),
+    server("France Backup", "vmess", "ws", "tls", "backup.example.com", ping=1200),
+    server("Osaka", "trojan", "tcp", "tls", "osa.example.org", ping=90),
+]
+
+@pytest.fixture
+def index():
+    return ServerIndex([dict(cfg) for cfg in CONFIGS])
+
+def search(index, query, by_latency=False):
+    return list(index.ordered(index.search(query), by_latency=by_latency))
+
+def test_tokenize_and_host():
+    assert tokenize("Frankfurt-1 (DE)") == ["frankfurt", "1", "de"]
+    assert tokenize(None) == []
+    assert server_host(CONFIGS[2]["outbound"]) == "tyo.example.org"
+    assert server_host(CONFIGS[0]["outbound"]) == "fra1.example.net"
+    assert server_host({}) == ""
+
+# --- Filtering ---
+
+def test_empty_query_matches_everything(index):
+    assert index.search("") is None
+    assert index.search("   ") is None
+    assert search(index, "") == list(range(len(CONFIGS)))
+
+@pytest.mark.parametrize("query,expected", [
+    ("fra", [0, 1, 4]),             # alias prefix ("Frankfurt", "France") and host prefix ("fra1")
+    ("FRANK", [0, 1]),
+    ("frankfurt 2", [1]),            # Terms are ANDed
+    ("fra1", [0]),                   # Host words
+    ("example org", [2, 5]),
+    ("rt", []),                      # Prefixes only, not substrings
+    ("proto:vless", [0, 3]),
+    ("proto:TROJAN", [2, 5]),
+    ("net:ws sec:tls", [0, 4]),
+    ("sec:reality", [3]),
+    ("net:quic", []),
+    ("ms:<100", [2, 5]),
+    ("ms:>200", [0, 4]),
+    ("ms:90-250", [0, 2, 5]),
+    ("ms:90", [2, 5]),
+    ("ms:abc", []),
+    ("is:fail", [1]),
+    ("is:untested", [3]),
+    ("is:fav", [2]),
+    ("fra net:ws ms:<1000", [0]),
+    ("nomatch proto:vless", []),
+    ("-- proto:vmess", [1, 4]),      # Terms without words are ignored
+])
+def test_filtering(index, query, expected):
+    assert search(index, query) == expected
+
+def test_prefix_narrowing_matches_fresh_search(index):
+    # Typing one character at a time narrows cached results; the answer must not depend on history
+    for end in range(1, len("frankfurt") + 1):
+        typed = search(index, "frankfurt"[:end])
+        assert typed == search(ServerIndex([dict(cfg) for cfg in CONFIGS]), "frankfurt"[:end])
+
+def test_large_cached_prefix_uses_bisect():
+    configs = [server(f"node{i}", host=f"h{i}.example.com") for i in range(NARROW_MAX + 10)]
+    index = ServerIndex(configs)
+    assert len(index.search("n")) == len(configs)
+    assert index.search("node1000") == {1000}
+
+# --- Ordering ---
+
+def test_latency_order(index):
+    # Fastest first (ties in list order), then failures, then untested
+    assert search(index, "", by_latency=True) == [2, 5, 0, 4, 1, 3]
+    assert search(index, "fra", by_latency=True) == [0, 4, 1]
+
+def test_ping_results_need_invalidate(index):
+    assert search(index, "", by_latency=True)[0] == 2
+    index.configs[3]["last_ping"] = 10
+    assert search(index, "", by_latency=True)[0] == 2   # Stale until invalidated
+    index.invalidate_latency()
+    assert search(index, "", by_latency=True)[0] == 3
+    assert search(index, "ms:<50") == [3]
+
+def test_rebuild_picks_up_new_servers(index):
+    configs = index.configs + [server("Frankfurt 3", host="fra3.example.net", ping=5)]
+    index.rebuild(configs)
+    assert search(index, "frankfurt", by_latency=True) == [6, 0, 1]
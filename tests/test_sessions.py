@@ -0,0 +1,125 @@
+import json
+import socket
+import time
+
+import pytest
+
+from harness import install_fake_xray
+from routing import compile_bypass
+from sessions import SessionCore, SessionError, next_free_ports
+
+OUTBOUND = {"protocol": "freedom", "settings": {}}
+
+def session(tag="browser", **overrides):
+    socks_port, http_port = next_free_ports(start=20900)
+    return {"tag": tag, "alias": tag, "outbound": OUTBOUND, "socks_port": socks_port, "http_port": http_port,
+            **overrides}
+
+@pytest.fixture
+def core(tmp_path):
+    return SessionCore(xray_path=str(tmp_path / "missing-xray"), startup_delay=0)
+
+def test_missing_core_binary_is_session_error(core):
+    with pytest.raises(SessionError, match="Failed to start"):
+        core.start([session()])
+    assert not core.running
+    assert core.sessions == {}
+
+@pytest.mark.parametrize("bad", [
+    "not-a-session",
+    {"tag": "browser", "socks_port": 20900},              # no outbound
+    session(outbound="vmess://..."),
+    session(tag=None),
+    session(tag=["browser"]),
+    session(tag="direct"),                                # reserved
+    session(socks_port="20900"),
+    session(socks_port=70000),
+    session(socks_port=None, http_port=None),
+])
+def test_malformed_session_is_session_error(core, bad):
+    with pytest.raises(SessionError):
+        core.start([bad])
+
+def test_duplicate_tags_rejected(core):
+    first = session()
+    second = session(socks_port=first["socks_port"] + 10, http_port=first["http_port"] + 10)
+    with pytest.raises(SessionError, match="already in use"):
+        core.start([first, second])
+
+# --- Adding and removing through the core's API (stub core) ---
+
+def accepts(port):
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+def wait_until(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.05)
+    return check()
+
+@pytest.fixture
+def live_core(tmp_path):
+    api_port, stats_port = next_free_ports(start=20960)
+    options = {"bypass": compile_bypass()}
+    core = SessionCore(config_kwargs=lambda: dict(options), api_port=api_port, stats_port=stats_port,
+                       xray_path=install_fake_xray(str(tmp_path)), startup_delay=0.5)
+    calls = []
+    api = core.runner.api
+    def spy(server, command, *args, **kwargs):
+        calls.append(command)
+        return api(server, command, *args, **kwargs)
+    core.runner.api = spy
+    core.options, core.calls = options, calls
+    try:
+        yield core
+    finally:
+        core.stop()
+
+def tags_in(config_json):
+    config = json.loads(config_json)
+    return sorted(o["tag"] for o in config["outbounds"] if o["tag"] not in ("direct", "dns-out"))
+
+def test_add_and_remove_through_api(live_core):
+    first = session("alice", socks_port=20970, http_port=20971)
+    second = session("bob", socks_port=20972, http_port=20973)
+    live_core.start([first])
+    assert live_core.running and accepts(20970)
+    pid = live_core.runner.process.pid
+
+    live_core.add(second)
+    assert live_core.calls == ["ado", "adrules", "adi"]
+    assert wait_until(lambda: accepts(20972) and accepts(20973))
+    assert live_core.runner.process.pid == pid  # Same core; alice was never interrupted
+    assert sorted(live_core.sessions) == ["alice", "bob"]
+    assert tags_in(live_core.runner._last_config) == ["alice", "bob"]
+
+    live_core.calls.clear()
+    live_core.remove("alice")
+    assert live_core.calls == ["rmi", "rmrules", "rmo"]
+    assert wait_until(lambda: not accepts(20970))
+    assert accepts(20972)
+    assert tags_in(live_core.runner._last_config) == ["bob"]
+
+    live_core.remove("bob")  # Last session: the core itself stops
+    assert not live_core.running and live_core.sessions == {}
+
+def test_failed_add_is_rolled_back(live_core):
+    live_core.start([session("alice", socks_port=20970, http_port=20971)])
+    with pytest.raises(SessionError, match="already in use"):
+        live_core.add(session("carol", socks_port=20970, http_port=20975))
+    assert live_core.calls == []
+    assert sorted(live_core.sessions) == ["alice"]
+
+def test_config_options_are_read_on_each_rebuild(live_core):
+    live_core.start([session("alice", socks_port=20970, http_port=20971)])
+    assert "domain:example.org" not in live_core.runner._last_config
+    live_core.options["bypass"] = compile_bypass(domains=["example.org"])
+    live_core.add(session("bob", socks_port=20972, http_port=20973))
+    # The restart config (used if the core crashes) follows the current settings
+    assert "domain:example.org" in live_core.runner._last_config
@@ -0,0 +1,129 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from traffic import TrafficPoller, counter_delta, tag_rates
+
+INTERVAL = 0.1
+
+def counters(proxy, inbounds):
+    """A /debug/vars body shaped like the core's: stats.outbound / stats.inbound counters."""
+    def pair(up, down):
+        return {"uplink": up, "downlink": down}
+    return {
+        "cmdline": ["xray"],
+        "stats": {
+            "outbound": {"proxy": pair(*proxy), "direct": pair(7, 7)},
+            "inbound": {tag: pair(*values) for tag, values in inbounds.items()},
+        },
+    }
+
+class FakeVars:
+    """Serves the given /debug/vars bodies in order (repeating the last); None answers 500."""
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        owner = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/debug/vars":
+                    self.send_error(404)
+                    return
+                body = owner.bodies.pop(0) if len(owner.bodies) > 1 else owner.bodies[0]
+                if body is None:
+                    self.send_error(500)
+                    return
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def poll(bodies, count=2, **kwargs):
+    """Runs a TrafficPoller against FakeVars until it has produced `count` samples."""
+    fake = FakeVars(bodies)
+    samples, done = [], threading.Event()
+    def on_sample(sample):
+        samples.append(sample)
+        if len(samples) >= count:
+            done.set()
+    poller = TrafficPoller(on_sample, port=fake.port, interval=INTERVAL, **kwargs)
+    poller.start()
+    try:
+        assert done.wait(5), f"only {len(samples)} samples"
+    finally:
+        poller.stop()
+        fake.close()
+    return samples[:count]
+
+def assert_rates(sample, up_delta, down_delta):
+    # Both rates share one elapsed time, which is at least the poll interval
+    elapsed = up_delta / sample["up_rate"]
+    assert sample["down_rate"] == pytest.approx(down_delta / elapsed)
+    assert INTERVAL * 0.9 <= elapsed < 2
+
+# --- TrafficPoller ---
+
+def test_rates_and_totals_across_two_polls():
+    first, second = poll([
+        counters((100, 1000), {"socks": (60, 600), "http": (40, 400)}),
+        counters((300, 1500), {"socks": (160, 900), "http": (40, 400)}),
+    ])
+    assert (first["up_delta"], first["down_delta"]) == (100, 1000)
+    assert (first["up_total"], first["down_total"]) == (100, 1000)
+    assert_rates(first, 100, 1000)
+
+    assert (second["up_delta"], second["down_delta"]) == (200, 500)
+    assert (second["up_total"], second["down_total"]) == (300, 1500)
+    assert_rates(second, 200, 500)
+    assert second["outbounds"]["direct"] == {"uplink": 7, "downlink": 7}
+
+    socks, http = second["inbounds"]["socks"], second["inbounds"]["http"]
+    assert (socks["up_total"], socks["down_total"]) == (160, 900)
+    assert (http["up_total"], http["down_total"]) == (40, 400)
+    assert http["up_rate"] == http["down_rate"] == 0
+    assert socks["down_rate"] == pytest.approx(second["down_rate"] * 300 / 500)
+
+def test_core_restart_and_failed_polls():
+    first, second = poll([
+        counters((500, 5000), {"socks": (500, 5000)}),
+        None,                                   # Core restarting: no sample for this tick
+        counters((50, 80), {"socks": (50, 80)}),  # Counters went backwards: core restarted
+    ])
+    assert (second["up_delta"], second["down_delta"]) == (50, 80)
+    assert (second["up_total"], second["down_total"]) == (550, 5080)
+    assert second["inbounds"]["socks"]["up_total"] == 550
+
+def test_poller_without_outbound_tag():
+    (sample,) = poll([counters((100, 100), {"alice-socks": (10, 20)})], count=1, outbound_tag=None)
+    assert sample["up_total"] == sample["down_total"] == 0
+    assert sample["inbounds"]["alice-socks"]["down_total"] == 20
+
+# --- tag_rates ---
+
+def test_tag_rates():
+    totals = {}
+    before = {"a": {"uplink": 100, "downlink": 200}, "gone": {"uplink": 1, "downlink": 1}}
+    tag_rates({}, before, totals, 1.0)
+    rates = tag_rates(before, {"a": {"uplink": 300, "downlink": 250}, "b": {"uplink": 10}}, totals, 2.0)
+    assert rates["a"] == {"up_rate": 100.0, "down_rate": 25.0, "up_total": 300, "down_total": 250}
+    assert rates["b"] == {"up_rate": 5.0, "down_rate": 0.0, "up_total": 10, "down_total": 0}
+    assert "gone" not in totals
+
+def test_counter_delta():
+    assert counter_delta(100, 150) == 50
+    assert counter_delta(100, 30) == 30
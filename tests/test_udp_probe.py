@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import fake_xray
+from udp_probe import probe_udp, udp_associate
+
+ECHO_DELAY = 0.02   # Seconds the echo server holds each reply
+
+class EchoServer:
+    """UDP echo on 127.0.0.1 that answers after ECHO_DELAY and drops the datagrams listed in `drop` (by order)."""
+    def __init__(self, drop=()):
+        self.drop = set(drop)
+        self.seen = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(65536)
+            except OSError:
+                return
+            index, self.seen = self.seen, self.seen + 1
+            if index not in self.drop:
+                time.sleep(ECHO_DELAY)
+                self.sock.sendto(data, addr)
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def socks_port():
+    """A SOCKS5 inbound from the fake core, which relays UDP ASSOCIATE like the real one."""
+    server = fake_xray.open_inbound({"protocol": "socks", "port": 0, "tag": "socks-in"})
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def echo():
+    servers = []
+    def make(drop=()):
+        servers.append(EchoServer(drop))
+        return servers[-1]
+    yield make
+    for server in servers:
+        server.close()
+
+def free_port(kind=socket.SOCK_DGRAM):
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_udp_associate_returns_relay(socks_port):
+    control, relay = udp_associate(socks_port)
+    with control:
+        assert relay[0] == "127.0.0.1"
+        assert relay[1] > 0
+
+def test_probe_measures_rtt(socks_port, echo):
+    server = echo()
+    result = probe_udp(socks_port, target=server.address, count=5, interval=0.01, timeout=1)
+    assert result["sent"] == result["received"] == 5
+    assert result["loss"] == 0.0
+    assert ECHO_DELAY * 1000 <= result["rtt_ms"] < 500
+
+def test_probe_counts_loss(socks_port, echo):
+    server = echo(drop={1, 3})
+    result = probe_udp(socks_port, target=server.address, count=5, interval=0.01, timeout=0.5)
+    assert result["received"] == 3
+    assert result["loss"] == 0.4
+    assert result["rtt_ms"] is not None
+
+def test_probe_times_out_without_replies(socks_port):
+    start = time.perf_counter()
+    result = probe_udp(socks_port, target=("127.0.0.1", free_port()), count=3, interval=0.01, timeout=0.3)
+    elapsed = time.perf_counter() - start
+    assert result == {"rtt_ms": None, "loss": 1.0, "sent": 3, "received": 0}
+    assert 0.3 <= elapsed < 2
+
+def test_probe_without_socks_server():
+    assert probe_udp(free_port(socket.SOCK_STREAM), target=("127.0.0.1", 9), count=1, timeout=0.1) is None
+
+@pytest.mark.parametrize("count", [0, -1])
+def test_probe_rejects_empty_burst(count):
+    # count=0 used to spin forever: the reply deadline is only set once the burst is sent
+    with pytest.raises(ValueError):
+        probe_udp(free_port(socket.SOCK_STREAM), count=count)
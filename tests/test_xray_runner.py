@@ -0,0 +1,164 @@
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import pytest
+
+import xray_runner
+from xray_runner import XrayRunner, reap_orphans
+
+@pytest.fixture
+def crashing_core(tmp_path):
+    """A core binary that exits as soon as it starts."""
+    path = tmp_path / "xray"
+    path.write_text("#!/bin/sh\nexit 3\n")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return path
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(xray_runner, "RESTART_BACKOFF_MIN", 0.05)
+    monkeypatch.setattr(xray_runner, "RESTART_BACKOFF_MAX", 0.2)
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a shell-script core")
+def test_restart_failure_keeps_backing_off(tmp_path, crashing_core, fast_backoff):
+    runner = XrayRunner(config_filename=str(tmp_path / "config.json"), log_filename=None,
+                        xray_path=str(crashing_core))
+    events, done = [], threading.Event()
+    def on_event(kind, info):
+        events.append((kind, info))
+        if kind == "crashed" and len([k for k, _ in events if k == "restart_failed"]) >= 2:
+            done.set()
+
+    assert runner.start("{}")
+    crashing_core.unlink()  # Every restart from now on raises FileNotFoundError
+    runner.supervise(on_event, name="test", interval=0.02)
+    try:
+        assert done.wait(10), events
+    finally:
+        runner.stop()
+
+    failures = [info for kind, info in events if kind == "restart_failed"]
+    assert "not found" in failures[0]["error"]
+    # Backoff keeps doubling up to the cap after each failed attempt
+    crashes = [info["retry_in"] for kind, info in events if kind == "crashed"]
+    assert crashes[:3] == [0.05, 0.1, 0.2]
+    assert [f["retry_in"] for f in failures[:2]] == [0.1, 0.2]
+    assert not any(kind == "restarted" for kind, _ in events)
+
+@pytest.fixture
+def idle_core(tmp_path):
+    """A core binary that stays up until stopped."""
+    path = tmp_path / "xray-idle"
+    path.write_text("#!/bin/sh\nexec sleep 30\n")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return path
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a shell-script core")
+def test_supervise_right_after_stop_starts_new_watcher(tmp_path, idle_core):
+    runner = XrayRunner(config_filename=str(tmp_path / "config.json"), log_filename=None, xray_path=str(idle_core))
+    in_callback, release = threading.Event(), threading.Event()
+    def stuck(kind, info):
+        in_callback.set()
+        release.wait(10)  # The old watcher is still busy when the next connect supervises
+
+    try:
+        assert runner.start("{}")
+        runner.supervise(stuck, interval=0.02)
+        assert in_callback.wait(5)
+        old = runner._watcher
+        runner.stop()
+
+        samples = threading.Event()
+        assert runner.start("{}")
+        runner.supervise(lambda kind, info: kind == "sample" and samples.set(), interval=0.02)
+        assert runner._watcher is not old
+        assert samples.wait(5), "the new connection is not supervised"
+
+        release.set()
+        old.join(5)
+        assert not old.is_alive()
+        assert runner._watcher.is_alive()  # Stopping the old watcher didn't stop the new one
+    finally:
+        release.set()
+        runner.stop()
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a shell-script core")
+def test_restart_count_resets_per_supervised_run(tmp_path, crashing_core, idle_core, fast_backoff):
+    runner = XrayRunner(config_filename=str(tmp_path / "config.json"), log_filename=None,
+                        xray_path=str(crashing_core))
+    restarted = threading.Event()
+    try:
+        assert runner.start("{}")
+        runner.supervise(lambda kind, info: kind == "crashed" and info["restarts"] >= 2 and restarted.set(),
+                         interval=0.02)
+        assert restarted.wait(10)
+        runner.stop()
+        assert runner.restarts >= 2
+
+        runner.xray_path = str(idle_core)
+        samples = []
+        assert runner.start("{}")
+        runner.supervise(lambda kind, info: samples.append(info) if kind == "sample" else None, interval=0.02)
+        assert runner.restarts == 0
+        deadline = time.monotonic() + 5
+        while not samples and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert samples and samples[-1]["restarts"] == 0
+    finally:
+        runner.stop()
+
+# --- Orphan reaping ---
+
+def spawn_core(xray, parent_cmd=None):
+    """
+    Starts a fake core: a copy of sh whose `-c` argument looks like a BabyVPN temp config.
+    With parent_cmd the core is started by that (still running) process instead of this one.
+    """
+    core = [str(xray), "-c", f"{xray_runner.RUNTIME_DIR}/missing_config.json 2>/dev/null; sleep 10; true"]
+    if parent_cmd is None:
+        return subprocess.Popen(core), None
+    launcher = ("import subprocess, sys, time; p = subprocess.Popen(%r); print(p.pid, flush=True); time.sleep(30)"
+                % (core,))
+    parent = subprocess.Popen(parent_cmd + ["-c", launcher], stdout=subprocess.PIPE, text=True)
+    return psutil.Process(int(parent.stdout.readline())), parent
+
+@pytest.fixture
+def app_dir(tmp_path):
+    app = tmp_path / "app"
+    app.mkdir()
+    shutil.copy(shutil.which("sh"), app / "xray")
+    (app / "main.py").write_text("import sys; exec(sys.argv[2])\n")
+    return app
+
+@pytest.fixture
+def processes():
+    started = []
+    yield started
+    for proc in started:
+        try:
+            proc.kill()
+        except (OSError, psutil.Error):
+            pass
+
+@pytest.mark.skipif(os.name == "nt", reason="uses a copy of sh as the core")
+def test_reap_orphans_by_parent(tmp_path, app_dir, processes):
+    xray = app_dir / "xray"
+    ours, _ = spawn_core(xray)
+    # Re-parented to something that isn't BabyVPN (as with `systemd --user`)
+    foreign, foreign_parent = spawn_core(xray, [sys.executable])
+    # Started by another BabyVPN instance running from source
+    sibling, sibling_parent = spawn_core(xray, [sys.executable, str(app_dir / "main.py")])
+    processes.extend([ours, foreign, foreign_parent, sibling, sibling_parent])
+    time.sleep(0.2)
+
+    reaped = reap_orphans(str(xray), directory=str(tmp_path / "runtime"))
+    assert reaped == [foreign.pid]
+    assert ours.poll() is None
+    assert sibling.is_running()
+    assert not foreign.is_running() or foreign.status() == psutil.STATUS_ZOMBIE
@@ -0,0 +1,131 @@
+import threading
+import time
+import requests
+from utils import PROXY_TAG
+from metrics import set_gauge
+
+# --- Live Traffic Statistics ---
+
+# The core serves its counters as JSON on this port (config "metrics" section)
+STATS_PORT = 10813
+STATS_INTERVAL = 1       # Seconds between polls
+STATS_TIMEOUT = 0.5
+
+def fetch_counters(session, port=STATS_PORT, timeout=STATS_TIMEOUT):
+    """
+    Reads the core's traffic counters from /debug/vars.
+    Returns {"inbound": {tag: {"uplink": n, "downlink": n}}, "outbound": {...}}.
+    """
+    resp = session.get(f"http://127.0.0.1:{port}/debug/vars", timeout=timeout)
+    resp.raise_for_status()
+    stats = resp.json().get("stats") or {}
+    return {
+        "inbound": stats.get("inbound") or {},
+        "outbound": stats.get("outbound") or {},
+    }
+
+def counter_delta(previous, current):
+    """Bytes since the last poll; a counter that went backwards means the core restarted."""
+    return current if current < previous else current - previous
+
+def tag_rates(previous, current, totals, elapsed):
+    """
+    Per-tag {"up_rate", "down_rate", "up_total", "down_total"} between two counter snapshots.
+    totals ({tag: [up, down]}) is updated in place; tags that disappeared are dropped from it.
+    """
+    rates = {}
+    for tag in list(totals):
+        if tag not in current:
+            del totals[tag]
+    for tag, counter in current.items():
+        before = previous.get(tag, {})
+        up = counter_delta(before.get("uplink", 0), counter.get("uplink", 0))
+        down = counter_delta(before.get("downlink", 0), counter.get("downlink", 0))
+        total = totals.setdefault(tag, [0, 0])
+        total[0] += up
+        total[1] += down
+        rates[tag] = {"up_rate": up / elapsed, "down_rate": down / elapsed, "up_total": total[0], "down_total": total[1]}
+    return rates
+
+class TrafficPoller:
+    """
+    Polls the connected core's counters about once a second.
+
+    on_sample(sample) is called from the poller thread with:
+        up_rate / down_rate     bytes per second through the proxy outbound
+        up_delta / down_delta   bytes since the previous sample
+        up_total / down_total   bytes this session
+        outbounds               raw {tag: {"uplink", "downlink"}} counters
+        inbounds                per local port tag: see tag_rates()
+    """
+    def __init__(self, on_sample, port=STATS_PORT, interval=STATS_INTERVAL, outbound_tag=PROXY_TAG):
+        self.on_sample = on_sample
+        self.port = port
+        self.interval = interval
+        self.outbound_tag = outbound_tag
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # One keep-alive connection for the whole session instead of a handshake per poll
+        session = requests.Session()
+        session.trust_env = False  # Never route the poll through the system proxy we just set
+        last_up = last_down = 0
+        up_total = down_total = 0
+        last_inbounds, inbound_totals = {}, {}
+        last_time = time.monotonic()
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    counters = fetch_counters(session, self.port)
+                except (requests.RequestException, ValueError):
+                    continue  # Core still starting or restarting; try again next tick
+
+                proxy = counters["outbound"].get(self.outbound_tag, {})
+                up, down = proxy.get("uplink", 0), proxy.get("downlink", 0)
+                up_delta, down_delta = counter_delta(last_up, up), counter_delta(last_down, down)
+                last_up, last_down = up, down
+                up_total += up_delta
+                down_total += down_delta
+
+                now = time.monotonic()
+                elapsed = max(now - last_time, 1e-3)
+                last_time = now
+
+                sample = {
+                    "up_rate": up_delta / elapsed,
+                    "down_rate": down_delta / elapsed,
+                    "up_delta": up_delta,
+                    "down_delta": down_delta,
+                    "up_total": up_total,
+                    "down_total": down_total,
+                    "outbounds": counters["outbound"],
+                    "inbounds": tag_rates(last_inbounds, counters["inbound"], inbound_totals, elapsed),
+                }
+                last_inbounds = counters["inbound"]
+                if self.outbound_tag:  # None: per-port figures only (multi-session core)
+                    set_gauge("babyvpn_traffic_bytes_per_second", sample["up_rate"], direction="up")
+                    set_gauge("babyvpn_traffic_bytes_per_second", sample["down_rate"], direction="down")
+                self.on_sample(sample)
+        finally:
+            session.close()
+
+def format_bytes(n):
+    """Human-readable size, e.g. 1.4 MB."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
@@ -0,0 +1,125 @@
+import socket
+import statistics
+import struct
+import time
+from dns_config import build_query
+
+# --- UDP Path Probe (SOCKS5 UDP ASSOCIATE) ---
+
+# A DNS query doubles as the probe payload: a DNS server answers with the same id and
+# a plain UDP echo server returns it unchanged, so replies are matched the same way.
+UDP_TARGET = ("1.1.1.1", 53)
+UDP_PROBE_NAME = "www.google.com"
+UDP_BURST = 10
+UDP_INTERVAL = 0.05      # Seconds between packets in a burst
+UDP_TIMEOUT = 2          # Seconds to wait for stragglers after the last packet
+
+class SocksError(Exception):
+    pass
+
+def _recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise SocksError("SOCKS server closed the control connection.")
+        data += chunk
+    return data
+
+def _pack_address(host, port):
+    try:
+        return b"\x01" + socket.inet_aton(host) + struct.pack("!H", port)
+    except OSError:
+        encoded = host.encode("idna")
+        return b"\x03" + bytes([len(encoded)]) + encoded + struct.pack("!H", port)
+
+def _header_length(data):
+    """Length of the SOCKS5 UDP request header at the start of a datagram."""
+    atyp = data[3]
+    if atyp == 1:
+        return 10
+    if atyp == 4:
+        return 22
+    return 7 + data[4]
+
+def udp_associate(socks_port, host="127.0.0.1", timeout=5):
+    """
+    Opens a UDP association on a no-auth SOCKS5 server.
+    Returns (control_socket, relay_address); the association lives as long as control_socket.
+    """
+    control = socket.create_connection((host, socks_port), timeout=timeout)
+    try:
+        control.sendall(b"\x05\x01\x00")
+        if _recv_exact(control, 2) != b"\x05\x00":
+            raise SocksError("SOCKS server refused no-auth.")
+        control.sendall(b"\x05\x03\x00\x01" + socket.inet_aton("0.0.0.0") + struct.pack("!H", 0))
+        ver, rep, _, atyp = _recv_exact(control, 4)
+        if rep != 0:
+            raise SocksError(f"UDP ASSOCIATE rejected (code {rep}).")
+        if atyp == 1:
+            relay_host = socket.inet_ntoa(_recv_exact(control, 4))
+        elif atyp == 4:
+            relay_host = socket.inet_ntop(socket.AF_INET6, _recv_exact(control, 16))
+        else:
+            relay_host = _recv_exact(control, _recv_exact(control, 1)[0]).decode()
+        relay_port = struct.unpack("!H", _recv_exact(control, 2))[0]
+    except Exception:
+        control.close()
+        raise
+    # An unspecified bind address means "same host as the control connection"
+    if relay_host in ("0.0.0.0", "::"):
+        relay_host = host
+    return control, (relay_host, relay_port)
+
+def probe_udp(socks_port, target=UDP_TARGET, count=UDP_BURST, interval=UDP_INTERVAL,
+              timeout=UDP_TIMEOUT, name=UDP_PROBE_NAME):
+    """
+    Sends a burst of `count` datagrams to target through the SOCKS inbound and matches replies.
+    Returns {"rtt_ms": median or None, "loss": fraction lost, "sent": n, "received": n},
+    or None if the UDP association itself failed. count must be at least 1.
+    """
+    if count < 1:
+        raise ValueError(f"UDP burst needs at least one datagram, got count={count}")
+    try:
+        control, relay = udp_associate(socks_port)
+    except (OSError, SocksError):
+        return None
+
+    header = b"\x00\x00\x00" + _pack_address(*target)
+    sent_at = {}
+    rtts = []
+    with control, socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        last_send = 0
+        deadline = None
+        while deadline is None or (time.perf_counter() < deadline and len(rtts) < count):
+            now = time.perf_counter()
+            if len(sent_at) + len(rtts) < count and now - last_send >= interval:
+                query_id, payload = build_query(name, query_id=len(sent_at) + len(rtts))
+                sent_at[query_id] = last_send = now
+                sock.sendto(header + payload, relay)
+                if len(sent_at) + len(rtts) == count:
+                    deadline = now + timeout
+
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                time.sleep(0.002)
+                continue
+            except OSError:
+                break
+            if len(data) < 10:
+                continue
+            payload = data[_header_length(data):]
+            # pop() so duplicated replies are only counted once
+            start = sent_at.pop(struct.unpack("!H", payload[:2])[0], None) if len(payload) >= 2 else None
+            if start is not None:
+                rtts.append(time.perf_counter() - start)
+
+    received = len(rtts)
+    return {
+        "rtt_ms": int(statistics.median(rtts) * 1000) if rtts else None,
+        "loss": round(1 - received / count, 3) if count else 0.0,
+        "sent": count,
+        "received": received,
+    }
@@ -1,23 +1,36 @@
-import winreg
+try:
+    import winreg
+except ImportError:  # Non-Windows (benchmarks / tooling); proxy management is unavailable
+    winreg = None
 import ctypes
+import functools
 import os
 import json
 import base64
 import urllib.parse
 import re
+from metrics import timed
+from routing import bypass_rules
+from dns_config import build_dns
 
 # --- Proxy Management ---
 
-def set_system_proxy(enable=True, server="127.0.0.1:10809"):
+def set_system_proxy(enable=True, server="127.0.0.1:10809", override="<local>", pac_url=None):
     """
     Sets or unsets the Windows system proxy.
+    override is the ProxyOverride bypass list (see routing.compile_bypass).
+    With pac_url, the system uses that PAC script (AutoConfigURL) instead of a global proxy.
     """
     try:
         INTERNET_SETTINGS = winreg.OpenKey(winreg.HKEY_CURRENT_USER,
             r'Software\Microsoft\Windows\CurrentVersion\Internet Settings',
             0, winreg.KEY_ALL_ACCESS)
 
-        if enable:
+        if enable and pac_url:
+            # PAC mode: per-request decisions come from the script, so no global proxy
+            winreg.SetValueEx(INTERNET_SETTINGS, 'AutoConfigURL', 0, winreg.REG_SZ, pac_url)
+            winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyEnable', 0, winreg.REG_DWORD, 0)
+        elif enable:
             # Disable Auto Detect and Auto Config URL to avoid conflicts
             try: winreg.DeleteValue(INTERNET_SETTINGS, 'AutoConfigURL')
             except FileNotFoundError: pass
@@ -27,9 +40,12 @@ def set_system_proxy(enable=True, server="127.0.0.1:10809"):
             
             winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyEnable', 0, winreg.REG_DWORD, 1)
             winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyServer', 0, winreg.REG_SZ, server)
-            winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyOverride', 0, winreg.REG_SZ, '<local>')
+            winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyOverride', 0, winreg.REG_SZ, override)
         else:
             winreg.SetValueEx(INTERNET_SETTINGS, 'ProxyEnable', 0, winreg.REG_DWORD, 0)
+            if pac_url:
+                try: winreg.DeleteValue(INTERNET_SETTINGS, 'AutoConfigURL')
+                except FileNotFoundError: pass
     
         winreg.CloseKey(INTERNET_SETTINGS)
         
@@ -411,70 +427,350 @@ def parse_trojan(link):
         print(f"Error parsing Trojan: {e}")
         return None, None
 
-def generate_xray_config(outbound_config, socks_port=10808, http_port=10809, enable_mux=False):
-    """Generates the full config.json content for Xray."""
-    if not outbound_config:
-        return None
-        
-    if enable_mux and "mux" not in outbound_config.get("streamSettings", {}):
-        outbound_config["mux"] = {
-            "enabled": True,
-            "concurrency": 8
-        }
+# --- Performance Profiles ---
 
-    config = {
-        "log": {
-            "loglevel": "warning"
-        },
-        "inbounds": [
-            {
-                "port": socks_port,
-                "protocol": "socks",
-                "settings": {
-                    "auth": "noauth",
-                    "udp": True
-                },
-                "sniffing": {
-                    "enabled": True,
-                    "destOverride": ["http", "tls"]
-                },
-                "tag": "socks-in"
+DEFAULT_PROFILE = "balanced"
+
+# Tuning knobs applied by generate_xray_config. "balanced" is the historical behaviour.
+PERFORMANCE_PROFILES = {
+    "balanced": {
+        "loglevel": "warning",
+        "access_log": True,
+        "sniffing": {"enabled": True, "destOverride": ["http", "tls"]},
+        "sockopt": None,
+        "policy": None,
+        "mux": {"concurrency": 8},
+    },
+    "low-latency": {
+        "loglevel": "warning",
+        "access_log": True,
+        # Sniffed domains only steer routing; the core keeps the resolved IP
+        "sniffing": {"enabled": True, "destOverride": ["http", "tls"], "routeOnly": True},
+        "sockopt": {"tcpFastOpen": True, "tcpNoDelay": True, "tcpKeepAliveInterval": 15},
+        "policy": {"handshake": 4, "connIdle": 120, "uplinkOnly": 1, "downlinkOnly": 1, "bufferSize": 4},
+        "mux": {"concurrency": 4, "xudpConcurrency": 8},
+    },
+    "high-throughput": {
+        "loglevel": "warning",
+        "access_log": False,
+        "sniffing": {"enabled": True, "destOverride": ["http", "tls"], "routeOnly": True},
+        "sockopt": {"tcpFastOpen": True, "tcpKeepAliveInterval": 30},
+        "policy": {"handshake": 8, "connIdle": 600, "uplinkOnly": 2, "downlinkOnly": 5, "bufferSize": 512},
+        "mux": {"concurrency": 16, "xudpConcurrency": 16},
+    },
+    "low-cpu": {
+        "loglevel": "error",
+        "access_log": False,
+        # Sniffing costs a read of every new connection; it is only switched back on (routeOnly)
+        # when the bypass has domain rules that must also match connections made by IP
+        "sniffing": {"enabled": False},
+        "sockopt": {"tcpKeepAliveInterval": 60},
+        "policy": {"handshake": 4, "connIdle": 300, "uplinkOnly": 2, "downlinkOnly": 5, "bufferSize": 16},
+        "mux": {"concurrency": 8, "xudpConcurrency": 8},
+    },
+}
+
+def get_profile(name=None):
+    """Returns the named performance profile, falling back to the default."""
+    return PERFORMANCE_PROFILES.get(name or DEFAULT_PROFILE, PERFORMANCE_PROFILES[DEFAULT_PROFILE])
+
+# Tag given to the server's outbound so the stats counters can find it
+PROXY_TAG = "proxy"
+
+# --- Config Templates ---
+
+# Configs are assembled from pre-serialized JSON fragments instead of being rebuilt and dumped
+# whole on every call. Templates are cached by the outbound's serialized content, so a dict
+# edited in place simply misses the cache instead of serving a stale fragment.
+TEMPLATE_CACHE_SIZE = 4096
+
+def _dumps(value):
+    # Compact: configs are piped straight into the core, nobody reads them
+    return json.dumps(value, separators=(",", ":"))
+
+DIRECT_OUTBOUND = _dumps({"protocol": "freedom", "tag": "direct", "settings": {}})
+DNS_OUTBOUND = _dumps({"protocol": "dns", "tag": "dns-out"})
+DNS_RULE = _dumps({"type": "field", "inboundTag": ["dns-in"], "outboundTag": "dns-out"})
+# Core services reachable on api_port, for adding and removing sessions while it runs
+API_SERVICES = ["HandlerService", "RoutingService"]
+# Always the first routing rule (after DNS), so local traffic stays direct whatever the bypass lists hold
+LOOPBACK_RULE = _dumps({"type": "field", "outboundTag": "direct", "ip": ["127.0.0.1/32", "::1/128"]})
+
+def _by_content(cache, key, build, limit=TEMPLATE_CACHE_SIZE):
+    """build(key), cached by key (an object's compact JSON), so equal content shares one value."""
+    value = cache.get(key)
+    if value is None:
+        if len(cache) >= limit:
+            cache.clear()
+        value = cache[key] = build(key)
+    return value
+
+class OutboundTemplate:
+    """
+    A stored server's outbound, serialized once.
+    fragment() applies the per-config overlays (tag, profile sockopt, Mux) to a private copy
+    and caches the resulting JSON per combination.
+    """
+    __slots__ = ("json", "_fragments")
+
+    def __init__(self, outbound):
+        self.json = _dumps(outbound)
+        self._fragments = {}
+
+    @classmethod
+    def from_json(cls, outbound_json):
+        template = cls.__new__(cls)
+        template.json = outbound_json
+        template._fragments = {}
+        return template
+
+    def outbound(self):
+        """A fresh copy of the outbound, safe to modify."""
+        return json.loads(self.json)
+
+    def fragment(self, tag=None, profile=None, mux=None):
+        """Outbound JSON for a config; mux is the Mux settings dict to add, or None."""
+        key = (tag, profile, None if mux is None else tuple(mux.items()))
+        cached = self._fragments.get(key)
+        if cached is None:
+            cached = self._fragments[key] = self._build(tag, get_profile(profile), mux)
+        return cached
+
+    def _build(self, tag, tuning, mux):
+        outbound = self.outbound()
+        if tuning["sockopt"]:
+            stream = outbound.setdefault("streamSettings", {})
+            stream["sockopt"] = {**stream.get("sockopt", {}), **tuning["sockopt"]}
+        if tag:
+            outbound["tag"] = tag
+        if mux is not None and "mux" not in outbound:
+            outbound["mux"] = {"enabled": True, **mux}
+        return _dumps(outbound)
+
+_TEMPLATES = {}
+_BYPASS_RULES = {}
+# id(outbound) -> (outbound, its compact JSON). Holding the dict keeps its id from being reused.
+_OUTBOUND_KEYS = {}
+
+def _outbound_key(outbound):
+    entry = _OUTBOUND_KEYS.get(id(outbound))
+    if entry is not None and entry[0] is outbound:
+        return entry[1]
+    if len(_OUTBOUND_KEYS) >= TEMPLATE_CACHE_SIZE:
+        _OUTBOUND_KEYS.clear()
+    key = _dumps(outbound)
+    _OUTBOUND_KEYS[id(outbound)] = (outbound, key)
+    return key
+
+def outbound_template(outbound):
+    """
+    The cached OutboundTemplate of a stored outbound dict (templates are returned as is).
+    Templates are keyed by content, but each dict is dumped only once: a stored outbound
+    edited in place must be passed to forget_outbound() before its next config.
+    """
+    if isinstance(outbound, OutboundTemplate):
+        return outbound
+    return _by_content(_TEMPLATES, _outbound_key(outbound), OutboundTemplate.from_json)
+
+def forget_outbound(outbound):
+    """Drops the remembered JSON of an outbound dict (call after editing it in place, or deleting it)."""
+    _OUTBOUND_KEYS.pop(id(outbound), None)
+
+def _bypass_rules_json(bypass):
+    if not bypass:
+        return LOOPBACK_RULE
+    # A bypass is one small dict, so it is dumped on every call and may be edited in place
+    return _by_content(_BYPASS_RULES, _dumps(bypass),
+                       lambda b: ",".join([LOOPBACK_RULE, *map(_dumps, bypass_rules(json.loads(b)))]), limit=16)
+
+def clear_config_caches():
+    """Drops every cached template and fragment, so the next config is built from scratch."""
+    _TEMPLATES.clear()
+    _BYPASS_RULES.clear()
+    _OUTBOUND_KEYS.clear()
+    for cached in (_log_json, _dns_sections, _sniffing, _proxy_inbounds, _dns_inbound, _session_rule, _policy_json):
+        cached.cache_clear()
+
+@functools.lru_cache(maxsize=16)
+def _log_json(profile):
+    tuning = get_profile(profile)
+    log = {"loglevel": tuning["loglevel"]}
+    if not tuning["access_log"]:
+        log["access"] = "none"
+    return _dumps(log)
+
+@functools.lru_cache(maxsize=64)
+def _dns_sections(preset, domain_servers, cache):
+    """(dns JSON, preset domainStrategy, fakedns JSON or None); domain_servers as (address, domains) pairs."""
+    dns, strategy, fakedns_pool = build_dns(preset, dict(domain_servers), cache)
+    return _dumps(dns), strategy, _dumps(fakedns_pool) if fakedns_pool else None
+
+# Enough sniffing for domain routing rules; the core still connects to the requested address
+ROUTE_ONLY_SNIFFING = {"enabled": True, "destOverride": ["http", "tls"], "routeOnly": True}
+
+@functools.lru_cache(maxsize=16)
+def _sniffing(profile, fakedns, domain_rules=False):
+    sniffing = dict(get_profile(profile)["sniffing"])
+    if domain_rules and not sniffing["enabled"]:
+        sniffing = dict(ROUTE_ONLY_SNIFFING)
+    if fakedns:
+        # FakeDNS only works if sniffing maps the fake IPs back to domains
+        sniffing["enabled"] = True
+        sniffing["destOverride"] = list(dict.fromkeys(sniffing.get("destOverride", ["http", "tls"]) + ["fakedns"]))
+        sniffing.pop("routeOnly", None)
+    return sniffing
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _proxy_inbounds(socks_port, http_port, profile, fakedns, socks_tag="socks-in", http_tag="http-in",
+                    domain_rules=False):
+    """JSON of a SOCKS + HTTP inbound pair; a port of None leaves that inbound out."""
+    sniffing = _sniffing(profile, fakedns, domain_rules)
+    inbounds = []
+    if socks_port:
+        inbounds.append({
+            "port": socks_port,
+            "protocol": "socks",
+            "settings": {
+                "auth": "noauth",
+                "udp": True
             },
-            {
-                "port": http_port,
-                "protocol": "http",
-                "settings": {},
-                "sniffing": {
-                    "enabled": True,
-                    "destOverride": ["http", "tls"]
-                },
-                "tag": "http-in"
-            }
-        ],
-        "outbounds": [
-            outbound_config,
-            {
-                "protocol": "freedom",
-                "tag": "direct",
-                "settings": {}
-            }
-        ],
-        "dns": {
-            "servers": [
-                "1.1.1.1",
-                "8.8.8.8",
-                "localhost"
-            ]
-        },
-        "routing": {
-            "domainStrategy": "AsIs",
-            "rules": [
-                 {
-                    "type": "field",
-                    "outboundTag": "direct",
-                    "ip": ["127.0.0.1/32", "::1/128"]
-                }
-            ]
+            "sniffing": sniffing,
+            "tag": socks_tag
+        })
+    if http_port:
+        inbounds.append({
+            "port": http_port,
+            "protocol": "http",
+            "settings": {},
+            "sniffing": sniffing,
+            "tag": http_tag
+        })
+    return ",".join(map(_dumps, inbounds))
+
+@functools.lru_cache(maxsize=64)
+def _dns_inbound(port):
+    return _dumps({
+        "listen": "127.0.0.1",
+        "port": port,
+        "protocol": "dokodemo-door",
+        "settings": {"address": "1.1.1.1", "port": 53, "network": "udp"},
+        "tag": "dns-in"
+    })
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _session_rule(outbound_tag, inbound_tags):
+    # ruleTag lets the routing API remove the rule again
+    return _dumps({"type": "field", "ruleTag": outbound_tag, "inboundTag": list(inbound_tags), "outboundTag": outbound_tag})
+
+@functools.lru_cache(maxsize=16)
+def _policy_json(profile, stats):
+    tuning = get_profile(profile)
+    policy = {}
+    if tuning["policy"]:
+        policy["levels"] = {"0": dict(tuning["policy"])}
+    if stats:
+        policy["system"] = {
+            "statsInboundUplink": True,
+            "statsInboundDownlink": True,
+            "statsOutboundUplink": True,
+            "statsOutboundDownlink": True
         }
-    }
-    return json.dumps(config, indent=2)
+    return _dumps(policy)
+
+def _assemble(routes, route_by_tag, profile, stats_port, bypass, dns_preset, dns_domain_servers,
+              domain_strategy, dns_cache, dns_port, api_port=None):
+    """
+    Joins cached fragments into a config. routes are
+    (template, outbound_tag, mux, socks_port, http_port, socks_tag, http_tag) tuples;
+    with route_by_tag each route's inbounds get a rule to its outbound, otherwise the
+    first outbound is the default for everything.
+    """
+    tuning = get_profile(profile)
+    servers = tuple((address, (domains,) if isinstance(domains, str) else tuple(domains))
+                    for address, domains in (dns_domain_servers or {}).items())
+    dns, preset_strategy, fakedns = _dns_sections(dns_preset, servers, dns_cache)
+
+    domain_rules = bool(bypass and bypass["domain"])
+    inbounds, outbounds, session_rules = [], [], []
+    for template, tag, mux, socks_port, http_port, socks_tag, http_tag in routes:
+        inbounds.append(_proxy_inbounds(socks_port, http_port, profile, fakedns is not None, socks_tag, http_tag,
+                                        domain_rules))
+        outbounds.append(template.fragment(tag, profile, mux))
+        if route_by_tag:
+            tags = tuple(t for port, t in ((socks_port, socks_tag), (http_port, http_tag)) if port)
+            session_rules.append(_session_rule(tag, tags))
+    outbounds.append(DIRECT_OUTBOUND)
+    rules = [_bypass_rules_json(bypass)] + session_rules
+    if dns_port:
+        inbounds.append(_dns_inbound(dns_port))
+        outbounds.append(DNS_OUTBOUND)
+        rules.insert(0, DNS_RULE)
+
+    parts = [
+        '{"log":', _log_json(profile),
+        ',"inbounds":[', ",".join(filter(None, inbounds)),
+        '],"outbounds":[', ",".join(outbounds),
+        '],"dns":', dns,
+        ',"routing":{"domainStrategy":', _dumps(domain_strategy or preset_strategy),
+        ',"rules":[', ",".join(filter(None, rules)), ']}',
+    ]
+    if fakedns:
+        parts += [',"fakedns":', fakedns]
+    if tuning["policy"]:
+        parts += [',"policy":', _policy_json(profile, bool(stats_port))]
+    if stats_port:
+        parts += [',"stats":{},"metrics":', _dumps({"tag": "metrics", "listen": f"127.0.0.1:{stats_port}"})]
+        if not tuning["policy"]:
+            parts += [',"policy":', _policy_json(profile, True)]
+    if api_port:
+        parts += [',"api":', _dumps({"tag": "api", "listen": f"127.0.0.1:{api_port}", "services": API_SERVICES})]
+    parts.append("}")
+    return "".join(parts)
+
+@timed("babyvpn_config_generate_seconds")
+def generate_xray_config(outbound_config, socks_port=10808, http_port=10809, enable_mux=False, profile=None,
+                         mux_settings=None, stats_port=None, bypass=None, dns_preset=None,
+                         dns_domain_servers=None, domain_strategy=None, dns_cache=True, dns_port=None):
+    """
+    Generates the full config.json content for Xray. outbound_config is not modified.
+    mux_settings (e.g. a tuned {"concurrency": 4, "xudpConcurrency": -1}) overrides the profile's mux.
+    stats_port enables the traffic counters, served as JSON on 127.0.0.1:<stats_port>/debug/vars.
+    bypass is a routing.compile_bypass() result to send direct; loopback always is.
+    dns_preset / dns_domain_servers pick the resolvers (see dns_config); domain_strategy
+    overrides the preset's routing domainStrategy; dns_cache=False turns off the query cache.
+    dns_port opens a UDP DNS listener on 127.0.0.1 answered by the core's DNS, used to time lookups.
+    """
+    if not outbound_config:
+        return None
+
+    mux = (mux_settings or get_profile(profile)["mux"]) if enable_mux else None
+    # Outbound counters are keyed by tag
+    route = (outbound_template(outbound_config), PROXY_TAG if stats_port else None, mux,
+             socks_port, http_port, "socks-in", "http-in")
+    return _assemble([route], False, profile, stats_port, bypass, dns_preset, dns_domain_servers,
+                     domain_strategy, dns_cache, dns_port)
+
+@timed("babyvpn_config_assemble_seconds")
+def generate_multi_config(sessions, profile=None, stats_port=None, bypass=None, dns_preset=None,
+                          dns_domain_servers=None, domain_strategy=None, dns_cache=True, dns_port=None,
+                          api_port=None):
+    """
+    One config serving several servers side by side. Each session is a dict with a unique
+    "tag", its "outbound" (stored outbound or OutboundTemplate), "socks_port" / "http_port"
+    (either may be None) and optionally "mux" (True for the profile's, or a settings dict).
+    The session's inbounds are tagged "<tag>-socks" / "<tag>-http" and routed to the outbound
+    tagged <tag> by a rule with ruleTag <tag>; bypass rules still apply first.
+    api_port serves the core's handler/routing API on 127.0.0.1 (see XrayRunner.api).
+    Other options are as for generate_xray_config.
+    """
+    mux_default = get_profile(profile)["mux"]
+    routes = []
+    for session in sessions:
+        tag, mux = session["tag"], session.get("mux")
+        routes.append((
+            outbound_template(session["outbound"]), tag,
+            mux_default if mux is True else (mux or None),
+            session.get("socks_port"), session.get("http_port"), f"{tag}-socks", f"{tag}-http"
+        ))
+    return _assemble(routes, True, profile, stats_port, bypass, dns_preset, dns_domain_servers,
+                     domain_strategy, dns_cache, dns_port, api_port)
@@ -0,0 +1,160 @@
+import base64
+import copy
+import json
+import time
+import urllib.parse
+from utils import generate_xray_config
+from xray_runner import XrayRunner
+from pinger import PING_URL, CORE_STARTUP_DELAY
+from mux_tuner import run_workload, THROUGHPUT_URL, PARALLEL_REQUESTS
+
+# --- Transport Variant A/B ---
+
+# Dedicated ports; two pairs used alternately so a variant never waits on the previous core's ports
+VARIANT_BASE_PORT = 20720
+
+# Transports a CDN-fronted host commonly serves side by side on the same path
+CDN_NETWORKS = ("ws", "xhttp", "httpupgrade")
+XHTTP_MODES = ("auto", "packet-up", "stream-up", "stream-one")
+# ws and httpupgrade are HTTP/1.1 upgrades; xhttp can also run over h2
+XHTTP_ALPNS = (["h2"], ["http/1.1"])
+
+def transport_endpoint(outbound):
+    """(path, host) of a ws/xhttp/httpupgrade outbound."""
+    stream = outbound.get("streamSettings", {})
+    network = stream.get("network")
+    if network == "ws":
+        ws = stream.get("wsSettings", {})
+        return ws.get("path", "/"), ws.get("headers", {}).get("Host", "")
+    settings = stream.get(f"{network}Settings", {})
+    return settings.get("path", "/"), settings.get("host", "")
+
+def describe_variant(variant):
+    """Short label, e.g. "xhttp packet-up h2"."""
+    parts = [variant["network"]]
+    if variant.get("mode"):
+        parts.append(variant["mode"])
+    if variant.get("alpn"):
+        parts.append(",".join(variant["alpn"]))
+    return " ".join(parts)
+
+def current_variant(outbound):
+    stream = outbound.get("streamSettings", {})
+    network = stream.get("network")
+    return {
+        "network": network,
+        "mode": stream.get("xhttpSettings", {}).get("mode") if network == "xhttp" else None,
+        "alpn": stream.get("tlsSettings", {}).get("alpn") if stream.get("security") == "tls" else None,
+    }
+
+def is_current(variant, own):
+    """Same transport as the server's own; an unset ALPN on the server matches any ALPN."""
+    if variant["network"] != own["network"]:
+        return False
+    if variant["network"] == "xhttp" and (variant.get("mode") or "auto") != (own.get("mode") or "auto"):
+        return False
+    return not own.get("alpn") or own["alpn"] == variant.get("alpn")
+
+def generate_variants(outbound):
+    """
+    Every transport/mode/ALPN combination worth trying for this server, or [] if its
+    transport isn't one a CDN would serve alongside others. The server's own variant is included.
+    """
+    stream = outbound.get("streamSettings", {})
+    if stream.get("network") not in CDN_NETWORKS:
+        return []
+    tls = stream.get("security") == "tls"
+    # The vmess link format has no xhttp mode, so only "auto" can be saved for it
+    modes = XHTTP_MODES if outbound.get("protocol") != "vmess" else ("auto",)
+
+    variants = [
+        {"network": "ws", "mode": None, "alpn": ["http/1.1"] if tls else None},
+        {"network": "httpupgrade", "mode": None, "alpn": ["http/1.1"] if tls else None},
+    ]
+    for mode in modes:
+        for alpn in (XHTTP_ALPNS if tls else (None,)):
+            variants.append({"network": "xhttp", "mode": mode, "alpn": alpn})
+    return variants
+
+def apply_variant(outbound, variant):
+    """Returns a copy of the outbound switched to the variant's transport, keeping path and host."""
+    path, host = transport_endpoint(outbound)
+    result = copy.deepcopy(outbound)
+    stream = result.setdefault("streamSettings", {})
+    for key in ("wsSettings", "xhttpSettings", "httpupgradeSettings"):
+        stream.pop(key, None)
+
+    network = variant["network"]
+    stream["network"] = network
+    if network == "ws":
+        stream["wsSettings"] = {"path": path, "headers": {"Host": host}}
+    elif network == "xhttp":
+        stream["xhttpSettings"] = {"mode": variant.get("mode") or "auto", "path": path, "host": host}
+    else:
+        stream["httpupgradeSettings"] = {"path": path, "host": host}
+
+    if stream.get("security") == "tls":
+        tls = stream.setdefault("tlsSettings", {})
+        if variant.get("alpn"):
+            tls["alpn"] = list(variant["alpn"])
+        else:
+            tls.pop("alpn", None)
+    return result
+
+def variant_link(link, variant):
+    """Rewrites a share link's transport fields to the variant, or None if it can't be expressed."""
+    if not link:
+        return None
+    alpn = ",".join(variant["alpn"]) if variant.get("alpn") else None
+    if link.startswith("vmess://"):
+        b64 = link[8:] + "=" * ((4 - len(link[8:]) % 4) % 4)
+        data = json.loads(base64.b64decode(b64).decode("utf-8"))
+        data["net"] = variant["network"]
+        if alpn: data["alpn"] = alpn
+        else: data.pop("alpn", None)
+        return "vmess://" + base64.b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+
+    parsed = urllib.parse.urlsplit(link)
+    params = urllib.parse.parse_qs(parsed.query)
+    params["type"] = [variant["network"]]
+    for key, value in (("mode", variant.get("mode")), ("alpn", alpn)):
+        if value: params[key] = [value]
+        else: params.pop(key, None)
+    return urllib.parse.urlunsplit(parsed._replace(query=urllib.parse.urlencode(params, doseq=True)))
+
+def variant_sort_key(result):
+    """Error-free first, then highest throughput, then lowest latency."""
+    failed = result["errors"] > 0 or result["latency_ms"] is None
+    return (failed, -result["throughput_kbps"], result["latency_ms"] or 0)
+
+def benchmark_variants(outbound, variants=None, latency_url=PING_URL, throughput_url=THROUGHPUT_URL,
+                       parallel=PARALLEL_REQUESTS, profile=None, xray_path=None,
+                       startup_delay=CORE_STARTUP_DELAY, progress_cb=None):
+    """
+    Runs the Mux tuner's workload through each transport variant, one at a time.
+    Returns results best first: [{"variant", "outbound", "latency_ms", "throughput_kbps",
+    "errors", "current"}], with "current" marking the server's own variant.
+    """
+    variants = generate_variants(outbound) if variants is None else variants
+    own = current_variant(outbound)
+    results = []
+    for i, variant in enumerate(variants):
+        socks_pt = VARIANT_BASE_PORT + (i % 2) * 2
+        candidate = apply_variant(outbound, variant)
+        runner = XrayRunner(config_filename="variant_config.json", log_filename=None, xray_path=xray_path)
+        config_json = generate_xray_config(candidate, socks_port=socks_pt, http_port=socks_pt + 1, profile=profile)
+        try:
+            if runner.start(config_json):
+                time.sleep(startup_delay)
+                stats = run_workload(socks_pt + 1, latency_url, throughput_url, parallel)
+            else:
+                stats = {"latency_ms": None, "throughput_kbps": 0, "errors": parallel}
+        finally:
+            runner.stop()
+
+        result = {"variant": variant, "outbound": candidate, "current": is_current(variant, own), **stats}
+        results.append(result)
+        if progress_cb:
+            progress_cb(result)
+
+    return sorted(results, key=variant_sort_key)
@@ -3,8 +3,189 @@ import psutil
 import os
 import time
 import sys
+import json
+import tempfile
+import threading
+from metrics import timed, set_gauge
+
+XRAY_EXECUTABLE = "xray.exe" if os.name == "nt" else "xray"
+
+# Fallback location for generated configs when the core can't read them from stdin
+RUNTIME_DIR = os.path.join(tempfile.gettempdir(), "babyvpn")
+
+# --- Teardown & Orphan Reaping ---
+TERMINATE_TIMEOUT = 3         # Seconds to wait after terminate() before kill()
+KILL_TIMEOUT = 2
+REGISTRY_FLUSH_DELAY = 0.5    # Coalesces registry writes during a Ping All
+
+def stop_process(proc, timeout=TERMINATE_TIMEOUT):
+    """Graceful terminate -> bounded wait -> kill. Works on Popen and psutil.Process."""
+    try:
+        proc.terminate()
+        try:
+            proc.wait(timeout=timeout)
+        except (subprocess.TimeoutExpired, psutil.TimeoutExpired):
+            proc.kill()
+            proc.wait(timeout=KILL_TIMEOUT)
+    except (OSError, psutil.Error, subprocess.TimeoutExpired) as e:
+        print(f"Failed to stop process {proc.pid}: {e}")
+
+class CoreRegistry:
+    """
+    On-disk record of every core this session spawned (cores-<pid>.json in RUNTIME_DIR),
+    so a later session can find and reap them if this one dies without cleaning up.
+    """
+    def __init__(self, directory=RUNTIME_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, f"cores-{os.getpid()}.json")
+        self.cores = {}
+        self._lock = threading.Lock()
+        self._flush_timer = None
+        try:
+            self.owner_created = psutil.Process().create_time()
+        except psutil.Error:
+            self.owner_created = 0
+
+    def add(self, pid, args):
+        try:
+            proc = psutil.Process(pid)
+            entry = {"pid": pid, "created": proc.create_time(), "exe": proc.exe(), "args": args}
+        except psutil.Error:
+            return
+        with self._lock:
+            self.cores[pid] = entry
+        self._schedule_flush()
+
+    def remove(self, pid):
+        with self._lock:
+            self.cores.pop(pid, None)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(REGISTRY_FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush_timer = None
+            data = {"owner": os.getpid(), "owner_created": self.owner_created, "cores": list(self.cores.values())}
+        try:
+            if not data["cores"]:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Failed to write core registry: {e}")
+
+CORE_REGISTRY = CoreRegistry()
+
+def _owner_alive(pid, created):
+    try:
+        return abs(psutil.Process(pid).create_time() - created) < 1
+    except psutil.Error:
+        return False
+
+def _same_path(a, b):
+    return bool(a and b) and os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+def _is_babyvpn(proc, app_dir):
+    """
+    Whether proc is a BabyVPN instance: this process, the frozen exe installed beside the core,
+    or a Python interpreter running one of the app's scripts.
+    """
+    if proc.pid == os.getpid():
+        return True
+    if _same_path(os.path.dirname(proc.exe()), app_dir):
+        return True
+    cwd = proc.cwd()
+    return any(arg.endswith(".py") and _same_path(os.path.dirname(os.path.join(cwd, arg)), app_dir)
+               for arg in proc.cmdline()[1:])
+
+def _parent_gone(ppid, app_dir):
+    """True once a core's parent has exited or it was re-parented to something that isn't BabyVPN."""
+    if ppid in (0, 1):
+        return True
+    try:
+        return not _is_babyvpn(psutil.Process(ppid), app_dir)
+    except psutil.NoSuchProcess:
+        return True
+    except psutil.Error:
+        return False  # Can't inspect the parent (e.g. another user's process); leave the core alone
+
+def reap_orphans(xray_path=None, directory=RUNTIME_DIR):
+    """
+    Stops cores left behind by sessions that are no longer running. Returns the reaped PIDs.
+
+    1. Registry files whose owner is gone: each recorded core is stopped if its PID still
+       belongs to the same executable (matched by create time and exe path).
+    2. Without a registry entry (e.g. killed before the flush): any process running
+       xray_path with a BabyVPN-style -c argument whose parent has exited, or whose
+       parent is no longer BabyVPN (a core re-parented to init or `systemd --user`).
+    """
+    reaped = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not (name.startswith("cores-") and name.endswith(".json")):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("owner") == os.getpid() or _owner_alive(data.get("owner", 0), data.get("owner_created", 0)):
+                continue
+            for entry in data.get("cores", []):
+                try:
+                    proc = psutil.Process(entry["pid"])
+                    if abs(proc.create_time() - entry["created"]) < 1 and _same_path(proc.exe(), entry["exe"]):
+                        stop_process(proc)
+                        reaped.append(entry["pid"])
+                except (psutil.Error, KeyError):
+                    pass
+            try: os.remove(path)
+            except OSError: pass
+
+    if xray_path:
+        for proc in psutil.process_iter(["pid", "ppid", "exe", "cmdline"]):
+            try:
+                info = proc.info
+                if proc.pid in reaped or not _same_path(info["exe"], xray_path):
+                    continue
+                cmdline = info["cmdline"] or []
+                if "-c" not in cmdline:
+                    continue
+                config_arg = cmdline[cmdline.index("-c") + 1] if cmdline.index("-c") + 1 < len(cmdline) else ""
+                ours = config_arg == "stdin:" or config_arg.startswith(RUNTIME_DIR) or \
+                    _same_path(os.path.dirname(config_arg), os.path.dirname(xray_path))
+                if ours and _parent_gone(info["ppid"], os.path.dirname(xray_path)):
+                    stop_process(proc)
+                    reaped.append(proc.pid)
+            except (psutil.Error, ValueError):
+                pass
+    return reaped
+
+# --- Supervision ---
+SUPERVISE_INTERVAL = 2        # Seconds between liveness checks / resource samples
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 60
+STABLE_RUN = 60               # A core that stays up this long resets the backoff
+MEMORY_WARMUP = 120           # Seconds before the RSS baseline is taken
+MEMORY_GROWTH_FACTOR = 1.5    # Flag when RSS exceeds the baseline by this factor...
+MEMORY_GROWTH_MIN = 50 * 1024 * 1024  # ...and by at least this many bytes
+API_TIMEOUT = 5               # Seconds allowed for one `xray api` call
+
 class XrayRunner:
-    def __init__(self, config_filename="config.json", log_filename="xray_log.txt"):
+    def __init__(self, config_filename="config.json", log_filename="xray_log.txt", xray_path=None, use_stdin=True):
         # Determine path to xray.exe and config.json
         if getattr(sys, 'frozen', False):
             # Running as compiled exe
@@ -12,55 +193,244 @@ class XrayRunner:
         else:
             # Running as script
             base_path = os.path.dirname(os.path.abspath(__file__))
-            
-        self.xray_path = os.path.join(base_path, "xray.exe")
+
+        # An explicit xray_path overrides the bundled core (used by the benchmark stub)
+        self.xray_path = xray_path or os.path.join(base_path, XRAY_EXECUTABLE)
         self.config_path = os.path.join(base_path, config_filename)
-        self.log_filename = log_filename
+        self.config_filename = config_filename
+        self.log_filename = log_filename  # None discards the core's output
+        self.use_stdin = use_stdin
+        self.temp_config = None
+        self.log_file = None
         self.process = None
+        self._last_config = None
+        self._lock = threading.RLock()
+
+        # Supervisor state
+        self.stats = {}
+        self.restarts = 0
+        self._watch_stop = threading.Event()
+        self._watcher = None
+
+    @timed("babyvpn_xray_start_seconds")
+    def start(self, config_json=None):
+        """
+        Starts the xray process.
+        With config_json the config is piped through stdin (or a temp file as a fallback),
+        otherwise the core reads config_path from disk.
+        """
+        with self._lock:
+            return self._start(config_json)
 
-    def start(self):
-        """Starts the xray process."""
+    def _start(self, config_json):
         if self.is_running():
             print("Xray is already running.")
             return
 
+        self._last_config = config_json
         if not os.path.exists(self.xray_path):
             raise FileNotFoundError(f"Xray executable not found at: {self.xray_path}")
 
         try:
-            # Hide the console window
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            
+            # Hide the console window (Windows only)
+            startupinfo = None
+            if os.name == "nt":
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+            via_stdin = config_json is not None and self.use_stdin
+            if config_json is None:
+                config_arg = self.config_path
+            elif via_stdin:
+                config_arg = "stdin:"
+            else:
+                config_arg = self.temp_config = self._write_temp_config(config_json)
+
             # Redirect stdout/stderr to a file for debugging
-            self.log_file = open(self.log_filename, "w")
+            self.log_file = open(self.log_filename, "w") if self.log_filename else None
+            output = self.log_file or subprocess.DEVNULL
             self.process = subprocess.Popen(
-                [self.xray_path, "-c", self.config_path],
+                [self.xray_path, "-c", config_arg],
                 startupinfo=startupinfo,
-                stdout=self.log_file,
-                stderr=self.log_file
+                stdin=subprocess.PIPE if via_stdin else None,
+                stdout=output,
+                stderr=output
             )
-            print(f"Xray started with PID: {self.process.pid} (Config: {self.config_path})")
+
+            if via_stdin:
+                try:
+                    self.process.stdin.write(config_json.encode("utf-8"))
+                    self.process.stdin.close()
+                except OSError as e:
+                    # Core exited before reading stdin; retry once from a temp file
+                    print(f"Xray rejected config on stdin ({e}), falling back to a temp file.")
+                    self._terminate()
+                    self.use_stdin = False
+                    return self._start(config_json)
+
+            CORE_REGISTRY.add(self.process.pid, [self.xray_path, "-c", config_arg])
+            print(f"Xray started with PID: {self.process.pid} (Config: {config_arg})")
             return True
         except Exception as e:
             print(f"Failed to start Xray: {e}")
             return False
 
+    def update_config(self, config_json):
+        """Config for the next restart, once the running core was changed through its API."""
+        with self._lock:
+            self._last_config = config_json
+
+    def api(self, server, command, *args, timeout=API_TIMEOUT):
+        """
+        Runs `xray api <command> --server=<server> <args>` (adi, ado, rmi, rmo, adrules, rmrules...)
+        against a running core. Returns (ok, output).
+        """
+        startupinfo = None
+        if os.name == "nt":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        try:
+            result = subprocess.run(
+                [self.xray_path, "api", command, f"--server={server}", *args],
+                startupinfo=startupinfo, capture_output=True, text=True, timeout=timeout
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return False, str(e)
+        return result.returncode == 0, (result.stdout + result.stderr).strip()
+
+    def _write_temp_config(self, config_json):
+        os.makedirs(RUNTIME_DIR, exist_ok=True)
+        prefix = os.path.splitext(self.config_filename)[0] + "_"
+        fd, path = tempfile.mkstemp(prefix=prefix, suffix=".json", dir=RUNTIME_DIR)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(config_json)
+        return path
+
+    @timed("babyvpn_xray_stop_seconds")
     def stop(self):
-        """Stops the xray process."""
+        """Stops the xray process (and its supervisor, if any)."""
+        self._watch_stop.set()
+        with self._lock:
+            self._terminate()
+
+    def _terminate(self):
         if self.process:
-            self.process.terminate()
-            self.process = None
+            proc, self.process = self.process, None
+            stop_process(proc)  # Reaps the child so no zombie/handle is left behind
+            CORE_REGISTRY.remove(proc.pid)
             print("Xray stopped.")
-        
-        if hasattr(self, 'log_file') and self.log_file:
+
+        if self.log_file:
             self.log_file.close()
             self.log_file = None
-        
+
+        if self.temp_config:
+            try: os.remove(self.temp_config)
+            except OSError: pass
+            self.temp_config = None
+
         # We don't indiscriminately kill ALL xray.exe anymore,
         # because we might be running multiple instances (Main + Ping).
         # We only terminate the process we started.
 
+    def supervise(self, on_event=None, name="main", interval=SUPERVISE_INTERVAL):
+        """
+        Watches the running core until stop(): restarts it with exponential backoff if it
+        exits on its own, and samples RSS/CPU/handles into self.stats and the metrics registry.
+        on_event(kind, info) is called from the watcher thread with kind in
+        "sample", "crashed", "restarted", "restart_failed", "memory_growth".
+        """
+        if self._watcher and self._watcher.is_alive() and not self._watch_stop.is_set():
+            return
+        # Each watcher gets its own stop event: one that stop() just signalled may still be
+        # winding down, and must neither block this one nor be revived by it
+        self._watch_stop = threading.Event()
+        self.stats = {}
+        self.restarts = 0  # Counts are per supervised run, not per runner lifetime
+        set_gauge("babyvpn_xray_restarts", 0, core=name)
+        self._watcher = threading.Thread(
+            target=self._supervise_loop,
+            args=(on_event or (lambda kind, info: None), name, interval, self._watch_stop), daemon=True
+        )
+        self._watcher.start()
+
+    def _supervise_loop(self, on_event, name, interval, stop):
+        backoff = RESTART_BACKOFF_MIN
+        started_at = time.monotonic()
+        baseline_rss = None
+        ps_proc = None
+
+        while not stop.wait(interval):
+            proc = self.process
+            if proc is not None and proc.poll() is None:
+                uptime = time.monotonic() - started_at
+                if uptime > STABLE_RUN:
+                    backoff = RESTART_BACKOFF_MIN
+
+                try:
+                    if ps_proc is None or ps_proc.pid != proc.pid:
+                        ps_proc = psutil.Process(proc.pid)
+                        ps_proc.cpu_percent(interval=None)  # Prime; first reading is always 0
+                    stats = self._sample(ps_proc, uptime)
+                except psutil.Error:
+                    continue
+                self.stats = stats
+                set_gauge("babyvpn_xray_rss_bytes", stats["rss"], core=name)
+                set_gauge("babyvpn_xray_cpu_percent", stats["cpu_percent"], core=name)
+                set_gauge("babyvpn_xray_handles", stats["handles"], core=name)
+                on_event("sample", stats)
+
+                # Leak detection: compare against a post-warmup baseline, re-arm after each alert
+                if uptime > MEMORY_WARMUP:
+                    if baseline_rss is None:
+                        baseline_rss = stats["rss"]
+                    elif (stats["rss"] > baseline_rss * MEMORY_GROWTH_FACTOR
+                          and stats["rss"] - baseline_rss > MEMORY_GROWTH_MIN):
+                        on_event("memory_growth", {"baseline": baseline_rss, **stats})
+                        baseline_rss = stats["rss"]
+                continue
+
+            # The core died without stop() being called
+            if stop.is_set():
+                return
+            code = proc.returncode if proc is not None else None
+            self.restarts += 1
+            set_gauge("babyvpn_xray_restarts", self.restarts, core=name)
+            on_event("crashed", {"code": code, "retry_in": backoff, "restarts": self.restarts})
+            if stop.wait(backoff):
+                return
+
+            error = None
+            with self._lock:
+                if stop.is_set():
+                    return
+                try:
+                    self._terminate()
+                    ok = self._start(self._last_config)
+                except Exception as e:  # e.g. the binary was removed; keep the watcher alive and retry
+                    ok, error = False, str(e)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+            if ok:
+                on_event("restarted", {"restarts": self.restarts})
+            else:
+                on_event("restart_failed", {"restarts": self.restarts, "error": error, "retry_in": backoff})
+            started_at = time.monotonic()
+            baseline_rss = None
+
+    def _sample(self, ps_proc, uptime):
+        with ps_proc.oneshot():
+            rss = ps_proc.memory_info().rss
+            cpu = ps_proc.cpu_percent(interval=None)
+            handles = ps_proc.num_handles() if os.name == "nt" else ps_proc.num_fds()
+        return {
+            "pid": ps_proc.pid,
+            "rss": rss,
+            "cpu_percent": cpu,
+            "handles": handles,
+            "uptime": int(uptime),
+            "restarts": self.restarts,
+        }
+
     def is_running(self):
         """Checks if the process is running."""
         if self.process is None: